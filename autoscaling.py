@@ -0,0 +1,110 @@
+import logging
+import clients
+import config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SCALABLE_DIMENSION = 'ecs:service:DesiredCount'
+SCALE_OUT_COOLDOWN = 60
+SCALE_IN_COOLDOWN = 300
+# Scheduled actions created here are named '<service>-<name>', so others are left alone
+SCHEDULE_PREFIX = 'schedule'
+
+
+def resource_id(cluster, service):
+    return f'service/{cluster}/{service}'
+
+
+def request_count_label(target_group_arn, alb_arn=None):
+    """Resource label of ALBRequestCountPerTarget: app/<alb>/<id>/targetgroup/<tg>/<id>."""
+    alb_arn = alb_arn or config.alb_arn
+    return f"{alb_arn.split('loadbalancer/', 1)[1]}/{target_group_arn.rsplit(':', 1)[-1]}"
+
+
+def _target_tracking(metric_type, target_value, resource_label=None):
+    metric = {'PredefinedMetricType': metric_type}
+    if resource_label:
+        metric['ResourceLabel'] = resource_label
+    return {
+        'TargetValue': float(target_value),
+        'PredefinedMetricSpecification': metric,
+        'ScaleOutCooldown': SCALE_OUT_COOLDOWN,
+        'ScaleInCooldown': SCALE_IN_COOLDOWN
+    }
+
+
+def configure_service_scaling(cluster, service, target_group_arn, min_capacity=None, max_capacity=None,
+                              cpu_target=None, requests_per_target=None, schedules=None):
+    """Register an ECS service with Application Auto Scaling and attach its policies.
+
+    Two target tracking policies are attached, one on the service's average CPU
+    and one on the ALB request count per target. Scheduled actions change the
+    capacity range at given times, e.g. for business hours. Calling it again
+    updates everything in place. Defaults come from `config.py`.
+
+    Args:
+        cluster (str): The name of the ECS cluster.
+        service (str): The name of the ECS service.
+        target_group_arn (str): The target group of the service, for the request count policy.
+        schedules (list): Dicts with 'name', 'schedule' (an at(), rate() or cron() expression),
+            'min' and 'max' keys.
+    """
+    scaling_client = clients.get_client('application-autoscaling')
+    min_capacity = config.scaling_min_capacity if min_capacity is None else min_capacity
+    max_capacity = config.scaling_max_capacity if max_capacity is None else max_capacity
+    cpu_target = cpu_target or config.scaling_cpu_target
+    requests_per_target = requests_per_target or config.scaling_requests_per_target
+    schedules = config.scaling_schedules if schedules is None else schedules
+    target = {'ServiceNamespace': 'ecs', 'ResourceId': resource_id(cluster, service),
+              'ScalableDimension': SCALABLE_DIMENSION}
+
+    scaling_client.register_scalable_target(MinCapacity=min_capacity, MaxCapacity=max_capacity, **target)
+    scaling_client.put_scaling_policy(
+        PolicyName=f'{service}-cpu', PolicyType='TargetTrackingScaling',
+        TargetTrackingScalingPolicyConfiguration=_target_tracking('ECSServiceAverageCPUUtilization', cpu_target),
+        **target
+    )
+    scaling_client.put_scaling_policy(
+        PolicyName=f'{service}-requests', PolicyType='TargetTrackingScaling',
+        TargetTrackingScalingPolicyConfiguration=_target_tracking(
+            'ALBRequestCountPerTarget', requests_per_target, request_count_label(target_group_arn)),
+        **target
+    )
+
+    wanted = set()
+    for schedule in schedules:
+        name = f"{service}-{SCHEDULE_PREFIX}-{schedule['name']}"
+        wanted.add(name)
+        scaling_client.put_scheduled_action(
+            ScheduledActionName=name, Schedule=schedule['schedule'], Timezone=schedule.get('timezone', 'UTC'),
+            ScalableTargetAction={'MinCapacity': schedule['min'], 'MaxCapacity': schedule['max']},
+            **target
+        )
+    paginator = scaling_client.get_paginator('describe_scheduled_actions')
+    for page in paginator.paginate(ServiceNamespace='ecs', ResourceId=target['ResourceId'],
+                                   ScalableDimension=SCALABLE_DIMENSION):
+        for action in page['ScheduledActions']:
+            name = action['ScheduledActionName']
+            if name.startswith(f'{service}-{SCHEDULE_PREFIX}-') and name not in wanted:
+                scaling_client.delete_scheduled_action(ScheduledActionName=name, **target)
+                logger.info(f"Scheduled action '{name}' removed.")
+
+    logger.info(f"Auto scaling of '{service}' set to {min_capacity}-{max_capacity} tasks "
+                f"(CPU {cpu_target}%, {requests_per_target} requests per target, {len(schedules)} schedule(s)).")
+
+
+def remove_service_scaling(cluster, service):
+    """Deregister a service from Application Auto Scaling, which also deletes its policies and schedules.
+
+    Returns:
+        bool: False when the service was not registered.
+    """
+    scaling_client = clients.get_client('application-autoscaling')
+    try:
+        scaling_client.deregister_scalable_target(ServiceNamespace='ecs', ResourceId=resource_id(cluster, service),
+                                                  ScalableDimension=SCALABLE_DIMENSION)
+    except scaling_client.exceptions.ObjectNotFoundException:
+        return False
+    logger.info(f"Auto scaling of '{service}' removed.")
+    return True
@@ -0,0 +1,54 @@
+"""Measure how long each entry point takes to import.
+
+Each module is imported in a fresh interpreter, several times, and the median
+import time is reported. Importing an entry point runs everything a command
+pays for before doing any work: module imports, configuration and client setup.
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ['main', 'fleet', 'rollback', 'update_service', 'state_store', 'start']
+
+SNIPPET = """
+import time
+_started = time.perf_counter()
+import {module}
+print(time.perf_counter() - _started)
+"""
+
+
+def measure(module, runs):
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', SNIPPET.format(module=module)], cwd=REPO_DIR,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup time of each entry point.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS)
+    args = parser.parse_args()
+
+    print(f"{'MODULE':<16} {'MEDIAN':>10} {'MIN':>10} {'MAX':>10}")
+    for module in args.modules:
+        timings, error = measure(module, args.runs)
+        if timings is None:
+            print(f"{module:<16} failed: {error}")
+            continue
+        print(f"{module:<16} {statistics.median(timings) * 1000:>8.1f}ms {min(timings) * 1000:>8.1f}ms "
+              f"{max(timings) * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Local stand-ins used by the workflow benchmarks.
+
+AWS calls are answered by moto. `FaultInjector` adds per-call latency and
+throttling on top of it, and makes service rollouts and drains complete on the
+first poll. `CloudflareStub` is a small in-memory Cloudflare DNS API.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _RawBody:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class FaultInjector:
+    """botocore handlers adding latency and throttling to every AWS call attempt.
+
+    Throttled attempts get the service's own throttling error, so the client's
+    retry handler backs off and retries them as it would against AWS.
+
+    Args:
+        latency (float): Added to every attempt, in seconds.
+        jitter (float): Up to this many seconds are added at random on top of latency.
+        throttle_rate (float): Fraction of attempts answered with a throttling error.
+        seed (int): Seed of the random generator, so runs see the same faults.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, throttle_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.enabled = False
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            return self._random.uniform(0, self.jitter), self._random.random() < self.throttle_rate
+
+    def _throttle_response(self, request, protocol):
+        from botocore.awsrequest import AWSResponse
+        request_id = str(uuid.uuid4())
+        if protocol == 'query':
+            body = (f'<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>'
+                    f'<Message>Rate exceeded</Message></Error><RequestId>{request_id}</RequestId></ErrorResponse>')
+            headers = {'Content-Type': 'text/xml', 'x-amzn-RequestId': request_id}
+        else:
+            body = json.dumps({'__type': 'ThrottlingException', 'message': 'Rate exceeded'})
+            headers = {'Content-Type': 'application/x-amz-json-1.1', 'x-amzn-RequestId': request_id}
+        return AWSResponse(request.url, 400, headers, _RawBody(body.encode()))
+
+    def instrument_client(self, client):
+        """Client hook, see `clients.add_client_hook`."""
+        protocol = client.meta.service_model.protocol
+        events = client.meta.events
+
+        def before_send(request, **kwargs):
+            if not self.enabled:
+                return None
+            extra, throttled = self._draw()
+            if self.latency or extra:
+                time.sleep(self.latency + extra)
+            if throttled:
+                return self._throttle_response(request, protocol)
+            return None
+
+        def complete_rollouts(parsed, **kwargs):
+            # moto never finishes a rollout or a drain on its own
+            for service in parsed.get('services', []):
+                if service.get('status') == 'DRAINING':
+                    service['status'] = 'INACTIVE'
+                for deployment in service.get('deployments', []):
+                    if deployment.get('status') == 'PRIMARY':
+                        deployment['rolloutState'] = 'COMPLETED'
+
+        def report_healthy_targets(parsed, **kwargs):
+            # moto does not register the tasks of a service with its target group
+            if not parsed.get('TargetHealthDescriptions'):
+                parsed['TargetHealthDescriptions'] = [{'Target': {'Id': '10.0.0.1', 'Port': 443},
+                                                       'TargetHealth': {'State': 'healthy'}}]
+
+        # Ahead of moto's own before-send handler, which answers the call
+        events.register_first('before-send', before_send, unique_id='benchmark-before-send')
+        if client.meta.service_model.service_name == 'ecs':
+            events.register('after-call.ecs.DescribeServices', complete_rollouts,
+                            unique_id='benchmark-complete-rollouts')
+        if client.meta.service_model.service_name == 'elbv2':
+            events.register('after-call.elastic-load-balancing-v2.DescribeTargetHealth', report_healthy_targets,
+                            unique_id='benchmark-healthy-targets')
+
+
+def publish_stub_image(ecr, repo_name, tags):
+    """Tag an image index listing amd64 and arm64 manifests, which the architecture check reads.
+
+    The manifests reference blobs that are never uploaded: nothing pulls them.
+    """
+    import image_publish
+    manifests = []
+    for architecture in ('amd64', 'arm64'):
+        manifest = {'schemaVersion': 2, 'mediaType': image_publish.MANIFEST_MEDIA_TYPE, 'layers': [],
+                    'config': {'mediaType': image_publish.CONFIG_MEDIA_TYPE, 'size': 2,
+                               'digest': f'sha256:{architecture:0>64}'}}
+        digest = ecr.put_image(repositoryName=repo_name, imageManifest=json.dumps(manifest),
+                               imageManifestMediaType=image_publish.MANIFEST_MEDIA_TYPE)['image']['imageId']['imageDigest']
+        manifests.append({'mediaType': image_publish.MANIFEST_MEDIA_TYPE, 'size': len(json.dumps(manifest)),
+                          'digest': digest, 'platform': {'architecture': architecture, 'os': 'linux'}})
+    index = json.dumps({'schemaVersion': 2, 'mediaType': image_publish.INDEX_MEDIA_TYPE, 'manifests': manifests})
+    for tag in tags:
+        ecr.put_image(repositoryName=repo_name, imageManifest=index,
+                      imageManifestMediaType=image_publish.INDEX_MEDIA_TYPE, imageTag=tag)
+
+
+class CloudflareStub:
+    """In-memory Cloudflare DNS API served over HTTP on a local port.
+
+    Supports listing, creating, updating and deleting DNS records and the
+    batch endpoint. Requests can be delayed, and a fraction of them answered
+    with 429 and a zero Retry-After.
+    """
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.zones = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/client/v4'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self, zone_id, records=0):
+        """Empty the zone, then fill it with `records` unrelated CNAME records."""
+        with self._lock:
+            zone = self.zones[zone_id] = {}
+            for i in range(records):
+                record = self._new_record({'type': 'CNAME', 'name': f'seed-{i}.example.com',
+                                           'content': 'origin.example.com', 'ttl': 300, 'proxied': False})
+                zone[record['id']] = record
+
+    @staticmethod
+    def _new_record(data):
+        return dict(data, id=uuid.uuid4().hex)
+
+    def _faults(self):
+        with self._lock:
+            throttled = self._random.random() < self.throttle_rate
+        if self.latency:
+            time.sleep(self.latency)
+        return throttled
+
+    def _list(self, zone, query):
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['100'])[0])
+        records = list(zone.values())
+        total_pages = max(1, -(-len(records) // per_page))
+        return {'result': records[(page - 1) * per_page:page * per_page],
+                'result_info': {'page': page, 'per_page': per_page, 'total_pages': total_pages,
+                                'total_count': len(records)}}
+
+    def _batch(self, zone, payload):
+        result = {'deletes': [], 'puts': [], 'posts': []}
+        for item in payload.get('deletes', []):
+            result['deletes'].append(zone.pop(item['id']))
+        for item in payload.get('puts', []):
+            zone[item['id']] = dict(item)
+            result['puts'].append(zone[item['id']])
+        for item in payload.get('posts', []):
+            record = self._new_record(item)
+            zone[record['id']] = record
+            result['posts'].append(record)
+        return {'result': result}
+
+    def handle(self, method, path, query, payload):
+        """Return (status, body) for a request. Paths are /.../zones/{zone}/dns_records[/{id}|/batch]."""
+        parts = path.strip('/').split('/')
+        if 'zones' not in parts:
+            return 404, {'success': False}
+        parts = parts[parts.index('zones') + 1:]
+        with self._lock:
+            zone = self.zones.setdefault(parts[0], {})
+            if len(parts) == 2 and method == 'GET':
+                return 200, self._list(zone, query)
+            if len(parts) == 2 and method == 'POST':
+                record = self._new_record(payload)
+                zone[record['id']] = record
+                return 200, {'result': record}
+            if len(parts) == 3 and parts[2] == 'batch' and method == 'POST':
+                return 200, self._batch(zone, payload)
+            if len(parts) == 3 and parts[2] in zone:
+                if method == 'PUT':
+                    zone[parts[2]] = dict(payload, id=parts[2])
+                    return 200, {'result': zone[parts[2]]}
+                if method == 'DELETE':
+                    zone.pop(parts[2])
+                    return 200, {'result': {'id': parts[2]}}
+        return 404, {'success': False}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length)) if length else {}
+                if stub._faults():
+                    status, body, headers = 429, {'success': False}, {'Retry-After': '0'}
+                else:
+                    url = urlparse(self.path)
+                    status, body = stub.handle(self.command, url.path, parse_qs(url.query), payload)
+                    headers = {}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
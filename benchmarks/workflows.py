@@ -0,0 +1,266 @@
+"""Benchmark the deploy, update and rollback workflows offline.
+
+Each run starts from a fresh moto account seeded with a VPC, an ALB with an
+HTTPS listener and an ECS cluster, then deploys a project with `main.main`,
+moves it to a new image with `update_service.main` and tears it down with
+`rollback.main`. Cloudflare is served by a local stub. Nothing leaves the
+machine.
+
+The scale knobs fill the account with unrelated task definition revisions,
+listener rules and services, which is what the scans in the workflows grow
+with. Latency and throttling are injected on every AWS and Cloudflare call.
+
+    python benchmarks/workflows.py --runs 5 --revisions 200 --rules 300 --latency 0.05
+    python benchmarks/workflows.py --runs 5 --save-baseline benchmarks/baseline.json
+    python benchmarks/workflows.py --runs 5 --baseline benchmarks/baseline.json
+
+Requires moto (pip install "moto[ecs,elbv2,ec2,acm,logs,ecr]") on top of the
+project's own dependencies.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import CloudflareStub, FaultInjector, publish_stub_image  # noqa: E402
+
+WORKFLOWS = ['deploy', 'update', 'rollback']
+REGION = 'us-east-1'
+ZONE_ID = 'benchmark-zone'
+PROJECT = 'bench'
+DOMAIN = 'bench.example.com'
+
+ENVIRONMENT = {
+    'AWS_REGION': REGION,
+    'ACCESS_KEY': 'testing',
+    'SECRET_TOKEN': 'testing',
+    'CLOUDFLARE_API_TOKEN': 'benchmark-token',
+    'CLOUDFLARE_ZONE_ID': ZONE_ID,
+    'PROJECT_NAME': PROJECT,
+    'DOMAIN_NAME': DOMAIN,
+    'IMAGE_TAG': 'v1',
+    'ECS_CLUSTER': 'bench-cluster',
+    'TASK_ROLE_ARN': 'arn:aws:iam::123456789012:role/bench-task',
+    'EXECUTION_ROLE_ARN': 'arn:aws:iam::123456789012:role/bench-execution',
+}
+
+
+def _percentile(values, fraction):
+    import tracing
+    return tracing.percentile(values, fraction)
+
+
+def seed_account(clients, config, revisions, rules, services):
+    """Create the shared infrastructure and the unrelated resources the scale knobs ask for."""
+    ec2 = clients.get_client('ec2')
+    elbv2 = clients.get_client('elbv2')
+    ecs = clients.get_client('ecs')
+
+    vpc_id = ec2.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+    subnets = [ec2.create_subnet(VpcId=vpc_id, CidrBlock=f'10.0.{i}.0/24', AvailabilityZone=f'{REGION}{zone}')
+               ['Subnet']['SubnetId'] for i, zone in enumerate('ab')]
+    security_group = ec2.create_security_group(GroupName='bench', Description='bench', VpcId=vpc_id)['GroupId']
+    alb = elbv2.create_load_balancer(Name='bench-alb', Subnets=subnets, SecurityGroups=[security_group],
+                                     Type='application')['LoadBalancers'][0]
+    certificate_arn = clients.get_client('acm').request_certificate(DomainName='*.example.com')['CertificateArn']
+    listener_arn = elbv2.create_listener(
+        LoadBalancerArn=alb['LoadBalancerArn'], Protocol='HTTPS', Port=443,
+        Certificates=[{'CertificateArn': certificate_arn}],
+        DefaultActions=[{'Type': 'fixed-response', 'FixedResponseConfig': {'StatusCode': '404'}}]
+    )['Listeners'][0]['ListenerArn']
+    ecs.create_cluster(clusterName=ENVIRONMENT['ECS_CLUSTER'])
+    ecr = clients.get_client('ecr')
+    ecr.create_repository(repositoryName=PROJECT)
+    # The tags deployed and updated to, checked for the task's CPU architecture before registering
+    publish_stub_image(ecr, PROJECT, ['v1', 'v2'])
+
+    repo_uri = f'123456789012.dkr.ecr.{REGION}.amazonaws.com/{PROJECT}'
+    for name, value in (('vpc_id', vpc_id), ('subnets', subnets), ('security_groups', [security_group]),
+                        ('alb_arn', alb['LoadBalancerArn']), ('alb_dns_name', alb['DNSName']),
+                        ('repo_uri', repo_uri),
+                        ('default_project', config.project_settings(PROJECT, DOMAIN, 'v1', repo_uri))):
+        setattr(config, name, value)
+
+    family = config.default_project['task_family_name']
+    for i in range(revisions):
+        task_definition_arn = ecs.register_task_definition(
+            family=family, networkMode='awsvpc', requiresCompatibilities=['FARGATE'], cpu='512', memory='2048',
+            containerDefinitions=[{'name': 'seed', 'image': f'{repo_uri}:seed-{i}', 'essential': True}]
+        )['taskDefinition']['taskDefinitionArn']
+    for i in range(rules):
+        elbv2.create_rule(ListenerArn=listener_arn, Priority=100 + i,
+                          Conditions=[{'Field': 'host-header', 'Values': [f'seed-{i}.example.com']}],
+                          Actions=[{'Type': 'fixed-response', 'FixedResponseConfig': {'StatusCode': '200'}}])
+    if services and not revisions:
+        task_definition_arn = ecs.register_task_definition(
+            family='seed', containerDefinitions=[{'name': 'seed', 'image': 'seed', 'essential': True}]
+        )['taskDefinition']['taskDefinitionArn']
+    for i in range(services):
+        ecs.create_service(cluster=ENVIRONMENT['ECS_CLUSTER'], serviceName=f'seed-{i}',
+                           taskDefinition=task_definition_arn, desiredCount=0)
+
+
+def run_once(modules, injector, stub, args):
+    """Run the three workflows once against a fresh account. Returns workflow name to (seconds, calls)."""
+    from moto import mock_aws
+    clients, config, cloudflare, priorities, tracing, main, update_service, rollback = modules
+
+    deployments_dir = os.environ['DEPLOYMENTS_DIR']
+    shutil.rmtree(deployments_dir, ignore_errors=True)
+    os.makedirs(deployments_dir)
+    # Caches keyed by listener or token would otherwise carry state between runs
+    cloudflare._clients.clear()
+    priorities._allocators.clear()
+    stub.reset(ZONE_ID, args.dns_records)
+
+    workflows = {
+        'deploy': lambda: main.main(max_workers=args.step_workers),
+        'update': lambda: update_service.main(PROJECT, new_image_tag='v2', cpu='512', memory='2048'),
+        'rollback': lambda: rollback.main([PROJECT]),
+    }
+    measurements = {}
+    with mock_aws():
+        injector.enabled = False
+        seed_account(clients, config, args.revisions, args.rules, args.services)
+        injector.enabled = True
+        for name in WORKFLOWS:
+            tracer = tracing.start()
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                workflows[name]()
+            elapsed = time.perf_counter() - started
+            tracing.stop()
+            calls = {row['operation']: row['count'] for row in tracer.summary()}
+            measurements[name] = (elapsed, calls)
+        injector.enabled = False
+    return measurements
+
+
+def summarize(runs):
+    """Aggregate per-run measurements into p50/p95 wall time and median call counts per workflow."""
+    summary = {}
+    for name in WORKFLOWS:
+        timings = [run[name][0] for run in runs]
+        operations = sorted({op for run in runs for op in run[name][1]})
+        calls = {op: statistics.median(run[name][1].get(op, 0) for run in runs) for op in operations}
+        summary[name] = {
+            'p50': _percentile(timings, 0.5),
+            'p95': _percentile(timings, 0.95),
+            'calls': calls,
+            'total_calls': sum(calls.values()),
+        }
+    return summary
+
+
+def print_summary(summary, show_calls):
+    print(f"{'WORKFLOW':<12} {'P50':>10} {'P95':>10} {'CALLS':>7}")
+    for name, row in summary.items():
+        print(f"{name:<12} {row['p50'] * 1000:>8.0f}ms {row['p95'] * 1000:>8.0f}ms {row['total_calls']:>7g}")
+    if show_calls:
+        for name, row in summary.items():
+            print(f"\n{name}")
+            for op, count in sorted(row['calls'].items(), key=lambda item: -item[1]):
+                print(f"  {op:<56} {count:>6g}")
+
+
+def compare(summary, baseline, tolerance):
+    """Print the change against a baseline. Returns the workflows that regressed."""
+    regressions = []
+    print(f"\n{'WORKFLOW':<12} {'P50':>10} {'BASELINE':>10} {'CHANGE':>8} {'CALLS':>7} {'BASELINE':>9}")
+    for name, row in summary.items():
+        base = baseline['workflows'].get(name)
+        if base is None:
+            print(f"{name:<12} not in baseline")
+            continue
+        change = (row['p50'] - base['p50']) / base['p50'] * 100 if base['p50'] else 0.0
+        print(f"{name:<12} {row['p50'] * 1000:>8.0f}ms {base['p50'] * 1000:>8.0f}ms {change:>+7.1f}% "
+              f"{row['total_calls']:>7g} {base['total_calls']:>9g}")
+        if change > tolerance or row['total_calls'] > base['total_calls']:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark deploy, update and rollback against local stand-ins.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--revisions', type=int, default=50, help="Existing revisions in the project's family.")
+    parser.add_argument('--rules', type=int, default=100, help="Existing rules on the HTTPS listener.")
+    parser.add_argument('--services', type=int, default=10, help="Existing services in the cluster.")
+    parser.add_argument('--dns-records', type=int, default=100, help="Existing records in the Cloudflare zone.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every AWS call attempt.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many seconds added at random.")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of AWS attempts throttled.")
+    parser.add_argument('--cloudflare-latency', type=float, default=0.0)
+    parser.add_argument('--cloudflare-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--step-workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--calls', action='store_true', help="Show call counts by operation.")
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE', help="Compare against a saved baseline; exit 1 on regression.")
+    parser.add_argument('--tolerance', type=float, default=10.0, help="Allowed p50 slowdown against the baseline, in percent.")
+    args = parser.parse_args()
+
+    stub = CloudflareStub(args.cloudflare_latency, args.cloudflare_throttle_rate, args.seed).start()
+    deployments_dir = tempfile.mkdtemp(prefix='ecs-benchmark-')
+    # Must be set before the project modules are imported, they read it at import time
+    os.environ.update(ENVIRONMENT, CLOUDFLARE_API_URL=stub.base_url, DEPLOYMENTS_DIR=deployments_dir,
+                      AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing')
+
+    try:
+        import moto  # noqa: F401  registers its handlers before any client exists
+    except ImportError:
+        print('moto is required: pip install "moto[ecs,elbv2,ec2,acm,logs,ecr]"')
+        sys.exit(1)
+    import clients, config, cloudflare, priorities, tracing  # noqa: E401
+    import main as deploy, update_service, rollback  # noqa: E401
+    logging.getLogger().setLevel(logging.WARNING)
+
+    injector = FaultInjector(args.latency, args.jitter, args.throttle_rate, args.seed)
+    clients.add_client_hook(injector.instrument_client)
+    modules = (clients, config, cloudflare, priorities, tracing, deploy, update_service, rollback)
+
+    runs = []
+    try:
+        for i in range(args.runs):
+            runs.append(run_once(modules, injector, stub, args))
+            print(f"Run {i + 1}/{args.runs}: " +
+                  ', '.join(f"{name} {runs[-1][name][0] * 1000:.0f}ms" for name in WORKFLOWS))
+    finally:
+        stub.stop()
+        shutil.rmtree(deployments_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    print()
+    print_summary(summary, args.calls)
+
+    settings = {name: getattr(args, name) for name in ('revisions', 'rules', 'services', 'dns_records', 'latency',
+                                                        'jitter', 'throttle_rate', 'cloudflare_latency',
+                                                        'cloudflare_throttle_rate', 'step_workers', 'runs')}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'settings': settings, 'workflows': summary}, f, indent=4)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print("\nWarning: the baseline was recorded with different settings.")
+        regressions = compare(summary, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
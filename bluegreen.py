@@ -0,0 +1,276 @@
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import autoscaling
+import clients
+import config
+import priorities
+import waiters
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Percentage of traffic sent to the new target group after each step
+DEFAULT_SHIFT_STEPS = (10, 25, 50, 100)
+DEFAULT_STEP_INTERVAL = 60
+# Without an absolute limit, the new tasks may be this much slower than the old ones
+RESPONSE_TIME_TOLERANCE = 1.5
+# Target group names are limited to 32 characters
+MAX_TARGET_GROUP_NAME = 32
+
+
+def next_name(project_name, current_name, max_length=None):
+    """Return the name of the other color, e.g. 'api-green' for a service named 'api' or 'api-blue'."""
+    color = 'blue' if current_name.endswith('-green') else 'green'
+    base = project_name if max_length is None else project_name[:max_length - len(color) - 1]
+    return f'{base}-{color}'
+
+
+def clone_target_group(source_arn, name):
+    """Create a target group with the settings, attributes and tags of another one. Returns its ARN."""
+    elbv2_client = clients.get_client('elbv2')
+    source = elbv2_client.describe_target_groups(TargetGroupArns=[source_arn])['TargetGroups'][0]
+    settings = {key: source[key] for key in (
+        'Protocol', 'Port', 'VpcId', 'TargetType', 'HealthCheckProtocol', 'HealthCheckPort', 'HealthCheckPath',
+        'HealthCheckIntervalSeconds', 'HealthCheckTimeoutSeconds', 'HealthyThresholdCount',
+        'UnhealthyThresholdCount', 'Matcher') if key in source}
+    tags = elbv2_client.describe_tags(ResourceArns=[source_arn])['TagDescriptions'][0]['Tags']
+    if tags:
+        settings['Tags'] = tags
+    target_group_arn = elbv2_client.create_target_group(Name=name, **settings)['TargetGroups'][0]['TargetGroupArn']
+    attributes = elbv2_client.describe_target_group_attributes(TargetGroupArn=source_arn)['Attributes']
+    elbv2_client.modify_target_group_attributes(TargetGroupArn=target_group_arn, Attributes=attributes)
+    logger.info(f"Target group '{name}' created from '{source['TargetGroupName']}'.")
+    return target_group_arn
+
+
+def clone_service(cluster, source_name, name, task_definition_arn, target_group_arn):
+    """Create a service like another one, running a new task definition behind a new target group.
+
+    Returns:
+        str: The ARN of the new service.
+    """
+    ecs_client = clients.get_client('ecs')
+    source = ecs_client.describe_services(cluster=cluster, services=[source_name], include=['TAGS'])['services'][0]
+    load_balancer = source['loadBalancers'][0]
+    kwargs = {key: source[key] for key in ('launchType', 'networkConfiguration', 'enableExecuteCommand',
+                                           'healthCheckGracePeriodSeconds', 'platformVersion', 'propagateTags')
+              if key in source}
+    if source.get('tags'):
+        kwargs['tags'] = source['tags']
+    service = ecs_client.create_service(
+        cluster=cluster,
+        serviceName=name,
+        taskDefinition=task_definition_arn,
+        loadBalancers=[{'targetGroupArn': target_group_arn, 'containerName': load_balancer['containerName'],
+                        'containerPort': load_balancer['containerPort']}],
+        desiredCount=max(source['desiredCount'], 1),
+        **kwargs
+    )['service']
+    logger.info(f"ECS service '{name}' created with '{task_definition_arn}'.")
+    return service['serviceArn']
+
+
+def delete_service(cluster, name, target_group_arn):
+    """Delete a service with its auto scaling, wait for it to drain and delete its target group."""
+    ecs_client = clients.get_client('ecs')
+    elbv2_client = clients.get_client('elbv2')
+    try:
+        autoscaling.remove_service_scaling(cluster, name)
+        ecs_client.delete_service(cluster=cluster, service=name, force=True)
+        waiters.wait_for_services_inactive(ecs_client, cluster, [name])
+        elbv2_client.delete_target_group(TargetGroupArn=target_group_arn)
+        logger.info(f"ECS service '{name}' and target group '{target_group_arn}' deleted.")
+    except Exception as e:
+        logger.error(f"Error deleting ECS service '{name}': {e}")
+
+
+def forwarding_rule(rule_arns, target_group_arn):
+    """Return the rule among `rule_arns` that forwards to a target group, or None."""
+    if not rule_arns:
+        return None
+    rules = clients.get_client('elbv2').describe_rules(RuleArns=rule_arns)['Rules']
+    for rule in rules:
+        for action in rule['Actions']:
+            groups = [action.get('TargetGroupArn')] + \
+                [group['TargetGroupArn'] for group in action.get('ForwardConfig', {}).get('TargetGroups', [])]
+            if action['Type'] == 'forward' and target_group_arn in groups:
+                return rule
+    return None
+
+
+def set_weights(rule_arn, old_target_group_arn, new_target_group_arn, percent):
+    """Send `percent` of the rule's traffic to the new target group and the rest to the old one."""
+    if percent >= 100:
+        actions = [{'Type': 'forward', 'TargetGroupArn': new_target_group_arn}]
+    else:
+        actions = [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+            {'TargetGroupArn': old_target_group_arn, 'Weight': 100 - percent},
+            {'TargetGroupArn': new_target_group_arn, 'Weight': percent}
+        ]}}]
+    clients.get_client('elbv2').modify_rule(RuleArn=rule_arn, Actions=actions)
+    logger.info(f"Rule '{rule_arn}' sends {percent}% of traffic to '{new_target_group_arn}'.")
+
+
+def wait_for_healthy_targets(target_group_arn, max_wait_time=300, sleep=time.sleep):
+    """Wait until a target group has targets and all of them are healthy. Returns False on timeout."""
+    ready, _ = waiters.wait_for_targets_healthy(clients.get_client('elbv2'), target_group_arn,
+                                                max_wait_time=max_wait_time, sleep=sleep)
+    return ready
+
+
+def target_group_dimensions(target_group_arn, alb_arn=None):
+    """CloudWatch dimensions of the AWS/ApplicationELB metrics of a target group."""
+    alb_arn = alb_arn or config.alb_arn
+    return [
+        # app/<name>/<id> and targetgroup/<name>/<id>
+        {'Name': 'LoadBalancer', 'Value': alb_arn.split('loadbalancer/', 1)[1]},
+        {'Name': 'TargetGroup', 'Value': target_group_arn.rsplit(':', 1)[-1]}
+    ]
+
+
+def response_times(target_group_arns, window, alb_arn=None):
+    """p99 TargetResponseTime of each target group over the last `window` seconds, None without traffic."""
+    end = time.time()
+    queries = [{
+        'Id': f'tg{index}',
+        'MetricStat': {
+            'Metric': {
+                'Namespace': 'AWS/ApplicationELB',
+                'MetricName': 'TargetResponseTime',
+                'Dimensions': target_group_dimensions(arn, alb_arn)
+            },
+            'Period': 60,
+            'Stat': 'p99'
+        }
+    } for index, arn in enumerate(target_group_arns)]
+    response = clients.get_client('cloudwatch').get_metric_data(
+        MetricDataQueries=queries, StartTime=end - max(window, 60), EndTime=end)
+    values = {result['Id']: result['Values'] for result in response['MetricDataResults']}
+    return [max(values[f'tg{index}']) if values.get(f'tg{index}') else None for index in range(len(target_group_arns))]
+
+
+def warm_up(listener_arn, domain_name, target_group_arn, requests_count, path='/', concurrency=8, alb_dns_name=None):
+    """Send requests to the new tasks only, through a temporary rule on a private host name."""
+    import requests
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    allocator = priorities.get_allocator(clients.get_client('elbv2'), listener_arn)
+    host = f'warmup-{uuid.uuid4().hex[:12]}.{domain_name}'
+    rule = allocator.create_rule(
+        conditions=[{'Field': 'host-header', 'HostHeaderConfig': {'Values': [host]}}],
+        actions=[{'Type': 'forward', 'TargetGroupArn': target_group_arn}]
+    )
+    url = f"https://{alb_dns_name or config.alb_dns_name}{path}"
+    session = requests.Session()
+
+    def send(_):
+        try:
+            return session.get(url, headers={'Host': host}, verify=False, timeout=30).status_code
+        except requests.exceptions.RequestException:
+            return None
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(executor.map(send, range(requests_count)))
+        errors = sum(1 for status in statuses if status is None or status >= 500)
+        logger.info(f"Warmup sent {requests_count} requests in {time.perf_counter() - started:.1f}s, {errors} failed.")
+    finally:
+        clients.get_client('elbv2').delete_rule(RuleArn=rule['RuleArn'])
+        allocator.release(int(rule['Priority']))
+
+
+def shift_traffic(rule_arn, old_target_group_arn, new_target_group_arn, steps=DEFAULT_SHIFT_STEPS,
+                  step_interval=DEFAULT_STEP_INTERVAL, max_response_time=None, sleep=time.sleep):
+    """Move a rule's traffic to the new target group step by step.
+
+    After each step the new targets must stay healthy, and their p99
+    TargetResponseTime must stay under `max_response_time` seconds, or under
+    RESPONSE_TIME_TOLERANCE times that of the old targets when it is not set.
+    On failure all traffic goes back to the old target group.
+
+    Returns:
+        bool: True if all traffic was moved.
+    """
+    steps = [percent for percent in steps if 0 < percent < 100] + [100]
+    for percent in steps:
+        set_weights(rule_arn, old_target_group_arn, new_target_group_arn, percent)
+        if percent == 100:
+            return True
+        sleep(step_interval)
+
+        reason = None
+        if not wait_for_healthy_targets(new_target_group_arn, max_wait_time=0, sleep=sleep):
+            reason = 'new targets are unhealthy'
+        else:
+            old_time, new_time = response_times([old_target_group_arn, new_target_group_arn], step_interval)
+            limit = max_response_time or (old_time * RESPONSE_TIME_TOLERANCE if old_time else None)
+            logger.info(f"p99 response time at {percent}%: new {new_time}, old {old_time}, limit {limit}")
+            if limit and new_time and new_time > limit:
+                reason = f"p99 response time {new_time:.3f}s is over {limit:.3f}s"
+        if reason:
+            logger.error(f"Traffic shift stopped at {percent}%: {reason}. Sending all traffic back.")
+            set_weights(rule_arn, new_target_group_arn, old_target_group_arn, 100)
+            return False
+
+
+def rollout(deployment_info, task_definition_arn, project_name, steps=DEFAULT_SHIFT_STEPS,
+            step_interval=DEFAULT_STEP_INTERVAL, max_response_time=None, warmup_requests=0, warmup_path='/'):
+    """Deploy a task definition next to the running service and move traffic to it gradually.
+
+    The new revision runs in a second service behind a second target group,
+    named after the other color. Once it is stable and warmed up, the
+    deployment's ALB rule shifts traffic to it in `steps`. The old service and
+    target group are then deleted. When anything fails, the new ones are
+    deleted instead and the old service keeps all traffic.
+
+    Args:
+        deployment_info (dict): The deployment record.
+        task_definition_arn (str): The task definition to roll out.
+        project_name (str): Used to name the new service and target group.
+
+    Returns:
+        tuple: (service_name, target_group_arn) of the new service, or None if the rollout failed.
+    """
+    cluster = deployment_info['ecs_cluster']
+    old_service = deployment_info['service_name']
+    old_target_group_arn = deployment_info['target_group_arn']
+    rule = forwarding_rule(deployment_info.get('rules', []), old_target_group_arn)
+    if rule is None:
+        logger.error(f"No rule of '{old_service}' forwards to '{old_target_group_arn}'.")
+        return None
+
+    new_service = next_name(project_name, old_service)
+    new_target_group_arn = clone_target_group(old_target_group_arn,
+                                              next_name(project_name, old_service, MAX_TARGET_GROUP_NAME))
+    try:
+        # With a weight of 0 the new target group is attached to the load balancer, which ECS
+        # requires, and its targets are health checked, but it gets no traffic
+        set_weights(rule['RuleArn'], old_target_group_arn, new_target_group_arn, 0)
+        clone_service(cluster, old_service, new_service, task_definition_arn, new_target_group_arn)
+        state, reason = waiters.wait_for_services(clients.get_client('ecs'), cluster, [new_service])[new_service]
+        if state != waiters.COMPLETED:
+            raise RuntimeError(f"service '{new_service}' {state.lower()}: {reason}")
+        if not wait_for_healthy_targets(new_target_group_arn):
+            raise RuntimeError(f"targets of '{new_service}' did not become healthy")
+        if warmup_requests:
+            warm_up(deployment_info['listener_arn'], deployment_info['domain_name'], new_target_group_arn,
+                    warmup_requests, warmup_path, alb_dns_name=deployment_info.get('alb_dns_name'))
+        if not shift_traffic(rule['RuleArn'], old_target_group_arn, new_target_group_arn, steps, step_interval,
+                             max_response_time):
+            raise RuntimeError("traffic shift was stopped")
+    except Exception as e:
+        logger.error(f"Blue/green rollout of '{old_service}' failed: {e}")
+        try:
+            set_weights(rule['RuleArn'], new_target_group_arn, old_target_group_arn, 100)
+        except Exception as e:
+            logger.error(f"Error sending traffic back to '{old_target_group_arn}': {e}")
+        delete_service(cluster, new_service, new_target_group_arn)
+        return None
+
+    delete_service(cluster, old_service, old_target_group_arn)
+    logger.info(f"Blue/green rollout completed: '{new_service}' replaced '{old_service}'.")
+    return new_service, new_target_group_arn
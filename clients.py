@@ -0,0 +1,83 @@
+import os
+import threading
+import throttling
+
+# The scripts have always targeted this region when AWS_REGION is not set
+FALLBACK_REGION = 'ap-southeast-5'
+
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+_client_hooks = []
+
+
+def default_region():
+    import keys  # loads the .env file
+    return os.getenv('AWS_REGION') or FALLBACK_REGION
+
+
+def default_credentials():
+    import keys
+    return keys.access, keys.secret
+
+
+def get_session(region=None, access_key=None, secret_key=None):
+    """Return the boto3 session cached for a region and set of credentials.
+
+    Credentials default to ACCESS_KEY/SECRET_TOKEN from .env, falling back to
+    the default boto3 credential chain when those are not set.
+    """
+    if access_key is None and secret_key is None:
+        access_key, secret_key = default_credentials()
+    region = region or default_region()
+    key = (region, access_key, secret_key)
+    with _lock:
+        if key not in _sessions:
+            import boto3
+            _sessions[key] = boto3.Session(
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region
+            )
+        return _sessions[key]
+
+
+def get_client(service, region=None, access_key=None, secret_key=None):
+    """Return the boto3 client cached for a service, region and set of credentials.
+
+    Clients are created on first use, so commands only pay for the clients they call.
+    Their calls go through `throttling.py`: adaptive retries, per-operation rate
+    limits, and coalescing and short caching of read-only calls.
+    """
+    if access_key is None and secret_key is None:
+        access_key, secret_key = default_credentials()
+    region = region or default_region()
+    key = (service, region, access_key, secret_key)
+    with _lock:
+        client = _clients.get(key)
+    if client is None:
+        session = get_session(region, access_key, secret_key)
+        with _lock:
+            # Session.client is not thread-safe
+            client = _clients.get(key)
+            if client is None:
+                client = session.client(service, config=throttling.client_config())
+                throttling.instrument_client(client)
+                for hook in _client_hooks:
+                    hook(client)
+                _clients[key] = client
+    return client
+
+
+def add_client_hook(hook):
+    """Call `hook(client)` on every client, the cached ones and those created later.
+
+    Hooks are used to register botocore event handlers, e.g. for tracing.
+    """
+    with _lock:
+        if hook in _client_hooks:
+            return
+        _client_hooks.append(hook)
+        existing = list(_clients.values())
+    for client in existing:
+        hook(client)
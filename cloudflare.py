@@ -0,0 +1,258 @@
+import logging
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import tracing
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Can point at a local stub for testing
+API_BASE_URL = os.getenv('CLOUDFLARE_API_URL', 'https://api.cloudflare.com/client/v4')
+RECORDS_PAGE_SIZE = 5000
+BATCH_SIZE = 200
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# A POST that fails with a 5xx or times out may still have been applied, so it is only retried
+# when it was rejected before reaching Cloudflare: on 429, or when the connection was not made
+NON_IDEMPOTENT_METHODS = ('POST',)
+
+
+class CloudflareError(Exception):
+    pass
+
+
+def _path_template(path):
+    # Group calls by endpoint rather than by zone or record ID
+    parts = path.split('/')
+    return '/'.join('{id}' if index == 2 or (index == 4 and part != 'batch') else part
+                    for index, part in enumerate(parts))
+
+
+class CloudflareClient:
+    """Cloudflare DNS client sharing one pooled keep-alive session.
+
+    Requests time out, and 429 or 5xx responses are retried after the delay
+    given by the Retry-After header, or with exponential backoff and jitter.
+    POST requests are only retried on 429 and connection failures; a create
+    that fails otherwise re-reads the zone to find out whether it was applied.
+    Each zone's records are cached as a snapshot so that upserts which would
+    not change anything cost no request at all.
+    """
+
+    def __init__(self, api_token, base_url=API_BASE_URL, timeout=10, max_retries=5, snapshot_ttl=60,
+                 pool_size=16, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.snapshot_ttl = snapshot_ttl
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json"
+        })
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(2 ** attempt, 30) * random.uniform(0.5, 1.0)
+
+    def request(self, method, path, **kwargs):
+        url = f"{self.base_url}{path}"
+        operation = f"cloudflare.{method} {_path_template(path)}"
+        idempotent = method not in NON_IDEMPOTENT_METHODS
+        retry_status_codes = RETRY_STATUS_CODES if idempotent else (429,)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with tracing.span(operation, 'cloudflare', retries=1 if attempt else 0):
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if response.status_code == 429:
+                    tracer = tracing.active()
+                    if tracer:
+                        tracer.count_throttle(operation)
+                if response.status_code not in retry_status_codes:
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # A read timeout or a dropped connection may come after the request was applied
+                sent = not isinstance(e, requests.exceptions.ConnectTimeout)
+                if attempt == self.max_retries or (sent and not idempotent):
+                    raise CloudflareError(f"{method} {path} failed: {e}") from e
+            except requests.exceptions.RequestException as e:
+                raise CloudflareError(f"{method} {path} failed: {e}") from e
+
+            if attempt == self.max_retries:
+                raise CloudflareError(f"{method} {path} failed after {attempt + 1} attempts "
+                                      f"(HTTP {response.status_code if response is not None else 'error'}).")
+            delay = self._retry_delay(response, attempt)
+            logger.warning(f"Cloudflare {method} {path} throttled or failed, retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+    def list_records(self, zone_id, refresh=False):
+        """Return every DNS record of a zone from a cached snapshot."""
+        with self._lock:
+            snapshot = self._snapshots.get(zone_id)
+        if snapshot and not refresh and time.monotonic() - snapshot['loaded_at'] < self.snapshot_ttl:
+            return list(snapshot['records'].values())
+
+        records = {}
+        page = 1
+        while True:
+            body = self.request('GET', f"/zones/{zone_id}/dns_records",
+                                params={'page': page, 'per_page': RECORDS_PAGE_SIZE})
+            for record in body.get('result', []):
+                records[record['id']] = record
+            info = body.get('result_info') or {}
+            if page >= info.get('total_pages', 1):
+                break
+            page += 1
+
+        with self._lock:
+            self._snapshots[zone_id] = {'records': records, 'loaded_at': time.monotonic()}
+        return list(records.values())
+
+    def find_record(self, zone_id, record_type, name):
+        name = name.rstrip('.').lower()
+        for record in self.list_records(zone_id):
+            if record['type'] == record_type and record['name'].lower() == name:
+                return record
+        return None
+
+    def _remember(self, zone_id, record=None, deleted_id=None):
+        with self._lock:
+            snapshot = self._snapshots.get(zone_id)
+            if snapshot is None:
+                return
+            if deleted_id:
+                snapshot['records'].pop(deleted_id, None)
+            if record:
+                snapshot['records'][record['id']] = record
+
+    @staticmethod
+    def _cname(name, content, ttl, proxied):
+        return {"type": "CNAME", "name": name, "content": content, "ttl": ttl, "proxied": proxied}
+
+    @staticmethod
+    def _unchanged(record, desired):
+        return record['content'].rstrip('.').lower() == desired['content'].rstrip('.').lower() and \
+            record.get('proxied', False) == desired['proxied'] and \
+            (record.get('ttl') == desired['ttl'] or record.get('proxied'))
+
+    def upsert_cname(self, zone_id, name, content, ttl=300, proxied=False):
+        """Create or update a CNAME record. Does nothing when the record is already as desired.
+
+        Returns:
+            tuple: (record, action) where action is 'unchanged', 'updated' or 'created'.
+        """
+        desired = self._cname(name, content, ttl, proxied)
+        existing = self.find_record(zone_id, 'CNAME', name)
+        if existing and self._unchanged(existing, desired):
+            return existing, 'unchanged'
+        if existing:
+            record = self.request('PUT', f"/zones/{zone_id}/dns_records/{existing['id']}", json=desired)['result']
+            action = 'updated'
+        else:
+            try:
+                record = self.request('POST', f"/zones/{zone_id}/dns_records", json=desired)['result']
+            except CloudflareError:
+                # The create may have been applied before the error: look for it before retrying once
+                self.list_records(zone_id, refresh=True)
+                record = self.find_record(zone_id, 'CNAME', name)
+                if record is None:
+                    record = self.request('POST', f"/zones/{zone_id}/dns_records", json=desired)['result']
+                elif not self._unchanged(record, desired):
+                    raise
+            action = 'created'
+        self._remember(zone_id, record)
+        return record, action
+
+    def delete_record(self, zone_id, record_type, name):
+        """Delete a record by type and name. Returns False when there was no such record."""
+        existing = self.find_record(zone_id, record_type, name)
+        if existing is None:
+            return False
+        self.request('DELETE', f"/zones/{zone_id}/dns_records/{existing['id']}")
+        self._remember(zone_id, deleted_id=existing['id'])
+        return True
+
+    def _batch(self, zone_id, posts=(), puts=(), deletes=()):
+        operations = [('posts', item) for item in posts] + [('puts', item) for item in puts] + \
+            [('deletes', item) for item in deletes]
+        for i in range(0, len(operations), BATCH_SIZE):
+            payload = {}
+            for kind, item in operations[i:i + BATCH_SIZE]:
+                payload.setdefault(kind, []).append(item)
+            try:
+                result = self.request('POST', f"/zones/{zone_id}/dns_records/batch", json=payload).get('result') or {}
+            except CloudflareError:
+                # Part of the batch may have been applied, so the snapshot can no longer be trusted
+                with self._lock:
+                    self._snapshots.pop(zone_id, None)
+                raise
+            for deleted in result.get('deletes', []):
+                self._remember(zone_id, deleted_id=deleted['id'])
+            for record in result.get('posts', []) + result.get('puts', []):
+                self._remember(zone_id, record)
+
+    def upsert_cnames(self, zone_id, records, ttl=300, proxied=False):
+        """Create or update many CNAME records of a zone in batch requests.
+
+        Args:
+            zone_id (str): The Cloudflare zone ID.
+            records (dict): Record name to CNAME target.
+
+        Returns:
+            dict: Record name to 'unchanged', 'updated' or 'created'.
+        """
+        actions, posts, puts = {}, [], []
+        for name, content in records.items():
+            desired = self._cname(name, content, ttl, proxied)
+            existing = self.find_record(zone_id, 'CNAME', name)
+            if existing and self._unchanged(existing, desired):
+                actions[name] = 'unchanged'
+            elif existing:
+                puts.append(dict(desired, id=existing['id']))
+                actions[name] = 'updated'
+            else:
+                posts.append(desired)
+                actions[name] = 'created'
+        if posts or puts:
+            self._batch(zone_id, posts=posts, puts=puts)
+        return actions
+
+    def delete_records(self, zone_id, names, record_type='CNAME'):
+        """Delete many records of a zone in batch requests. Returns the names that were found."""
+        deletes, found = [], []
+        for name in names:
+            existing = self.find_record(zone_id, record_type, name)
+            if existing:
+                deletes.append({'id': existing['id']})
+                found.append(name)
+        if deletes:
+            self._batch(zone_id, deletes=deletes)
+        return found
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_token, base_url=API_BASE_URL):
+    """Return the client shared by every caller in this process for an API token."""
+    with _clients_lock:
+        key = (api_token, base_url)
+        if key not in _clients:
+            _clients[key] = CloudflareClient(api_token, base_url)
+        return _clients[key]
@@ -1,5 +1,8 @@
+import json
 import os
-from keys import access, secret, cloudflare_api_token
+
+# Settings are read from the environment on first access, so that importing this
+# module is cheap and commands only fail on the variables they actually use.
 
 def get_env_variable(var_name):
     value = os.getenv(var_name)
@@ -7,20 +10,66 @@ def get_env_variable(var_name):
         raise EnvironmentError(f"Environment variable {var_name} is not set.")
     return value
 
-aws_region = get_env_variable('AWS_REGION')
-vpc_id = get_env_variable('VPC_ID')
-subnets = get_env_variable('SUBNETS').split(',')
-security_groups = get_env_variable('SECURITY_GROUPS').split(',')
-alb_arn = get_env_variable('ALB_ARN')
-project_name = get_env_variable('PROJECT_NAME')
-repo_uri = get_env_variable("ECR_REPO_URI")
-container_name = f'{project_name}-api-container'
-task_family_name = f'{project_name}-api-task'
+def _load_keys():
+    # keys.py loads the .env file
+    import keys
+    return keys
+
+_SETTINGS = {
+    'aws_region': lambda: get_env_variable('AWS_REGION'),
+    'vpc_id': lambda: get_env_variable('VPC_ID'),
+    'subnets': lambda: get_env_variable('SUBNETS').split(','),
+    'security_groups': lambda: get_env_variable('SECURITY_GROUPS').split(','),
+    'alb_arn': lambda: get_env_variable('ALB_ARN'),
+    'project_name': lambda: get_env_variable('PROJECT_NAME'),
+    'repo_uri': lambda: get_env_variable("ECR_REPO_URI"),
+    'container_name': lambda: f"{_get('project_name')}-api-container",
+    'task_family_name': lambda: f"{_get('project_name')}-api-task",
+    'domain_name': lambda: get_env_variable('DOMAIN_NAME'),
+    'ecs_cluster': lambda: get_env_variable('ECS_CLUSTER'),
+    'image_tag': lambda: get_env_variable('IMAGE_TAG'),
+    'task_role_arn': lambda: get_env_variable('TASK_ROLE_ARN'),
+    'execution_role_arn': lambda: get_env_variable('EXECUTION_ROLE_ARN'),
+    'cloudflare_zone_id': lambda: get_env_variable('CLOUDFLARE_ZONE_ID'),
+    'alb_dns_name': lambda: get_env_variable('ALB_DNS_NAME'),
+    'access': lambda: _load_keys().access,
+    'secret': lambda: _load_keys().secret,
+    'cloudflare_api_token': lambda: _load_keys().cloudflare_api_token,
+    # Health checks of target groups and containers, see profiles.py. The defaults keep the
+    # settings of deployments made before profiles existed, so they are not changed on redeploy.
+    'health_check_profile': lambda: os.getenv('HEALTH_CHECK_PROFILE', 'conservative'),
+    'task_profile': lambda: os.getenv('TASK_PROFILE', 'legacy'),
+    # Fargate CPU architecture of the tasks: X86_64 or ARM64 (Graviton)
+    'cpu_architecture': lambda: os.getenv('CPU_ARCHITECTURE', 'X86_64'),
+    # Application Auto Scaling of the services, see autoscaling.py
+    'scaling_min_capacity': lambda: int(os.getenv('SCALING_MIN_CAPACITY', '1')),
+    'scaling_max_capacity': lambda: int(os.getenv('SCALING_MAX_CAPACITY', '4')),
+    'scaling_cpu_target': lambda: float(os.getenv('SCALING_CPU_TARGET', '60')),
+    'scaling_requests_per_target': lambda: float(os.getenv('SCALING_REQUESTS_PER_TARGET', '1000')),
+    'scaling_schedules': lambda: json.loads(os.getenv('SCALING_SCHEDULES', '[]')),
+    'default_project': lambda: project_settings(_get('project_name'), _get('domain_name'), _get('image_tag'), _get('repo_uri')),
+}
+
 log_group = f'/ecs/container-logs'
-domain_name = get_env_variable('DOMAIN_NAME')
-ecs_cluster = get_env_variable('ECS_CLUSTER')
-image_tag = get_env_variable('IMAGE_TAG')
-task_role_arn = get_env_variable('TASK_ROLE_ARN')
-execution_role_arn = get_env_variable('EXECUTION_ROLE_ARN')
-cloudflare_zone_id = get_env_variable('CLOUDFLARE_ZONE_ID')
-alb_dns_name = get_env_variable('ALB_DNS_NAME')
+
+def __getattr__(name):
+    if name not in _SETTINGS:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    _load_keys()
+    value = _SETTINGS[name]()
+    globals()[name] = value
+    return value
+
+def _get(name):
+    return globals()[name] if name in globals() else __getattr__(name)
+
+def project_settings(project_name, domain_name, image_tag, repo_uri, cpu_architecture=None):
+    return {
+        'project_name': project_name,
+        'container_name': f'{project_name}-api-container',
+        'task_family_name': f'{project_name}-api-task',
+        'domain_name': domain_name,
+        'image_tag': image_tag,
+        'repo_uri': repo_uri,
+        'cpu_architecture': cpu_architecture or _get('cpu_architecture')
+    }
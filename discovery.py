@@ -0,0 +1,302 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+import clients
+import config
+import waiters
+from state_store import DeploymentStore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROJECT_TAG = 'Project'
+DEPLOYMENT_TAG = 'DeploymentId'
+ROLE_TAG = 'Role'
+SIDE_BY_SIDE_ROLE = 'side-by-side'
+# Resource Groups Tagging API types of the resources of a deployment. Task definition
+# revisions are shared between deployments, so they are only tagged with their project.
+RESOURCE_TYPES = {
+    'ecs:service': 'services',
+    'elasticloadbalancing:targetgroup': 'target_groups',
+    'elasticloadbalancing:listener-rule': 'rules',
+    'ecs:task-definition': 'task_definitions',
+}
+# get_resources returns at most 100 resources per page, tag_resources takes at most 20 ARNs
+PAGE_SIZE = 100
+TAG_BATCH_SIZE = 20
+CACHE_TTL = 300
+
+
+def deployment_tag(project_name, timestamp):
+    """The DeploymentId tag of a deployment, known before any of its resources exists.
+
+    It ends with the deployment's "%Y%m%d-%H%M%S" timestamp, so the newest
+    deployment of a project sorts last.
+    """
+    return f'{project_name}-{timestamp}'
+
+
+def resource_tags(project_name, deployment_id=None):
+    tags = {PROJECT_TAG: project_name}
+    if deployment_id:
+        tags[DEPLOYMENT_TAG] = deployment_id
+    return tags
+
+
+def elbv2_tags(tags):
+    return [{'Key': key, 'Value': value} for key, value in tags.items()]
+
+
+def ecs_tags(tags):
+    return [{'key': key, 'value': value} for key, value in tags.items()]
+
+
+def resource_type(arn):
+    """'ecs:service', 'elasticloadbalancing:targetgroup' and so on, from an ARN."""
+    parts = arn.split(':', 5)
+    return f"{parts[2]}:{parts[5].split('/', 1)[0]}"
+
+
+class ResourceIndex:
+    """In-memory index of the resources tagged with a project, by project and DeploymentId.
+
+    A refresh lists every tagged ECS service, task definition, target group
+    and listener rule of the region with paginated get_resources calls, 100
+    resources per page, so finding a project costs a few calls instead of
+    scanning every rule and service. The index is reused for `ttl` seconds.
+    """
+
+    def __init__(self, client, ttl=CACHE_TTL):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._projects = {}
+        self._loaded_at = None
+
+    def refresh(self):
+        projects = {}
+        count = 0
+        paginator = self.client.get_paginator('get_resources')
+        for page in paginator.paginate(TagFilters=[{'Key': PROJECT_TAG}], ResourceTypeFilters=list(RESOURCE_TYPES),
+                                       ResourcesPerPage=PAGE_SIZE):
+            for resource in page['ResourceTagMappingList']:
+                kind = RESOURCE_TYPES.get(resource_type(resource['ResourceARN']))
+                tags = {tag['Key']: tag['Value'] for tag in resource.get('Tags', [])}
+                if kind is None or PROJECT_TAG not in tags:
+                    continue
+                deployments = projects.setdefault(tags[PROJECT_TAG], {})
+                entry = deployments.setdefault(tags.get(DEPLOYMENT_TAG), {name: [] for name in RESOURCE_TYPES.values()})
+                entry[kind].append({'arn': resource['ResourceARN'], 'tags': tags})
+                count += 1
+        with self._lock:
+            self._projects = projects
+            self._loaded_at = time.monotonic()
+        logger.info(f"Indexed {count} tagged resource(s) of {len(projects)} project(s).")
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def projects(self):
+        self._ensure_loaded()
+        with self._lock:
+            return sorted(self._projects)
+
+    def deployments(self, project_name):
+        """Return {DeploymentId: {'services': [...], 'target_groups': [...], ...}} for a project.
+
+        Each resource is a dict with its 'arn' and 'tags'. Resources without a
+        DeploymentId tag, such as task definitions, are under None.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return dict(self._projects.get(project_name, {}))
+
+    def project_of_service(self, service_name):
+        """Return the project of a tagged ECS service, e.g. after a blue/green rollout renamed it."""
+        self._ensure_loaded()
+        with self._lock:
+            for project_name, deployments in self._projects.items():
+                for resources in deployments.values():
+                    if any(service['arn'].rsplit('/', 1)[-1] == service_name for service in resources['services']):
+                        return project_name
+        return None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(region=None):
+    """Return the index shared by every caller in this process for a region."""
+    region = region or clients.default_region()
+    with _indexes_lock:
+        if region not in _indexes:
+            _indexes[region] = ResourceIndex(clients.get_client('resourcegroupstaggingapi', region=region))
+        return _indexes[region]
+
+
+def tag_resources(arns, tags):
+    """Add tags to resources of any type, 20 ARNs per call. Returns the ARNs that could not be tagged."""
+    client = clients.get_client('resourcegroupstaggingapi')
+    failed = []
+    for batch in waiters.chunks(arns, TAG_BATCH_SIZE):
+        for arn, failure in client.tag_resources(ResourceARNList=batch, Tags=tags).get('FailedResourcesMap', {}).items():
+            logger.error(f"Error tagging '{arn}': {failure.get('ErrorMessage', failure)}")
+            failed.append(arn)
+    get_index().invalidate()
+    return failed
+
+
+def tag_deployment(record):
+    """Tag the service, target group and rules of a deployment record with its project and DeploymentId."""
+    ecs_client = clients.get_client('ecs')
+    services = [record['service_name']]
+    side_by_side = record.get('side_by_side')
+    if side_by_side:
+        services.append(side_by_side['service_name'])
+    arns = {service['serviceName']: service['serviceArn'] for service in ecs_client.describe_services(
+        cluster=record['ecs_cluster'], services=services)['services'] if service['status'] == 'ACTIVE'}
+
+    tags = resource_tags(record.get('project_name', record['service_name']), record['deployment_tag'])
+    failed = tag_resources([arn for arn in [arns.get(record['service_name']), record.get('target_group_arn')] +
+                            list(record.get('rules') or []) if arn], tags)
+    if side_by_side:
+        failed += tag_resources([arn for arn in [arns.get(side_by_side['service_name']),
+                                                 side_by_side['target_group_arn']] if arn],
+                                dict(tags, **{ROLE_TAG: SIDE_BY_SIDE_ROLE}))
+    return failed
+
+
+def _listener_arn(rule_arn):
+    # listener-rule/app/<lb>/<lb id>/<listener id>/<rule id> belongs to listener/app/<lb>/<lb id>/<listener id>
+    return rule_arn.replace(':listener-rule/', ':listener/', 1).rsplit('/', 1)[0]
+
+
+def find_deployment(target, deployment_id=None, index=None):
+    """Rebuild a deployment record from the tags of its resources, without any local file.
+
+    Args:
+        target (str): A project name, or the name of one of its services.
+        deployment_id (str): A DeploymentId tag. Defaults to the newest deployment with a service.
+
+    Returns:
+        dict: The record as `utils.save_deployment_info` writes it, or None when nothing is tagged.
+    """
+    index = index or get_index()
+    project_name = target if index.deployments(target) else index.project_of_service(target)
+    if project_name is None:
+        return None
+    deployments = {key: resources for key, resources in index.deployments(project_name).items()
+                   if key and resources['services']}
+    if not deployments:
+        return None
+    deployment_id = deployment_id or max(deployments)
+    resources = deployments.get(deployment_id)
+    if resources is None:
+        return None
+
+    # service/<cluster>/<name>, or service/<name> for services created before the long ARN format
+    path = resources['services'][0]['arn'].split(':', 5)[5].split('/')
+    cluster = path[1] if len(path) == 3 else config.ecs_cluster
+    ecs_client = clients.get_client('ecs')
+    services = [service for service in ecs_client.describe_services(
+        cluster=cluster, services=[service['arn'] for service in resources['services']])['services']
+        if service['status'] == 'ACTIVE']
+    roles = {service['arn']: service['tags'].get(ROLE_TAG) for service in resources['services']}
+    main = [service for service in services if roles.get(service['serviceArn']) != SIDE_BY_SIDE_ROLE]
+    side = [service for service in services if roles.get(service['serviceArn']) == SIDE_BY_SIDE_ROLE]
+    if not main:
+        return None
+    service = main[0]
+
+    rule_arns = [rule['arn'] for rule in resources['rules']]
+    domain_name = None
+    if rule_arns:
+        for rule in clients.get_client('elbv2').describe_rules(RuleArns=rule_arns)['Rules']:
+            for condition in rule.get('Conditions', []):
+                if condition['Field'] == 'host-header':
+                    domain_name = domain_name or (condition.get('HostHeaderConfig', {}).get('Values') or
+                                                  condition.get('Values', [None]))[0]
+
+    record = {
+        'ecs_cluster': cluster,
+        'service_name': service['serviceName'],
+        'project_name': project_name,
+        'task_definition_arn': service['taskDefinition'],
+        'target_group_arn': service['loadBalancers'][0]['targetGroupArn'] if service.get('loadBalancers') else None,
+        'listener_arn': _listener_arn(rule_arns[0]) if rule_arns else None,
+        'rules': rule_arns,
+        'domain_name': domain_name,
+        'cloudflare_api_token': config.cloudflare_api_token,
+        'cloudflare_zone_id': config.cloudflare_zone_id,
+        'alb_dns_name': config.alb_dns_name,
+        'deployment_tag': deployment_id,
+    }
+    if side:
+        created_at = side[0].get('createdAt')
+        task_definitions = [ecs_client.describe_task_definition(taskDefinition=arn)['taskDefinition']
+                            for arn in (service['taskDefinition'], side[0]['taskDefinition'])]
+        record['side_by_side'] = {
+            'service_name': side[0]['serviceName'],
+            'target_group_arn': side[0]['loadBalancers'][0]['targetGroupArn'],
+            'task_definition_arn': side[0]['taskDefinition'],
+            'rule_arn': rule_arns[0] if rule_arns else None,
+            'cpu_architecture': (task_definitions[1].get('runtimePlatform') or {}).get('cpuArchitecture') or 'X86_64',
+            'baseline_architecture': (task_definitions[0].get('runtimePlatform') or {}).get('cpuArchitecture') or 'X86_64',
+            # Without a creation time, comparisons cover their whole window
+            'started_at': created_at.timestamp() if created_at else 0,
+        }
+    return record
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Find deployments from the tags of their resources.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List the tagged projects and their deployments.")
+    find_parser = subparsers.add_parser('find', help="Rebuild the record of a deployment from its tags.")
+    find_parser.add_argument('target', help="Project or service name.")
+    find_parser.add_argument('--deployment-id', help="DeploymentId tag. Defaults to the newest deployment.")
+    find_parser.add_argument('--import', dest='import_record', action='store_true',
+                             help="Add the record to the deployment store.")
+    tag_parser = subparsers.add_parser('tag', help="Tag the resources of stored deployments that are not tagged yet.")
+    tag_parser.add_argument('targets', nargs='*', help="Service or project names. Defaults to every active deployment.")
+    args = parser.parse_args()
+
+    store = DeploymentStore()
+    if args.command == 'list':
+        index = get_index()
+        for project_name in index.projects():
+            for key, resources in sorted(index.deployments(project_name).items(), key=lambda item: item[0] or ''):
+                counts = ', '.join(f"{len(arns)} {kind}" for kind, arns in resources.items() if arns)
+                print(f"{project_name:<32} {key or '-':<48} {counts}")
+    elif args.command == 'find':
+        record = find_deployment(args.target, args.deployment_id)
+        if record is None:
+            print(f"Error: No tagged deployment found for '{args.target}'.")
+            sys.exit(1)
+        if args.import_record:
+            print(f"Deployment {store.add(record)} added to the store.")
+        print(json.dumps(record, indent=4))
+    else:
+        for record in store.find():
+            if record.get('deployment_tag') or \
+                    (args.targets and not {record['service_name'], record.get('project_name')} & set(args.targets)):
+                continue
+            created_at = time.strftime('%Y%m%d-%H%M%S', time.localtime(record['created_at']))
+            record['deployment_tag'] = deployment_tag(record.get('project_name', record['service_name']), created_at)
+            if not tag_deployment(record):
+                store.update_fields(record['deployment_id'], deployment_tag=record['deployment_tag'])
+                print(f"Tagged deployment {record['deployment_id']} as {record['deployment_tag']}.")
+
+
+if __name__ == '__main__':
+    main()
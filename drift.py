@@ -0,0 +1,230 @@
+import argparse
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import cloudflare
+import waiters
+from state_store import DeploymentStore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# describe_target_groups and describe_rules accept at most 20 ARNs per call
+ARN_BATCH_SIZE = 20
+DEFAULT_WORKERS = 8
+
+
+def describe_services(cluster, names):
+    """Return {name: service or None} for services of a cluster, 10 per describe_services call."""
+    ecs_client = clients.get_client('ecs')
+    found = {name: None for name in names}
+    try:
+        for batch in waiters.chunks(found, waiters.SERVICE_BATCH_SIZE):
+            for service in ecs_client.describe_services(cluster=cluster, services=batch)['services']:
+                found[service['serviceName']] = service
+    except ecs_client.exceptions.ClusterNotFoundException:
+        logger.warning(f"ECS cluster '{cluster}' not found.")
+    return found
+
+
+def _describe_by_arn(describe, arns, not_found):
+    """Describe resources by ARN, 20 per call. ARNs that do not exist map to None.
+
+    A call fails as a whole when one of its ARNs does not exist, so a failed
+    batch is split in halves until the missing ARNs are isolated.
+    """
+    found = {arn: None for arn in arns}
+
+    def describe_batch(batch):
+        try:
+            for arn, item in describe(batch):
+                found[arn] = item
+        except not_found:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                describe_batch(batch[:middle])
+                describe_batch(batch[middle:])
+
+    for batch in waiters.chunks(found, ARN_BATCH_SIZE):
+        describe_batch(batch)
+    return found
+
+
+def describe_target_groups(arns):
+    elbv2_client = clients.get_client('elbv2')
+    return _describe_by_arn(
+        lambda batch: [(group['TargetGroupArn'], group)
+                       for group in elbv2_client.describe_target_groups(TargetGroupArns=batch)['TargetGroups']],
+        arns, elbv2_client.exceptions.TargetGroupNotFoundException)
+
+
+def describe_rules(arns):
+    elbv2_client = clients.get_client('elbv2')
+    return _describe_by_arn(
+        lambda batch: [(rule['RuleArn'], rule) for rule in elbv2_client.describe_rules(RuleArns=batch)['Rules']],
+        arns, elbv2_client.exceptions.RuleNotFoundException)
+
+
+def zone_cnames(api_token, zone_id):
+    """Return {name: record} for the CNAME records of a Cloudflare zone, from a single fresh listing."""
+    records = cloudflare.get_client(api_token).list_records(zone_id, refresh=True)
+    return {record['name'].lower(): record for record in records if record['type'] == 'CNAME'}
+
+
+def _rule_target_groups(rule):
+    arns = set()
+    for action in rule.get('Actions', []):
+        if action.get('TargetGroupArn'):
+            arns.add(action['TargetGroupArn'])
+        for group in action.get('ForwardConfig', {}).get('TargetGroups', []):
+            arns.add(group['TargetGroupArn'])
+    return arns
+
+
+def _rule_hosts(rule):
+    hosts = []
+    for condition in rule.get('Conditions', []):
+        if condition.get('Field') == 'host-header':
+            hosts += condition.get('HostHeaderConfig', {}).get('Values') or condition.get('Values', [])
+    return [host.lower() for host in hosts]
+
+
+def _name(arn):
+    return arn.rsplit('/', 1)[-1] if arn else arn
+
+
+def check_record(record, services, target_groups, rules, zones):
+    """Compare one deployment record with the live state read by `scan`.
+
+    Returns:
+        list: (resource, resource ID, problem) tuples, empty when nothing drifted.
+    """
+    drifts = []
+    target_group_arn = record.get('target_group_arn')
+
+    service = services.get((record['ecs_cluster'], record['service_name']))
+    if service is None or service.get('status') == 'INACTIVE':
+        drifts.append(('service', record['service_name'], 'missing'))
+    else:
+        if service['status'] != 'ACTIVE':
+            drifts.append(('service', record['service_name'], f"status is {service['status']}"))
+        if record.get('task_definition_arn') and service['taskDefinition'] != record['task_definition_arn']:
+            drifts.append(('service', record['service_name'], f"runs {_name(service['taskDefinition'])} "
+                                                              f"instead of {_name(record['task_definition_arn'])}"))
+        attached = [balancer.get('targetGroupArn') for balancer in service.get('loadBalancers', [])]
+        if target_group_arn and target_group_arn not in attached:
+            drifts.append(('service', record['service_name'], "not attached to the recorded target group"))
+
+    if target_group_arn:
+        target_group = target_groups.get(target_group_arn)
+        if target_group is None:
+            drifts.append(('target_group', target_group_arn, 'missing'))
+        elif not target_group.get('LoadBalancerArns'):
+            drifts.append(('target_group', target_group_arn, 'not attached to a load balancer'))
+
+    for rule_arn in record.get('rules') or []:
+        rule = rules.get(rule_arn)
+        if rule is None:
+            drifts.append(('rule', rule_arn, 'missing'))
+            continue
+        forwards_to = _rule_target_groups(rule)
+        if target_group_arn and target_group_arn not in forwards_to:
+            drifts.append(('rule', rule_arn, f"forwards to {', '.join(sorted(map(_name, forwards_to))) or 'nothing'} "
+                                             f"instead of {_name(target_group_arn)}"))
+        hosts = _rule_hosts(rule)
+        if record.get('domain_name') and record['domain_name'].lower() not in hosts:
+            drifts.append(('rule', rule_arn, f"matches {', '.join(hosts) or 'no host'} instead of {record['domain_name']}"))
+
+    zone_key = (record.get('cloudflare_api_token'), record.get('cloudflare_zone_id'))
+    if record.get('domain_name') and zone_key[1]:
+        cnames = zones.get(zone_key)
+        cname = cnames.get(record['domain_name'].rstrip('.').lower()) if cnames is not None else None
+        if cnames is None:
+            drifts.append(('cname', record['domain_name'], f"zone {zone_key[1]} could not be read"))
+        elif cname is None:
+            drifts.append(('cname', record['domain_name'], 'missing'))
+        elif record.get('alb_dns_name') and \
+                cname['content'].rstrip('.').lower() != record['alb_dns_name'].rstrip('.').lower():
+            drifts.append(('cname', record['domain_name'], f"points to {cname['content']} "
+                                                           f"instead of {record['alb_dns_name']}"))
+    return drifts
+
+
+def scan(records, workers=DEFAULT_WORKERS):
+    """Check deployment records against the live ECS, ELBv2 and Cloudflare state.
+
+    All the reads are batched: services 10 per call for each cluster, target
+    groups and rules 20 ARNs per call, and one listing per Cloudflare zone.
+    Clusters, load balancer reads and zones are read concurrently.
+
+    Returns:
+        list: One dict per record with 'record' and 'drifts', see `check_record`.
+    """
+    clusters = {}
+    target_group_arns, rule_arns, zone_keys = set(), set(), set()
+    for record in records:
+        clusters.setdefault(record['ecs_cluster'], set()).add(record['service_name'])
+        if record.get('target_group_arn'):
+            target_group_arns.add(record['target_group_arn'])
+        rule_arns.update(record.get('rules') or [])
+        if record.get('domain_name') and record.get('cloudflare_zone_id'):
+            zone_keys.add((record.get('cloudflare_api_token'), record['cloudflare_zone_id']))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        service_futures = {cluster: executor.submit(describe_services, cluster, sorted(names))
+                           for cluster, names in clusters.items()}
+        target_groups_future = executor.submit(describe_target_groups, sorted(target_group_arns))
+        rules_future = executor.submit(describe_rules, sorted(rule_arns))
+        zone_futures = {key: executor.submit(zone_cnames, *key) for key in zone_keys}
+
+        services = {}
+        for cluster, future in service_futures.items():
+            services.update({(cluster, name): service for name, service in future.result().items()})
+        target_groups = target_groups_future.result()
+        rules = rules_future.result()
+        zones = {}
+        for key, future in zone_futures.items():
+            try:
+                zones[key] = future.result()
+            except cloudflare.CloudflareError as e:
+                logger.error(f"Error listing the records of zone {key[1]}: {e}")
+
+    return [{'record': record, 'drifts': check_record(record, services, target_groups, rules, zones)}
+            for record in records]
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Compare the deployment records with the live AWS and Cloudflare state.")
+    parser.add_argument('--service', help="Only the deployments of this service.")
+    parser.add_argument('--cluster', help="Only the deployments in this cluster.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Concurrent reads.")
+    parser.add_argument('--json', action='store_true', help="Print the drifts as JSON.")
+    args = parser.parse_args()
+
+    records = DeploymentStore().find(args.service, cluster=args.cluster)
+    results = scan(records, args.workers)
+    drifted = [result for result in results if result['drifts']]
+
+    if args.json:
+        print(json.dumps([{'deployment_id': result['record'].get('deployment_id'),
+                           'service_name': result['record']['service_name'],
+                           'drifts': [{'resource': resource, 'id': resource_id, 'problem': problem}
+                                      for resource, resource_id, problem in result['drifts']]}
+                          for result in drifted], indent=4))
+    else:
+        print(f"{'DEPLOYMENT':>10}  {'SERVICE':<32} {'RESOURCE':<13} PROBLEM")
+        for result in drifted:
+            record = result['record']
+            for resource, resource_id, problem in result['drifts']:
+                print(f"{record.get('deployment_id', ''):>10}  {record['service_name']:<32} {resource:<13} "
+                      f"{_name(resource_id)}: {problem}")
+        print(f"{len(drifted)} of {len(results)} deployments drifted.")
+    if drifted:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
+import tracing
+import utils
+import main as deploy
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def load_manifest(file_path):
+    """Load the fleet manifest.
+
+    The manifest is a JSON file of the form
+    {"projects": [{"project_name": ..., "domain_name": ..., "image_tag": ..., "repo_uri": ...,
+    "cpu_architecture": ...}]}.
+    `image_tag` defaults to IMAGE_TAG, `repo_uri` to the ECR_REPO_URI registry
+    with the project name as repository and `cpu_architecture` to CPU_ARCHITECTURE.
+    """
+    with open(file_path, 'r') as f:
+        manifest = json.load(f)
+
+    registry = config.repo_uri.rsplit('/', 1)[0]
+    projects = []
+    for entry in manifest['projects']:
+        project_name = entry['project_name']
+        projects.append(config.project_settings(
+            project_name,
+            entry['domain_name'],
+            entry.get('image_tag', config.image_tag),
+            entry.get('repo_uri', f'{registry}/{project_name}'),
+            entry.get('cpu_architecture')
+        ))
+
+    names = [project['project_name'] for project in projects]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate projects in manifest: {', '.join(duplicates)}")
+    return projects
+
+def deploy_project(project, listener_arn, step_workers):
+    start_time = time.perf_counter()
+    try:
+        with tracing.span(f"deploy {project['project_name']}"):
+            result = deploy.main(project, listener_arn, max_workers=step_workers)
+        errors = [f"{name}: {error}" for name, error in result.failed.items()]
+        errors += [f"{name}: skipped" for name in result.skipped]
+    except Exception as e:
+        errors = [str(e)]
+    return {
+        'project_name': project['project_name'],
+        'ok': not errors,
+        'errors': errors,
+        'elapsed': time.perf_counter() - start_time
+    }
+
+def deploy_fleet(projects, concurrency=4, step_workers=4):
+    """Deploy many projects sharing the same ALB and cluster.
+
+    The HTTPS listener is looked up once and shared by every worker. Rule
+    priorities come from the listener's shared `priorities.PriorityAllocator`.
+
+    Args:
+        projects (list): Project settings built by `config.project_settings`.
+        concurrency (int): Maximum number of projects deployed at the same time.
+        step_workers (int): Maximum number of steps run at the same time per project.
+
+    Returns:
+        list: One summary dict per project, in manifest order.
+    """
+    listener_arn = utils.get_https_listener_arn(config.alb_arn)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(deploy_project, project, listener_arn, step_workers) for project in projects]
+        return [future.result() for future in futures]
+
+def print_summary(summaries):
+    print(f"{'PROJECT':<32} {'STATUS':<8} {'TIME':>8}  ERRORS")
+    for summary in summaries:
+        status = 'ok' if summary['ok'] else 'failed'
+        print(f"{summary['project_name']:<32} {status:<8} {summary['elapsed']:>7.1f}s  {'; '.join(summary['errors'])}")
+    failed = sum(1 for summary in summaries if not summary['ok'])
+    print(f"{len(summaries) - failed} succeeded, {failed} failed.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Deploy many projects from one manifest.")
+    parser.add_argument('manifest', help="Path to the fleet manifest JSON file.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Maximum number of projects deployed at once.")
+    parser.add_argument('--step-workers', type=int, default=4, help="Maximum number of steps run at once per project.")
+    parser.add_argument('--trace', metavar='FILE', help="Write a Chrome trace of the deploys to FILE and print a latency summary.")
+    args = parser.parse_args()
+
+    try:
+        projects = load_manifest(args.manifest)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Invalid fleet manifest: {e}")
+        sys.exit(1)
+
+    tracer = tracing.start() if args.trace else None
+    summaries = deploy_fleet(projects, args.concurrency, args.step_workers)
+    print_summary(summaries)
+    if tracer:
+        tracer.export_chrome_trace(args.trace)
+        print(tracer.format_summary())
+    if not all(summary['ok'] for summary in summaries):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
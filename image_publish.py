@@ -0,0 +1,393 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MANIFEST_MEDIA_TYPE = 'application/vnd.oci.image.manifest.v1+json'
+CONFIG_MEDIA_TYPE = 'application/vnd.oci.image.config.v1+json'
+LAYER_MEDIA_TYPE = 'application/vnd.oci.image.layer.v1.tar+gzip'
+# Layers `docker save` already compressed, e.g. with the containerd image store, by magic bytes
+COMPRESSED_LAYER_TYPES = {
+    b'\x1f\x8b': LAYER_MEDIA_TYPE,
+    b'\x28\xb5\x2f\xfd': 'application/vnd.oci.image.layer.v1.tar+zstd',
+}
+INDEX_MEDIA_TYPE = 'application/vnd.oci.image.index.v1+json'
+ACCEPTED_MANIFEST_TYPES = [
+    MANIFEST_MEDIA_TYPE,
+    'application/vnd.docker.distribution.manifest.v2+json',
+    INDEX_MEDIA_TYPE,
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+]
+# ECS runtimePlatform cpuArchitecture to the architecture of image platforms
+ARCHITECTURES = {'X86_64': 'amd64', 'ARM64': 'arm64'}
+# batch_check_layer_availability accepts at most 100 digests per call
+LAYER_CHECK_BATCH_SIZE = 100
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def repository_name(repo_uri):
+    return repo_uri.split('/', 1)[1]
+
+
+class ImageArchitectureError(Exception):
+    pass
+
+
+def remote_manifest(ecr, repo_name, tag=None, digest=None):
+    """Return (image digest, manifest dict) of a tag or digest in ECR, or (None, None) when it does not exist."""
+    response = ecr.batch_get_image(
+        repositoryName=repo_name,
+        imageIds=[{'imageTag': tag} if digest is None else {'imageDigest': digest}],
+        acceptedMediaTypes=ACCEPTED_MANIFEST_TYPES
+    )
+    if not response['images']:
+        return None, None
+    image = response['images'][0]
+    return image['imageId']['imageDigest'], json.loads(image['imageManifest'])
+
+
+def is_published(local_image, repo_uri, remote_digest, manifest):
+    """Check whether ECR already holds the local image under the tag.
+
+    The local image ID is the digest of its config, which the remote manifest
+    references, so a match means the same config and layers. A RepoDigests
+    entry left by an earlier `docker push` is accepted too.
+    """
+    if remote_digest is None:
+        return False
+    if manifest and manifest.get('config', {}).get('digest') == local_image.id:
+        return True
+    return f'{repo_uri}@{remote_digest}' in local_image.attrs.get('RepoDigests', [])
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return f'sha256:{digest.hexdigest()}'
+
+
+def _compressed_media_type(layer):
+    """Media type of a layer that is already compressed, or None for a plain tar."""
+    head = layer.read(4)
+    return next((media_type for magic, media_type in COMPRESSED_LAYER_TYPES.items() if head.startswith(magic)), None)
+
+
+def export_image(local_image, work_dir):
+    """Save a local image and turn it into OCI blobs.
+
+    Uncompressed layers are gzipped with a fixed timestamp, so the same image
+    always gives the same digests. Layers that are already compressed are kept
+    as they are, so their digests match those of the registry they came from.
+
+    Returns:
+        tuple: (manifest bytes, dict of blob digest to file path)
+    """
+    archive_path = os.path.join(work_dir, 'image.tar')
+    with open(archive_path, 'wb') as f:
+        for chunk in local_image.save(named=False):
+            f.write(chunk)
+
+    blobs = {}
+    with tarfile.open(archive_path) as archive:
+        image_manifest = json.load(archive.extractfile('manifest.json'))[0]
+
+        config_path = os.path.join(work_dir, 'config.json')
+        with open(config_path, 'wb') as f:
+            shutil.copyfileobj(archive.extractfile(image_manifest['Config']), f)
+        config_digest = _sha256_file(config_path)
+        blobs[config_digest] = config_path
+
+        layers = []
+        for index, layer_name in enumerate(image_manifest['Layers']):
+            layer_path = os.path.join(work_dir, f'layer{index}')
+            media_type = _compressed_media_type(archive.extractfile(layer_name))
+            with open(layer_path, 'wb') as f:
+                if media_type:
+                    shutil.copyfileobj(archive.extractfile(layer_name), f, READ_CHUNK_SIZE)
+                else:
+                    media_type = LAYER_MEDIA_TYPE
+                    with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as compressed:
+                        shutil.copyfileobj(archive.extractfile(layer_name), compressed, READ_CHUNK_SIZE)
+            layer_digest = _sha256_file(layer_path)
+            blobs[layer_digest] = layer_path
+            layers.append({'mediaType': media_type, 'size': os.path.getsize(layer_path), 'digest': layer_digest})
+    os.remove(archive_path)
+
+    manifest = {
+        'schemaVersion': 2,
+        'mediaType': MANIFEST_MEDIA_TYPE,
+        'config': {'mediaType': CONFIG_MEDIA_TYPE, 'size': os.path.getsize(config_path), 'digest': config_digest},
+        'layers': layers
+    }
+    return json.dumps(manifest, separators=(',', ':')).encode(), blobs
+
+
+def missing_blobs(ecr, repo_name, digests):
+    """Return the digests ECR does not hold yet, checked 100 at a time."""
+    missing = []
+    digests = list(digests)
+    for i in range(0, len(digests), LAYER_CHECK_BATCH_SIZE):
+        response = ecr.batch_check_layer_availability(repositoryName=repo_name,
+                                                      layerDigests=digests[i:i + LAYER_CHECK_BATCH_SIZE])
+        missing += [layer['layerDigest'] for layer in response['layers'] if layer['layerAvailability'] != 'AVAILABLE']
+        missing += [failure['layerDigest'] for failure in response.get('failures', [])]
+    return missing
+
+
+class UploadProgress:
+    def __init__(self, total_bytes, label):
+        self.total_bytes = total_bytes
+        self.label = label
+        self.sent_bytes = 0
+        self._lock = threading.Lock()
+        self._last_logged = 0
+
+    def add(self, sent):
+        with self._lock:
+            self.sent_bytes += sent
+            percent = int(self.sent_bytes * 100 / self.total_bytes) if self.total_bytes else 100
+            if percent >= self._last_logged + 10 or self.sent_bytes == self.total_bytes:
+                self._last_logged = percent
+                logger.info(f"{self.label}: uploaded {self.sent_bytes / 1024 / 1024:.1f} of "
+                            f"{self.total_bytes / 1024 / 1024:.1f} MiB ({percent}%)")
+
+
+def upload_blob(ecr, repo_name, digest, path, progress):
+    upload = ecr.initiate_layer_upload(repositoryName=repo_name)
+    upload_id, part_size = upload['uploadId'], upload['partSize']
+    first_byte = 0
+    with open(path, 'rb') as f:
+        for part in iter(lambda: f.read(part_size), b''):
+            ecr.upload_layer_part(
+                repositoryName=repo_name,
+                uploadId=upload_id,
+                partFirstByte=first_byte,
+                partLastByte=first_byte + len(part) - 1,
+                layerPartBlob=part
+            )
+            first_byte += len(part)
+            progress.add(len(part))
+    try:
+        ecr.complete_layer_upload(repositoryName=repo_name, uploadId=upload_id, layerDigests=[digest])
+    except ecr.exceptions.LayerAlreadyExistsException:
+        pass
+
+
+def push_manifest(ecr, local_image, repo_uri, tag=None, max_workers=4):
+    """Upload the blobs ECR is missing for a local image and write its manifest, untagged when `tag` is None.
+
+    Returns:
+        tuple: (manifest digest, manifest size, number of blobs uploaded)
+    """
+    repo_name = repository_name(repo_uri)
+    label = f'{repo_uri}:{tag}' if tag else f'{repo_uri} ({local_image.id[:19]})'
+    work_dir = tempfile.mkdtemp(prefix='image-publish-')
+    try:
+        manifest_bytes, blobs = export_image(local_image, work_dir)
+        missing = missing_blobs(ecr, repo_name, blobs)
+        total_bytes = sum(os.path.getsize(blobs[digest]) for digest in missing)
+        logger.info(f"{label}: {len(missing)} of {len(blobs)} blobs missing "
+                    f"({total_bytes / 1024 / 1024:.1f} MiB to upload).")
+
+        progress = UploadProgress(total_bytes, label)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(upload_blob, ecr, repo_name, digest, blobs[digest], progress) for digest in missing]
+            for future in futures:
+                future.result()
+
+        kwargs = {'imageTag': tag} if tag else {}
+        try:
+            digest = ecr.put_image(
+                repositoryName=repo_name,
+                imageManifest=manifest_bytes.decode(),
+                imageManifestMediaType=MANIFEST_MEDIA_TYPE,
+                **kwargs
+            )['image']['imageId']['imageDigest']
+        except ecr.exceptions.ImageAlreadyExistsException:
+            digest = f'sha256:{hashlib.sha256(manifest_bytes).hexdigest()}'
+        return digest, len(manifest_bytes), len(missing)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def publish_image(ecr, docker_client, image_name, repo_uri, tag, max_workers=4):
+    """Push a local image to ECR unless the tag already holds it.
+
+    Only the layers ECR does not have are uploaded, several at a time, through
+    the ECR layer upload API, so no `docker login` is needed.
+
+    Returns:
+        str: 'unchanged', 'tagged' when only the manifest was written, or 'pushed'.
+    """
+    repo_name = repository_name(repo_uri)
+    local_image = docker_client.images.get(image_name)
+    remote_digest, manifest = remote_manifest(ecr, repo_name, tag)
+    if is_published(local_image, repo_uri, remote_digest, manifest):
+        logger.info(f"{repo_uri}:{tag} already holds image {local_image.id}. Skipping push.")
+        return 'unchanged'
+
+    _, _, uploaded = push_manifest(ecr, local_image, repo_uri, tag, max_workers)
+    logger.info(f"Image {image_name} published to {repo_uri}:{tag}.")
+    return 'pushed' if uploaded else 'tagged'
+
+
+def build_image(docker_client, context, image_name, platform):
+    """Build an image for one platform, e.g. 'linux/arm64'.
+
+    Building for another architecture than the host's needs QEMU emulation
+    registered with binfmt_misc, e.g. by `docker run --privileged tonistiigi/binfmt --install all`.
+    """
+    image, _ = docker_client.images.build(path=context, tag=image_name, platform=platform, rm=True)
+    logger.info(f"Built {image_name} for {platform}.")
+    return image
+
+
+def image_platform(local_image):
+    platform = {'architecture': local_image.attrs['Architecture'], 'os': local_image.attrs.get('Os', 'linux')}
+    if local_image.attrs.get('Variant'):
+        platform['variant'] = local_image.attrs['Variant']
+    return platform
+
+
+def _index_children(ecr, repo_name, manifest):
+    """Map the architecture of each platform of an image index to the config digest of its manifest."""
+    children = {}
+    for entry in manifest.get('manifests', []):
+        architecture = entry.get('platform', {}).get('architecture')
+        if architecture in (None, 'unknown'):
+            continue
+        _, child = remote_manifest(ecr, repo_name, digest=entry['digest'])
+        children[architecture] = (child or {}).get('config', {}).get('digest')
+    return children
+
+
+def publish_multiarch(ecr, docker_client, image_names, repo_uri, tag, max_workers=4):
+    """Push single-platform local images and tag an image index (manifest list) referencing all of them.
+
+    Each image is pushed untagged, by digest, then the tag is pointed at an
+    OCI image index listing their platforms, so every architecture pulls
+    the image built for it. The platforms are read from the local images.
+
+    Args:
+        image_names (list): Local images, one per platform, e.g. from `build_image`.
+
+    Returns:
+        str: 'unchanged' when the tag already lists the same images, 'tagged' or 'pushed'.
+    """
+    repo_name = repository_name(repo_uri)
+    local_images = [docker_client.images.get(name) for name in image_names]
+    platforms = [image_platform(image) for image in local_images]
+    architectures = [platform['architecture'] for platform in platforms]
+    if len(set(architectures)) != len(architectures):
+        raise ValueError(f"Several images for one architecture: {', '.join(architectures)}")
+
+    _, manifest = remote_manifest(ecr, repo_name, tag)
+    if manifest and manifest.get('manifests') and \
+            _index_children(ecr, repo_name, manifest) == {p['architecture']: i.id for p, i in zip(platforms, local_images)}:
+        logger.info(f"{repo_uri}:{tag} already lists these images for {', '.join(architectures)}. Skipping push.")
+        return 'unchanged'
+
+    with ThreadPoolExecutor(max_workers=len(local_images)) as executor:
+        pushed = list(executor.map(lambda image: push_manifest(ecr, image, repo_uri, max_workers=max_workers),
+                                   local_images))
+    index = {
+        'schemaVersion': 2,
+        'mediaType': INDEX_MEDIA_TYPE,
+        'manifests': [{
+            'mediaType': MANIFEST_MEDIA_TYPE,
+            'size': size,
+            'digest': digest,
+            'platform': platform
+        } for (digest, size, _), platform in zip(pushed, platforms)]
+    }
+    try:
+        ecr.put_image(
+            repositoryName=repo_name,
+            imageManifest=json.dumps(index, separators=(',', ':')),
+            imageManifestMediaType=INDEX_MEDIA_TYPE,
+            imageTag=tag
+        )
+    except ecr.exceptions.ImageAlreadyExistsException:
+        pass
+    logger.info(f"{repo_uri}:{tag} published for {', '.join(architectures)}.")
+    return 'pushed' if any(uploaded for _, _, uploaded in pushed) else 'tagged'
+
+
+def _image_config(ecr, repo_name, config_digest):
+    import requests
+    url = ecr.get_download_url_for_layer(repositoryName=repo_name, layerDigest=config_digest)['downloadUrl']
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def image_architectures(ecr, repo_uri, tag):
+    """Return the architectures an ECR image can run on, e.g. {'amd64', 'arm64'}, or None when the tag does not exist.
+
+    Those of an image index are listed in it. A single-platform image only
+    names its architecture in its config blob, which is downloaded.
+    """
+    repo_name = repository_name(repo_uri)
+    _, manifest = remote_manifest(ecr, repo_name, tag)
+    if manifest is None:
+        return None
+    if 'manifests' in manifest:
+        return {entry['platform']['architecture'] for entry in manifest['manifests']
+                if entry.get('platform', {}).get('architecture') not in (None, 'unknown')}
+    return {_image_config(ecr, repo_name, manifest['config']['digest']).get('architecture')}
+
+
+def check_architecture(ecr, task_definition):
+    """Raise ImageArchitectureError unless the ECR images of a task definition run on its CPU architecture.
+
+    `task_definition` holds the arguments of register_task_definition. Images
+    outside ECR, or in another region than the client's, are not checked.
+    """
+    cpu_architecture = (task_definition.get('runtimePlatform') or {}).get('cpuArchitecture') or 'X86_64'
+    architecture = ARCHITECTURES[cpu_architecture]
+    region = ecr.meta.region_name
+    for container_definition in task_definition['containerDefinitions']:
+        image = container_definition['image']
+        if f'.dkr.ecr.{region}.' not in image or '@' in image:
+            logger.warning(f"Image {image} is not a tagged image of ECR in {region}. Its architecture is not checked.")
+            continue
+        repo_uri, tag = image.rsplit(':', 1) if ':' in image.rsplit('/', 1)[-1] else (image, 'latest')
+        architectures = image_architectures(ecr, repo_uri, tag)
+        if architectures is None:
+            raise ImageArchitectureError(f"Image {image} does not exist.")
+        if architecture not in architectures:
+            raise ImageArchitectureError(f"Image {image} is built for {', '.join(sorted(architectures))}, "
+                                         f"not {architecture} ({cpu_architecture}).")
+        logger.info(f"Image {image} runs on {cpu_architecture}.")
+
+
+def publish_images(ecr, docker_client, jobs, max_workers=4, layer_workers=4):
+    """Publish several (image name, repository URI, tag) jobs in parallel.
+
+    Returns:
+        dict: (repository URI, tag) to the result of `publish_image`, or the exception raised.
+    """
+    results = {}
+
+    def run(job):
+        image_name, repo_uri, tag = job
+        try:
+            results[(repo_uri, tag)] = publish_image(ecr, docker_client, image_name, repo_uri, tag, layer_workers)
+        except Exception as e:
+            logger.error(f"Error publishing {image_name} to {repo_uri}:{tag}: {e}")
+            results[(repo_uri, tag)] = e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(run, jobs))
+    return results
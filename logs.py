@@ -0,0 +1,249 @@
+import argparse
+import heapq
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import clients
+import config
+from state_store import DEPLOYMENTS_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CURSOR_PATH = os.path.join(DEPLOYMENTS_DIR, 'log_cursors.json')
+# filter_log_events accepts at most 100 stream names
+MAX_STREAMS_PER_CALL = 100
+DEFAULT_SHARDS = 4
+# Events buffered per shard, which bounds the memory of a search
+DEFAULT_BUFFER = 1000
+FOLLOW_INTERVAL = 5
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_DONE = object()
+
+
+def parse_duration(value):
+    """Seconds in a duration such as '90s', '15m', '2h' or '7d'."""
+    match = re.fullmatch(r'(\d+)([smhd])', value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration '{value}'. Use a number followed by s, m, h or d.")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def task_streams(cluster, service=None, task_ids=None, log_group=None):
+    """Return the log stream names of a service's running and recently stopped tasks, or of given tasks."""
+    ecs_client = clients.get_client('ecs')
+    log_group = log_group or config.log_group
+    task_arns = []
+    if service:
+        paginator = ecs_client.get_paginator('list_tasks')
+        for status in ('RUNNING', 'STOPPED'):
+            for page in paginator.paginate(cluster=cluster, serviceName=service, desiredStatus=status):
+                task_arns += page['taskArns']
+    task_arns += task_ids or []
+
+    streams = []
+    definitions = {}
+    for i in range(0, len(task_arns), 100):
+        for task in ecs_client.describe_tasks(cluster=cluster, tasks=task_arns[i:i + 100])['tasks']:
+            arn = task['taskDefinitionArn']
+            if arn not in definitions:
+                definitions[arn] = ecs_client.describe_task_definition(taskDefinition=arn)['taskDefinition']
+            task_id = task['taskArn'].rsplit('/', 1)[-1]
+            for container in definitions[arn]['containerDefinitions']:
+                options = container.get('logConfiguration', {}).get('options', {})
+                if options.get('awslogs-group') == log_group and options.get('awslogs-stream-prefix'):
+                    streams.append(f"{options['awslogs-stream-prefix']}/{container['name']}/{task_id}")
+    return list(dict.fromkeys(streams))
+
+
+def _filter_events(log_group, start, end, streams=None, prefix=None, pattern=None):
+    """Yield the events of one paginated filter_log_events query. Times are in epoch milliseconds."""
+    logs_client = clients.get_client('logs')
+    kwargs = {'logGroupName': log_group, 'startTime': start, 'endTime': end}
+    if streams:
+        kwargs['logStreamNames'] = streams
+    elif prefix:
+        kwargs['logStreamNamePrefix'] = prefix
+    if pattern:
+        kwargs['filterPattern'] = pattern
+    while True:
+        response = logs_client.filter_log_events(**kwargs)
+        yield from response['events']
+        if not response.get('nextToken'):
+            return
+        kwargs['nextToken'] = response['nextToken']
+
+
+def _prefetch(events, buffer, stop):
+    """Run an event iterator on a background thread, at most `buffer` events ahead of the consumer."""
+    results = queue.Queue(maxsize=buffer)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for event in events:
+                if not put(event):
+                    return
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = results.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def search(log_group=None, start=None, end=None, streams=None, prefix=None, pattern=None, shards=DEFAULT_SHARDS,
+           buffer=DEFAULT_BUFFER):
+    """Yield matching log events in timestamp order, fetched concurrently.
+
+    With stream names, each group of up to 100 streams is one shard. Otherwise
+    the time range is split into `shards` windows. Shards are paginated on
+    their own threads and merged, and each runs at most `buffer` events ahead,
+    so memory stays bounded however many events match.
+
+    Args:
+        log_group (str): Defaults to `config.log_group`.
+        start (float): Epoch seconds. Defaults to one hour ago.
+        end (float): Epoch seconds. Defaults to now.
+        streams (list): Log stream names to read.
+        prefix (str): Log stream name prefix, when no stream names are given.
+        pattern (str): A CloudWatch Logs filter pattern.
+    """
+    log_group = log_group or config.log_group
+    end = time.time() if end is None else end
+    start = end - 3600 if start is None else start
+    if streams is not None and not streams:
+        return
+
+    start_ms, end_ms = int(round(start * 1000)), int(round(end * 1000))
+    if streams:
+        queries = [(start_ms, end_ms, streams[i:i + MAX_STREAMS_PER_CALL])
+                   for i in range(0, len(streams), MAX_STREAMS_PER_CALL)]
+    else:
+        shards = max(1, min(shards, end_ms - start_ms + 1))
+        bounds = [start_ms + (end_ms - start_ms + 1) * i // shards for i in range(shards + 1)]
+        # endTime is inclusive, so each window stops one millisecond before the next one starts
+        queries = [(bounds[i], bounds[i + 1] - 1, None) for i in range(shards)]
+
+    stop = threading.Event()
+    try:
+        shard_events = [_prefetch(_filter_events(log_group, shard_start, shard_end, shard_streams, prefix, pattern),
+                                  buffer, stop) for shard_start, shard_end, shard_streams in queries]
+        yield from heapq.merge(*shard_events, key=lambda event: (event['timestamp'], event['eventId']))
+    finally:
+        stop.set()
+
+
+def load_cursors(path=DEFAULT_CURSOR_PATH):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_cursor(name, cursor, path=DEFAULT_CURSOR_PATH):
+    cursors = load_cursors(path)
+    cursors[name] = cursor
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cursors, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def follow(cursor_name, start, streams_for_poll, log_group=None, prefix=None, pattern=None, interval=FOLLOW_INTERVAL,
+           cursor_path=DEFAULT_CURSOR_PATH, shards=DEFAULT_SHARDS, sleep=time.sleep):
+    """Yield new events forever, resuming from the cursor saved under `cursor_name`.
+
+    The cursor keeps the timestamp of the last event and the IDs of the events
+    seen at that timestamp, so a poll only fetches what is new and never repeats
+    an event.
+
+    Args:
+        streams_for_poll (callable): Returns the stream names to read, or None to use `prefix`.
+            Called on each poll, so tasks started later are picked up.
+    """
+    cursor = load_cursors(cursor_path).get(cursor_name) or {'timestamp': int(start * 1000), 'event_ids': []}
+    while True:
+        seen = set(cursor['event_ids'])
+        for event in search(log_group, cursor['timestamp'] / 1000, None, streams_for_poll(), prefix, pattern, shards):
+            if event['eventId'] in seen:
+                continue
+            if event['timestamp'] > cursor['timestamp']:
+                cursor = {'timestamp': event['timestamp'], 'event_ids': []}
+                seen = set()
+            cursor['event_ids'].append(event['eventId'])
+            seen.add(event['eventId'])
+            yield event
+        save_cursor(cursor_name, cursor, cursor_path)
+        sleep(interval)
+
+
+def format_event(event):
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['timestamp'] / 1000))
+    return f"{stamp}.{event['timestamp'] % 1000:03d} {event['logStreamName']} {event['message'].rstrip()}"
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Search or follow the container logs.")
+    parser.add_argument('--service', help="Only the tasks of this ECS service.")
+    parser.add_argument('--task', action='append', help="Only this task ID or ARN. Can be repeated.")
+    parser.add_argument('--container', help="Only the streams of this container.")
+    parser.add_argument('--cluster', help="Defaults to ECS_CLUSTER.")
+    parser.add_argument('--log-group', help="Defaults to the group of the task definitions.")
+    parser.add_argument('--filter', help="CloudWatch Logs filter pattern, e.g. '?ERROR ?Exception'.")
+    parser.add_argument('--since', default='1h', help="How far back to start, e.g. 15m, 2h, 7d.")
+    parser.add_argument('--until', help="How far back to stop, e.g. 10m. Defaults to now.")
+    parser.add_argument('--follow', '-f', action='store_true', help="Keep printing new events.")
+    parser.add_argument('--cursor', help="Name of the saved position to resume following from.")
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS, help="Concurrent queries.")
+    args = parser.parse_args()
+
+    cluster = args.cluster or (config.ecs_cluster if args.service or args.task else None)
+    log_group = args.log_group or config.log_group
+    prefix = f'ecs/{args.container}/' if args.container else None
+
+    def streams():
+        if not (args.service or args.task):
+            return None
+        names = task_streams(cluster, args.service, args.task, log_group)
+        return [name for name in names if not prefix or name.startswith(prefix)]
+
+    now = time.time()
+    start = now - parse_duration(args.since)
+    try:
+        if args.follow:
+            cursor_name = args.cursor or json.dumps([log_group, args.service, args.task, args.container, args.filter])
+            events = follow(cursor_name, start, streams, log_group, prefix, args.filter, shards=args.shards)
+        else:
+            end = now - parse_duration(args.until) if args.until else now
+            events = search(log_group, start, end, streams(), prefix, args.filter, args.shards)
+        for event in events:
+            print(format_event(event), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,152 @@
+import argparse
 import logging
 import time
+import clients
 import utils
 import config
+import discovery
+import tracing
+import plan as planner
+from pipeline import Step, run_pipeline, PipelineResult
+from state_store import DeploymentStore
+from task_index import TaskDefinitionIndex
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def main():
-    utils.create_log_group(config.log_group)
-    target_group_arn = utils.create_target_group()
-    if target_group_arn:
-        listener_response = utils.elbv2_client.describe_listeners(LoadBalancerArn=config.alb_arn)
-        https_listener_arn = next(listener['ListenerArn'] for listener in listener_response['Listeners'] if listener['Port'] == 443)
-        rules_list = []
-        utils.create_rule(https_listener_arn, target_group_arn, config.domain_name, rules_list)
-        task_definition_arn = utils.register_task_definition()
-        if task_definition_arn:
-            utils.create_ecs_service(task_definition_arn, target_group_arn)
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            utils.create_cname_record_cloudflare(config.cloudflare_api_token, config.cloudflare_zone_id, config.domain_name, config.alb_dns_name)
-            utils.save_deployment_info(task_definition_arn, target_group_arn, https_listener_arn, rules_list, timestamp)
+def _require(value, what, action='created'):
+    # The utils functions log their errors and return None or False, which fails the step
+    if not value:
+        raise RuntimeError(f"{what} was not {action}.")
+    return value
+
+def _task_definition(plan, project):
+    if plan.action('task_definition') == planner.NOOP:
+        return plan.live['task_definition']['taskDefinitionArn']
+
+    # Reuse an existing revision with the same spec before registering a new one
+    family = project['task_family_name']
+    index = TaskDefinitionIndex(clients.get_client('ecs'))
+    index.sync(family)
+    existing = index.find(utils.desired_task_definition(project))
+    if existing:
+        logger.info(f"Using existing task definition: {existing}")
+        return existing
+    return _require(utils.register_task_definition(project), 'Task definition')
+
+def _rule(plan, listener_arn, target_group_arn, rules_list, tags):
+    rule = plan.live['rule']
+    if plan.action('rule') == planner.CREATE:
+        _require(utils.create_rule(listener_arn, target_group_arn, plan.project['domain_name'], rules_list, tags), 'Rule')
+        return rules_list
+    if plan.action('rule') == planner.UPDATE:
+        _require(utils.update_rule_target(rule['RuleArn'], target_group_arn), 'Rule', 'updated')
+    rules_list.append(rule['RuleArn'])
+    return rules_list
+
+def _service(plan, task_definition_arn, target_group_arn, tags):
+    if plan.action('service') == planner.CREATE:
+        _require(utils.create_ecs_service(task_definition_arn, target_group_arn, plan.project, tags),
+                 'ECS service', 'created and stable')
+    elif plan.action('service') == planner.UPDATE:
+        _require(utils.update_ecs_service(task_definition_arn, plan.project, plan.live['service']['serviceName']),
+                 'ECS service', 'updated and stable')
+
+def _live_record(plan):
+    if plan.action('service') == planner.CREATE:
+        return None
+    return DeploymentStore().latest(domain_name=plan.project['domain_name'], cluster=config.ecs_cluster)
+
+def _save(plan, record, task_definition_arn, target_group_arn, listener_arn, rules_list, timestamp, deployment_tag):
+    project = plan.project
+    if record:
+        DeploymentStore().update_fields(record['deployment_id'], task_definition_arn=task_definition_arn,
+                                        target_group_arn=target_group_arn, listener_arn=listener_arn, rules=rules_list,
+                                        deployment_tag=deployment_tag)
+        logger.info(f"Deployment {record['deployment_id']} updated.")
+        deployment_id = record['deployment_id']
+    else:
+        deployment_id = _require(utils.save_deployment_info(task_definition_arn, target_group_arn, listener_arn,
+                                                            rules_list, timestamp, project), 'Deployment record', 'saved')
+    if plan.action('service') != planner.CREATE and \
+            (record or {}).get('deployment_tag') != deployment_tag:
+        # The service, and maybe its target group and rule, were deployed before they were tagged
+        try:
+            discovery.tag_deployment(DeploymentStore().get(deployment_id))
+        except Exception as e:
+            logger.error(f"Error tagging the resources of '{project['project_name']}': {e}")
+    return deployment_id
+
+def build_steps(plan):
+    """Build the steps applying a plan. Resources without changes resolve to their live values."""
+    project = plan.project
+    live = plan.live
+    rules_list = []
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    record = _live_record(plan)
+    # Resources created by this run are tagged with the live deployment's DeploymentId, or a new one
+    deployment_tag = (record or {}).get('deployment_tag') or discovery.deployment_tag(project['project_name'], timestamp)
+    tags = discovery.resource_tags(project['project_name'], deployment_tag)
+
+    if plan.action('target_group') == planner.CREATE:
+        target_group = lambda r: _require(utils.create_target_group(project, tags=tags), 'Target group')
+    elif plan.action('target_group') == planner.UPDATE:
+        target_group = lambda r: _require(utils.update_target_group_health_check(live['target_group']['TargetGroupArn']),
+                                          'Target group', 'updated')
+    else:
+        target_group = lambda r: live['target_group']['TargetGroupArn']
+
+    steps = [
+        Step('log_group', lambda r: _require(utils.create_log_group(config.log_group), 'Log group')
+             if plan.action('log_group') != planner.NOOP else None),
+        Step('target_group', target_group),
+        Step('listener', lambda r: live['listener_arn']),
+        Step('task_definition', lambda r: _task_definition(plan, project)),
+        Step('cname', lambda r: _require(utils.create_cname_record_cloudflare(config.cloudflare_api_token, config.cloudflare_zone_id, project['domain_name'], config.alb_dns_name), 'CNAME record')
+             if plan.action('cname') != planner.NOOP else None),
+        Step('rule', lambda r: _rule(plan, r['listener'], r['target_group'], rules_list, tags),
+             deps=['listener', 'target_group']),
+        Step('service', lambda r: _service(plan, r['task_definition'], r['target_group'], tags),
+             deps=['log_group', 'task_definition', 'target_group', 'rule']),
+        Step('save', lambda r: _save(plan, record, r['task_definition'], r['target_group'], r['listener'], r['rule'],
+                                     timestamp, deployment_tag),
+             deps=['service', 'cname', 'listener', 'rule', 'task_definition', 'target_group']),
+    ]
+    return steps
+
+def main(project=None, listener_arn=None, max_workers=4, plan_only=False):
+    try:
+        with tracing.span('plan'):
+            plan = planner.make_plan(project, listener_arn)
+    except planner.PlanError as e:
+        logger.error(f"Cannot deploy '{(project or config.default_project)['project_name']}': {e}")
+        result = PipelineResult()
+        result.failed['plan'] = e
+        return result
+    if plan_only:
+        print(plan.format())
+        return PipelineResult()
+    logger.info(plan.format())
+    if not plan.has_changes:
+        return PipelineResult()
+
+    result = run_pipeline(build_steps(plan), max_workers=max_workers)
+    result.log_summary()
+    return result
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Deploy the project configured in .env.")
+    parser.add_argument('--plan', action='store_true', help="Show the changes a deploy would make, without making them.")
+    parser.add_argument('--trace', metavar='FILE', help="Write a Chrome trace of the deploy to FILE and print a latency summary.")
+    args = parser.parse_args()
+
+    tracer = tracing.start() if args.trace else None
+    try:
+        result = main(plan_only=args.plan)
+    finally:
+        if tracer:
+            tracer.export_chrome_trace(args.trace)
+            print(tracer.format_summary())
+    if not result.ok:
+        exit(1)
@@ -0,0 +1,129 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import tracing
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Step:
+    """A unit of work in a deployment pipeline.
+
+    Args:
+        name (str): Unique name of the step.
+        func (callable): Called with a dict mapping each dependency name to its result.
+        deps (iterable): Names of the steps that must succeed before this one runs.
+    """
+
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+class PipelineResult:
+    def __init__(self):
+        self.results = {}
+        self.timings = {}
+        self.failed = {}
+        self.skipped = []
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.failed and not self.skipped
+
+    def log_summary(self):
+        for name, (offset, duration) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            status = 'failed' if name in self.failed else 'ok'
+            logger.info(f"Step '{name}' {status}: started at +{offset:.2f}s, took {duration:.2f}s")
+        for name in self.skipped:
+            logger.info(f"Step '{name}' skipped because a dependency failed.")
+        logger.info(f"Pipeline finished in {self.elapsed:.2f}s")
+
+
+def _check_graph(steps):
+    by_name = {}
+    for step in steps:
+        if step.name in by_name:
+            raise ValueError(f"Duplicate step name '{step.name}'.")
+        by_name[step.name] = step
+    for step in steps:
+        for dep in step.deps:
+            if dep not in by_name:
+                raise ValueError(f"Step '{step.name}' depends on unknown step '{dep}'.")
+
+    # Kahn's algorithm, only to reject cycles before anything runs
+    remaining = {step.name: len(step.deps) for step in steps}
+    ready = [name for name, count in remaining.items() if count == 0]
+    visited = 0
+    while ready:
+        name = ready.pop()
+        visited += 1
+        for step in steps:
+            if name in step.deps:
+                remaining[step.name] -= 1
+                if remaining[step.name] == 0:
+                    ready.append(step.name)
+    if visited != len(steps):
+        raise ValueError("Pipeline steps contain a dependency cycle.")
+    return by_name
+
+
+def run_pipeline(steps, max_workers=4):
+    """Run steps on a bounded thread pool as soon as their dependencies succeed.
+
+    A step fails when its function raises. Every step that depends on a failed
+    step, directly or transitively, is skipped.
+
+    Args:
+        steps (list): The Step objects making up the pipeline.
+        max_workers (int): Maximum number of steps running at the same time.
+
+    Returns:
+        PipelineResult: Results, per-step timings, failures and skipped steps.
+    """
+    by_name = _check_graph(steps)
+    result = PipelineResult()
+    pending = dict(by_name)
+    running = {}
+    start_time = time.perf_counter()
+
+    def run_step(step):
+        started = time.perf_counter()
+        try:
+            with tracing.span(step.name):
+                return step.func({dep: result.results[dep] for dep in step.deps})
+        finally:
+            result.timings[step.name] = (started - start_time, time.perf_counter() - started)
+
+    def skip_dependents(name):
+        for step in list(pending.values()):
+            # A step depending on several skipped steps may already be gone
+            if name in step.deps and step.name in pending:
+                del pending[step.name]
+                result.skipped.append(step.name)
+                skip_dependents(step.name)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for step in list(pending.values()):
+                if all(dep in result.results for dep in step.deps):
+                    del pending[step.name]
+                    running[executor.submit(run_step, step)] = step
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    result.results[step.name] = future.result()
+                except Exception as e:
+                    logger.error(f"Step '{step.name}' failed: {e}")
+                    result.failed[step.name] = e
+                    skip_dependents(step.name)
+
+    result.elapsed = time.perf_counter() - start_time
+    return result
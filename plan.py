@@ -0,0 +1,194 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import clients
+import cloudflare
+import config
+import priorities
+import profiles
+from state_store import DeploymentStore
+import task_index
+import utils
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CREATE = 'create'
+UPDATE = 'update'
+NOOP = 'no-op'
+
+RESOURCES = ['log_group', 'target_group', 'rule', 'task_definition', 'service', 'cname']
+
+
+class PlanError(Exception):
+    """The live state cannot be brought to the spec by the changes a deploy makes."""
+
+
+class Change:
+    def __init__(self, resource, action, detail=''):
+        self.resource = resource
+        self.action = action
+        self.detail = detail
+
+
+class Plan:
+    """Differences between the live state of a project and its desired spec."""
+
+    def __init__(self, project, live, changes):
+        self.project = project
+        self.live = live
+        self.changes = {change.resource: change for change in changes}
+
+    def action(self, resource):
+        return self.changes[resource].action
+
+    @property
+    def has_changes(self):
+        return any(change.action != NOOP for change in self.changes.values())
+
+    def format(self):
+        symbols = {CREATE: '+', UPDATE: '~', NOOP: ' '}
+        lines = [f"Plan for '{self.project['project_name']}':"]
+        for resource in RESOURCES:
+            change = self.changes[resource]
+            detail = f"  ({change.detail})" if change.detail else ''
+            lines.append(f"  {symbols[change.action]} {resource:<16} {change.action}{detail}")
+        if not self.has_changes:
+            lines.append("No changes. Infrastructure is up to date.")
+        return '\n'.join(lines)
+
+
+def _host_headers(rule):
+    for condition in rule.get('Conditions', []):
+        if condition['Field'] == 'host-header':
+            return condition.get('HostHeaderConfig', {}).get('Values', condition.get('Values', []))
+    return []
+
+
+def _forward_targets(rule):
+    targets = []
+    for action in rule.get('Actions', []):
+        if action['Type'] != 'forward':
+            continue
+        if action.get('TargetGroupArn'):
+            targets.append(action['TargetGroupArn'])
+        targets += [group['TargetGroupArn'] for group in action.get('ForwardConfig', {}).get('TargetGroups', [])]
+    return list(dict.fromkeys(targets))
+
+
+def _read_log_group():
+    response = clients.get_client('logs').describe_log_groups(logGroupNamePrefix=config.log_group)
+    return any(group['logGroupName'] == config.log_group for group in response['logGroups'])
+
+
+def _read_target_group(project, target_group_arn=None):
+    elbv2_client = clients.get_client('elbv2')
+    try:
+        if target_group_arn:
+            response = elbv2_client.describe_target_groups(TargetGroupArns=[target_group_arn])
+        else:
+            response = elbv2_client.describe_target_groups(Names=[project['project_name']])
+    except elbv2_client.exceptions.TargetGroupNotFoundException:
+        return None
+    return response['TargetGroups'][0]
+
+
+def _read_rule(project, listener_arn):
+    listener_arn = listener_arn or utils.get_https_listener_arn(config.alb_arn)
+    allocator = priorities.get_allocator(clients.get_client('elbv2'), listener_arn)
+    rule = next((rule for rule in allocator.rules() if project['domain_name'] in _host_headers(rule)), None)
+    return listener_arn, rule
+
+
+def _read_service(project, service_name=None):
+    ecs_client = clients.get_client('ecs')
+    response = ecs_client.describe_services(cluster=config.ecs_cluster,
+                                            services=[service_name or project['project_name']])
+    service = next((s for s in response['services'] if s['status'] == 'ACTIVE'), None)
+    if service is None:
+        return None, None
+    task_definition = ecs_client.describe_task_definition(taskDefinition=service['taskDefinition'])['taskDefinition']
+    return service, task_definition
+
+
+def _read_cname(project):
+    client = cloudflare.get_client(config.cloudflare_api_token)
+    return client.find_record(config.cloudflare_zone_id, 'CNAME', project['domain_name'])
+
+
+def read_live_state(project, listener_arn=None):
+    """Read the live state of a project with a handful of read-only calls, run concurrently.
+
+    The service and target group are the ones of the project's latest active
+    deployment, which differ from the project name after a blue/green rollout.
+    """
+    record = DeploymentStore().latest(domain_name=project['domain_name'], cluster=config.ecs_cluster) or {}
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        log_group = executor.submit(_read_log_group)
+        target_group = executor.submit(_read_target_group, project, record.get('target_group_arn'))
+        rule = executor.submit(_read_rule, project, listener_arn)
+        service = executor.submit(_read_service, project, record.get('service_name'))
+        cname = executor.submit(_read_cname, project)
+
+        live = {'log_group_exists': log_group.result(), 'target_group': target_group.result(), 'cname': cname.result()}
+        live['listener_arn'], live['rule'] = rule.result()
+        live['service'], live['task_definition'] = service.result()
+    return live
+
+
+def diff(project, live):
+    changes = []
+    changes.append(Change('log_group', NOOP if live['log_group_exists'] else CREATE, config.log_group))
+
+    target_group = live['target_group']
+    profile_name = config.health_check_profile
+    if target_group is None:
+        changes.append(Change('target_group', CREATE, project['project_name']))
+    elif not profiles.target_group_matches(target_group, profiles.health_check_profile(profile_name)):
+        changes.append(Change('target_group', UPDATE, f"apply the '{profile_name}' health check"))
+    else:
+        changes.append(Change('target_group', NOOP, project['project_name']))
+
+    if target_group is None and live['service'] is not None:
+        # A new target group would get the traffic while the service stays registered to the old one
+        raise PlanError(f"ECS service '{live['service']['serviceName']}' exists but its target group is gone. "
+                        f"Roll the deployment back and deploy again.")
+
+    rule = live['rule']
+    if rule is None:
+        changes.append(Change('rule', CREATE, f"host {project['domain_name']}"))
+    elif target_group is None or target_group['TargetGroupArn'] not in _forward_targets(rule):
+        # A weighted forward to the project's target group and another one is a blue/green
+        # rollout or a side-by-side comparison in progress, which the deploy leaves alone
+        changes.append(Change('rule', UPDATE, "forward to the project's target group"))
+    else:
+        changes.append(Change('rule', NOOP, f"priority {rule['Priority']}"))
+
+    image = f"{project['repo_uri']}:{project['image_tag']}"
+    task_definition = live['task_definition']
+    if task_definition and task_index.task_definition_hash(task_definition) == utils.desired_task_definition_hash(project):
+        changes.append(Change('task_definition', NOOP, f"revision {task_definition['revision']}"))
+    else:
+        changes.append(Change('task_definition', CREATE, image))
+
+    if live['service'] is None:
+        changes.append(Change('service', CREATE, project['project_name']))
+    elif task_definition is None or changes[-1].action != NOOP:
+        changes.append(Change('service', UPDATE, f"deploy {image}"))
+    else:
+        changes.append(Change('service', NOOP, project['project_name']))
+
+    cname = live['cname']
+    if cname is None:
+        changes.append(Change('cname', CREATE, f"{project['domain_name']} -> {config.alb_dns_name}"))
+    elif cname['content'].rstrip('.').lower() != config.alb_dns_name.rstrip('.').lower():
+        changes.append(Change('cname', UPDATE, f"{cname['content']} -> {config.alb_dns_name}"))
+    else:
+        changes.append(Change('cname', NOOP, project['domain_name']))
+    return changes
+
+
+def make_plan(project=None, listener_arn=None):
+    """Compare the live state of a project with the spec built from config.py."""
+    project = project or config.default_project
+    live = read_live_state(project, listener_arn)
+    return Plan(project, live, diff(project, live))
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+import throttling
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rules created by these scripts start at 100 to leave room for hand-made rules
+MIN_PRIORITY = 100
+MAX_PRIORITY = 50000
+DESCRIBE_RULES_PAGE_SIZE = 400
+
+
+class PriorityAllocator:
+    """Allocates listener rule priorities from a cached view of the listener's rules.
+
+    Priorities handed out by `reserve` are held in memory until they are
+    confirmed by a successful `create_rule` or released, so concurrent callers
+    in the same process never receive the same priority. Conflicts with rules
+    created elsewhere are detected from `create_rule` and retried.
+    """
+
+    def __init__(self, elbv2_client, listener_arn, min_priority=MIN_PRIORITY, ttl=60):
+        self.elbv2_client = elbv2_client
+        self.listener_arn = listener_arn
+        self.min_priority = min_priority
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = []
+        self._taken = set()
+        self._reserved = set()
+        self._loaded_at = None
+
+    def _describe_rules(self):
+        rules = []
+        kwargs = {'ListenerArn': self.listener_arn, 'PageSize': DESCRIBE_RULES_PAGE_SIZE}
+        while True:
+            # The allocator keeps its own copy, which must reflect the rules as they are now
+            with throttling.fresh():
+                response = self.elbv2_client.describe_rules(**kwargs)
+            rules += response['Rules']
+            if not response.get('NextMarker'):
+                return rules
+            kwargs['Marker'] = response['NextMarker']
+
+    def refresh(self):
+        rules = self._describe_rules()
+        with self._lock:
+            self._rules = rules
+            self._taken = {int(rule['Priority']) for rule in rules if rule['Priority'].isdigit()}
+            self._loaded_at = time.monotonic()
+        logger.info(f"Loaded {len(rules)} rules for listener '{self.listener_arn}'.")
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.refresh()
+
+    def rules(self):
+        """Return the listener's rules from the cache, as returned by describe_rules."""
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._rules)
+
+    def reserve(self, count=1):
+        """Reserve the lowest `count` free priorities, reusing gaps left by deleted rules."""
+        self._ensure_loaded()
+        with self._lock:
+            priorities = []
+            candidate = self.min_priority
+            while len(priorities) < count:
+                if candidate > MAX_PRIORITY:
+                    self._reserved.difference_update(priorities)
+                    raise RuntimeError(f"No free rule priority left on listener '{self.listener_arn}'.")
+                if candidate not in self._taken and candidate not in self._reserved:
+                    priorities.append(candidate)
+                    self._reserved.add(candidate)
+                candidate += 1
+        logger.info(f"Reserved rule priorities: {priorities}")
+        return priorities
+
+    def confirm(self, priority):
+        with self._lock:
+            self._reserved.discard(priority)
+            self._taken.add(priority)
+
+    def release(self, priority):
+        with self._lock:
+            self._reserved.discard(priority)
+            self._taken.discard(priority)
+
+    def create_rule(self, conditions, actions, priority=None, max_attempts=5, **kwargs):
+        """Create a rule on the listener, retrying with a new priority on conflicts.
+
+        Args:
+            conditions (list): The rule conditions.
+            actions (list): The rule actions.
+            priority (int): A priority obtained from `reserve`. One is reserved when omitted.
+            max_attempts (int): Maximum number of priorities tried.
+
+        Returns:
+            dict: The created rule.
+        """
+        if priority is None:
+            priority = self.reserve()[0]
+        for attempt in range(1, max_attempts + 1):
+            try:
+                response = self.elbv2_client.create_rule(
+                    ListenerArn=self.listener_arn,
+                    Conditions=conditions,
+                    Actions=actions,
+                    Priority=priority,
+                    **kwargs
+                )
+            except self.elbv2_client.exceptions.PriorityInUseException:
+                logger.warning(f"Rule priority {priority} is already in use (attempt {attempt}/{max_attempts}).")
+                self.confirm(priority)
+                if attempt == max_attempts:
+                    raise
+                self.refresh()
+                priority = self.reserve()[0]
+            except Exception:
+                self.release(priority)
+                raise
+            else:
+                self.confirm(priority)
+                with self._lock:
+                    self._rules.append(response['Rules'][0])
+                return response['Rules'][0]
+
+    def create_rules(self, rules, **kwargs):
+        """Create several rules with a block of priorities reserved up front.
+
+        Args:
+            rules (list): (conditions, actions) pairs.
+
+        Returns:
+            list: The created rules, in the same order.
+        """
+        priorities = self.reserve(len(rules))
+        created = []
+        for index, ((conditions, actions), priority) in enumerate(zip(rules, priorities)):
+            try:
+                created.append(self.create_rule(conditions, actions, priority, **kwargs))
+            except Exception:
+                for unused in priorities[index + 1:]:
+                    self.release(unused)
+                raise
+        return created
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_allocator(elbv2_client, listener_arn):
+    """Return the allocator shared by every caller in this process for a listener."""
+    with _allocators_lock:
+        if listener_arn not in _allocators:
+            _allocators[listener_arn] = PriorityAllocator(elbv2_client, listener_arn)
+        return _allocators[listener_arn]
@@ -0,0 +1,166 @@
+import copy
+import config
+
+# Health checks of the target group and of the container. A new target gets
+# traffic after about interval * healthy_threshold seconds.
+HEALTH_CHECK_PROFILES = {
+    'fast': {
+        'interval': 5,
+        'timeout': 2,
+        'healthy_threshold': 2,
+        'unhealthy_threshold': 2,
+        'deregistration_delay': 30,
+        'container_interval': 5,
+        'container_timeout': 2,
+        'container_retries': 2,
+        'container_start_period': 10,
+    },
+    'standard': {
+        'interval': 15,
+        'timeout': 5,
+        'healthy_threshold': 2,
+        'unhealthy_threshold': 3,
+        'deregistration_delay': 60,
+        'container_interval': 15,
+        'container_timeout': 5,
+        'container_retries': 3,
+        'container_start_period': 30,
+    },
+    # The settings used before profiles existed
+    'conservative': {
+        'interval': 30,
+        'timeout': 5,
+        'healthy_threshold': 3,
+        'unhealthy_threshold': 3,
+        'deregistration_delay': 300,
+        'container_interval': 30,
+        'container_timeout': 5,
+        'container_retries': 3,
+        'container_start_period': 60,
+    },
+}
+
+CONTAINER_HEALTH_COMMAND = ['CMD-SHELL', 'curl -fk https://localhost/ || exit 1']
+
+# Task size and container settings per kind of workload. With non-blocking logging,
+# a slow CloudWatch Logs endpoint fills a buffer of `log_buffer_size` instead of
+# stalling the application's writes. `ephemeral_storage` is in GiB (21-200), None
+# keeping the Fargate default of 20, and `stop_timeout` is capped at 120 seconds.
+TASK_PROFILES = {
+    'standard': {
+        'cpu': '512',
+        'memory': '2048',
+        'ephemeral_storage': None,
+        'stop_timeout': 30,
+        'ulimits': [{'name': 'nofile', 'softLimit': 65535, 'hardLimit': 65535}],
+        'log_mode': 'non-blocking',
+        'log_buffer_size': '25m',
+    },
+    'high-concurrency-api': {
+        'cpu': '1024',
+        'memory': '2048',
+        'ephemeral_storage': None,
+        'stop_timeout': 30,
+        'ulimits': [{'name': 'nofile', 'softLimit': 1048576, 'hardLimit': 1048576}],
+        'log_mode': 'non-blocking',
+        'log_buffer_size': '50m',
+    },
+    'batch-worker': {
+        'cpu': '2048',
+        'memory': '8192',
+        'ephemeral_storage': 100,
+        'stop_timeout': 120,
+        'ulimits': [{'name': 'nofile', 'softLimit': 65535, 'hardLimit': 65535}],
+        'log_mode': 'non-blocking',
+        'log_buffer_size': '25m',
+    },
+    # The settings used before profiles existed. None leaves a setting out of the
+    # task definition, as it was then, so existing revisions keep matching.
+    'legacy': {
+        'cpu': '512',
+        'memory': '2048',
+        'ephemeral_storage': None,
+        'stop_timeout': None,
+        'ulimits': None,
+        'log_mode': None,
+        'log_buffer_size': None,
+    },
+}
+
+
+def health_check_profile(name=None):
+    name = name or config.health_check_profile
+    if name not in HEALTH_CHECK_PROFILES:
+        raise ValueError(f"Unknown health check profile '{name}'. Use one of: {', '.join(HEALTH_CHECK_PROFILES)}.")
+    return HEALTH_CHECK_PROFILES[name]
+
+
+def target_group_health_check(profile):
+    """Health check arguments of create_target_group and modify_target_group."""
+    return {
+        'HealthCheckIntervalSeconds': profile['interval'],
+        'HealthCheckTimeoutSeconds': profile['timeout'],
+        'HealthyThresholdCount': profile['healthy_threshold'],
+        'UnhealthyThresholdCount': profile['unhealthy_threshold'],
+    }
+
+
+def target_group_attributes(profile):
+    return [{'Key': 'deregistration_delay.timeout_seconds', 'Value': str(profile['deregistration_delay'])}]
+
+
+def container_health_check(profile, command=None):
+    """The healthCheck of a container definition."""
+    return {
+        'command': command or CONTAINER_HEALTH_COMMAND,
+        'interval': profile['container_interval'],
+        'timeout': profile['container_timeout'],
+        'retries': profile['container_retries'],
+        'startPeriod': profile['container_start_period'],
+    }
+
+
+def target_group_matches(target_group, profile):
+    """Whether a target group from describe_target_groups has the profile's health check."""
+    return all(target_group.get(key) == value for key, value in target_group_health_check(profile).items())
+
+
+def task_profile(name=None):
+    name = name or config.task_profile
+    if name not in TASK_PROFILES:
+        raise ValueError(f"Unknown task profile '{name}'. Use one of: {', '.join(TASK_PROFILES)}.")
+    return TASK_PROFILES[name]
+
+
+def apply_task_profile(task_definition, profile):
+    """Apply a task profile to the arguments of register_task_definition, in place.
+
+    Sets the ulimits, stop timeout and awslogs mode of every container and the
+    ephemeral storage of the task. Settings the profile leaves as None are
+    removed. The CPU and memory are left to the caller.
+    """
+    for container in task_definition['containerDefinitions']:
+        if profile['ulimits']:
+            container['ulimits'] = copy.deepcopy(profile['ulimits'])
+        else:
+            container.pop('ulimits', None)
+        if profile['stop_timeout'] is None:
+            container.pop('stopTimeout', None)
+        else:
+            container['stopTimeout'] = profile['stop_timeout']
+        log_configuration = container.get('logConfiguration') or {}
+        if log_configuration.get('logDriver') == 'awslogs':
+            options = log_configuration.setdefault('options', {})
+            if profile['log_mode']:
+                options['mode'] = profile['log_mode']
+            else:
+                options.pop('mode', None)
+            if profile['log_buffer_size']:
+                options['max-buffer-size'] = profile['log_buffer_size']
+            else:
+                options.pop('max-buffer-size', None)
+    if profile['ephemeral_storage']:
+        task_definition['ephemeralStorage'] = {'sizeInGiB': profile['ephemeral_storage']}
+    else:
+        task_definition.pop('ephemeralStorage', None)
+    return task_definition
@@ -1,25 +1,19 @@
 import json
-import boto3
 import logging
 import sys
-import requests
+import cloudflare
 import os
-import time
-from keys import access, secret
+import clients
+import autoscaling
+from state_store import DeploymentStore, resolve_deployment
+from pipeline import Step, run_pipeline
+import waiters
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-session = boto3.Session(
-    aws_access_key_id=access,
-    aws_secret_access_key=secret,
-    region_name='ap-southeast-5'
-)
-
-# Initialize boto3 clients
-ecs_client = session.client('ecs')
-elbv2_client = session.client('elbv2')
+MAX_WORKERS = 8
 
 def load_deployment_info(file_path):
     try:
@@ -32,62 +26,77 @@ def load_deployment_info(file_path):
         logger.error("Deployment info file is not a valid JSON.")
         exit(1)
 
+# The helpers below raise on errors, so the teardown steps fail and the deployment record
+# is kept. Resources that are already gone count as deleted, so a rollback can be retried.
+
 def delete_ecs_service(cluster, service):
+    ecs_client = clients.get_client('ecs')
     try:
         ecs_client.delete_service(cluster=cluster, service=service, force=True)
         logger.info(f"ECS service '{service}' deleted successfully.")
+    except (ecs_client.exceptions.ServiceNotFoundException, ecs_client.exceptions.ServiceNotActiveException):
+        logger.warning(f"ECS service '{service}' was already deleted.")
     except Exception as e:
         logger.error(f"Error during ECS service deletion: {e}")
+        raise
 
 def deregister_task_definition(task_definition_arn):
+    ecs_client = clients.get_client('ecs')
     try:
         ecs_client.deregister_task_definition(taskDefinition=task_definition_arn)
         logger.info(f"Task definition '{task_definition_arn}' deregistered successfully.")
     except Exception as e:
         logger.error(f"Error during task definition deregistration: {e}")
+        raise
+
+def remove_service_scaling(cluster, service):
+    try:
+        if autoscaling.remove_service_scaling(cluster, service):
+            logger.info(f"Auto scaling of ECS service '{service}' removed successfully.")
+    except Exception as e:
+        logger.error(f"Error during auto scaling removal: {e}")
+        raise
 
 def delete_target_group(target_group_arn):
+    elbv2_client = clients.get_client('elbv2')
     try:
         elbv2_client.delete_target_group(TargetGroupArn=target_group_arn)
         logger.info(f"Target group '{target_group_arn}' deleted successfully.")
+    except elbv2_client.exceptions.TargetGroupNotFoundException:
+        logger.warning(f"Target group '{target_group_arn}' was already deleted.")
     except Exception as e:
         logger.error(f"Error during target group deletion: {e}")
+        raise
+
+def delete_alb_rule(rule_arn):
+    elbv2_client = clients.get_client('elbv2')
+    try:
+        elbv2_client.delete_rule(RuleArn=rule_arn)
+        logger.info(f"ALB rule '{rule_arn}' deleted successfully.")
+    except elbv2_client.exceptions.RuleNotFoundException:
+        logger.warning(f"ALB rule '{rule_arn}' was already deleted.")
+    except elbv2_client.exceptions.ClientError as e:
+        if 'OperationNotPermitted' in str(e):
+            logger.warning(f"Default rule '{rule_arn}' cannot be deleted.")
+        else:
+            logger.error(f"Error during ALB rule deletion: {e}")
+            raise
 
 def delete_alb_rules(rules_list):
     for rule_arn in rules_list:
-        try:
-            elbv2_client.delete_rule(RuleArn=rule_arn)
-            logger.info(f"ALB rule '{rule_arn}' deleted successfully.")
-        except elbv2_client.exceptions.ClientError as e:
-            if 'OperationNotPermitted' in str(e):
-                logger.warning(f"Default rule '{rule_arn}' cannot be deleted.")
-            else:
-                logger.error(f"Error during ALB rule deletion: {e}")
+        delete_alb_rule(rule_arn)
 
-def delete_cname_record_cloudflare(api_token, zone_id, domain_name):
+def delete_cname_records_cloudflare(api_token, zone_id, domain_names):
     try:
-        # Get the DNS record ID
-        url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records?type=CNAME&name={domain_name}"
-        headers = {
-            "Authorization": f"Bearer {api_token}",
-            "Content-Type": "application/json"
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        records = response.json().get('result', [])
-        if not records:
-            logger.warning(f"No CNAME record found for {domain_name}.")
-            return
-
-        record_id = records[0]['id']
-
-        # Delete the DNS record
-        url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records/{record_id}"
-        response = requests.delete(url, headers=headers)
-        response.raise_for_status()
-        logger.info(f"CNAME record for {domain_name} deleted successfully.")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error deleting CNAME record: {e}")
+        deleted = cloudflare.get_client(api_token).delete_records(zone_id, domain_names)
+        for domain_name in domain_names:
+            if domain_name in deleted:
+                logger.info(f"CNAME record for {domain_name} deleted successfully.")
+            else:
+                logger.warning(f"No CNAME record found for {domain_name}.")
+    except cloudflare.CloudflareError as e:
+        logger.error(f"Error deleting CNAME records: {e}")
+        raise
 
 def remove_deployment_info(file_path):
     try:
@@ -99,66 +108,127 @@ def remove_deployment_info(file_path):
         logger.error(f"Error removing deployment info file: {e}")
 
 def wait_for_service_draining(cluster, service_name, max_wait_time=600, check_interval=30):
-    ecs_client = boto3.client('ecs')
-    start_time = time.time()
-
-    while True:
-        response = ecs_client.describe_services(
-            cluster=cluster,
-            services=[service_name]
-        )
-
-        services = response['services']
-        if len(services) == 0:
-            print(f"Service '{service_name}' not found.")
-            break
-
-        service = services[0]
-        status = service['status']
-
-        if status == 'DRAINING':
-            elapsed_time = time.time() - start_time
-            if elapsed_time >= max_wait_time:
-                print(f"ECS service '{service_name}' has been draining for too long. Exiting.")
-                break
-            if elapsed_time % (check_interval * 5) < check_interval:
-                print(f"ECS service '{service_name}' is still draining. Waiting...")
-            time.sleep(check_interval)  # Wait before checking again
-        else:
-            print(f"ECS service '{service_name}' is no longer draining.")
-            break 
-
-def main():
-    if len(sys.argv) != 2:
-        logger.error("Usage: python rollback.py <deployment_info_file>")
+    return wait_for_services_draining(cluster, [service_name], max_wait_time, check_interval)[service_name]
+
+def wait_for_services_draining(cluster, service_names, max_wait_time=600, check_interval=30):
+    ecs_client = clients.get_client('ecs')
+    return waiters.wait_for_services_inactive(ecs_client, cluster, service_names,
+                                              max_wait_time=max_wait_time, max_interval=check_interval)
+
+def drain_services(cluster, service_names):
+    """Wait for deleted services to drain. Raises RuntimeError when any is still draining,
+    so the target groups are not deleted under it."""
+    drained = wait_for_services_draining(cluster, service_names)
+    remaining = [name for name in service_names if not drained.get(name)]
+    if remaining:
+        raise RuntimeError(f"ECS service(s) {', '.join(remaining)} did not drain in cluster '{cluster}'.")
+    return drained
+
+def validate_deployment_info(deployment_info):
+    required = ['ecs_cluster', 'service_name', 'task_definition_arn', 'target_group_arn',
+                'domain_name', 'cloudflare_api_token', 'cloudflare_zone_id']
+    return all(deployment_info.get(key) for key in required) and deployment_info.get('rules', []) is not None
+
+def build_teardown_steps(deployments):
+    """Build the reverse dependency graph of one or more deployments.
+
+    The service (after its auto scaling), its rules, the task definition and
+    the CNAME record are deleted in parallel, CNAME records in one batch per Cloudflare zone.
+    Services are drained in one batched wait per cluster,
+    and each target group is deleted once its rules are gone and its service
+    has drained. A side-by-side service (see side_by_side.py) is deleted with
+    its deployment's service, and its target group with the deployment's.
+
+    Args:
+        deployments (list): Deployment records, as saved by `utils.save_deployment_info`.
+    """
+    steps = []
+    services_by_cluster = {}
+    service_steps_by_cluster = {}
+    domains_by_zone = {}
+    for index, info in enumerate(deployments):
+        key = f"{index}:{info['service_name']}"
+        cluster = info['ecs_cluster']
+        services_by_cluster.setdefault(cluster, []).append(info['service_name'])
+        service_steps_by_cluster.setdefault(cluster, []).append(f'{key}:service')
+
+        rule_steps = [f'{key}:rule:{rule_arn}' for rule_arn in info.get('rules', [])]
+        # Auto scaling goes first, so it cannot start tasks while the service is deleted
+        steps.append(Step(f'{key}:scaling', lambda r, info=info: remove_service_scaling(info['ecs_cluster'], info['service_name'])))
+        steps.append(Step(f'{key}:service', lambda r, info=info: delete_ecs_service(info['ecs_cluster'], info['service_name']),
+                          deps=[f'{key}:scaling']))
+        steps.append(Step(f'{key}:task_definition', lambda r, info=info: deregister_task_definition(info['task_definition_arn'])))
+        zone = (info['cloudflare_api_token'], info['cloudflare_zone_id'])
+        domains_by_zone.setdefault(zone, []).append(info['domain_name'])
+        for name, rule_arn in zip(rule_steps, info.get('rules', [])):
+            steps.append(Step(name, lambda r, rule_arn=rule_arn: delete_alb_rule(rule_arn)))
+        steps.append(Step(f'{key}:target_group', lambda r, info=info: delete_target_group(info['target_group_arn']),
+                          deps=rule_steps + [f'drain:{cluster}']))
+
+        side = info.get('side_by_side')
+        if side:
+            services_by_cluster[cluster].append(side['service_name'])
+            service_steps_by_cluster[cluster].append(f'{key}:side_service')
+            steps.append(Step(f'{key}:side_scaling', lambda r, side=side, cluster=cluster:
+                              remove_service_scaling(cluster, side['service_name'])))
+            steps.append(Step(f'{key}:side_service', lambda r, side=side, cluster=cluster:
+                              delete_ecs_service(cluster, side['service_name']), deps=[f'{key}:side_scaling']))
+            steps.append(Step(f'{key}:side_target_group', lambda r, side=side: delete_target_group(side['target_group_arn']),
+                              deps=rule_steps + [f'drain:{cluster}']))
+
+    for cluster, service_names in services_by_cluster.items():
+        steps.append(Step(f'drain:{cluster}', lambda r, cluster=cluster, service_names=service_names:
+                          drain_services(cluster, service_names), deps=service_steps_by_cluster[cluster]))
+    for index, ((api_token, zone_id), domain_names) in enumerate(domains_by_zone.items()):
+        steps.append(Step(f'cname:{index}:{zone_id}', lambda r, api_token=api_token, zone_id=zone_id, domain_names=domain_names:
+                          delete_cname_records_cloudflare(api_token, zone_id, domain_names)))
+    return steps
+
+def main(targets=None):
+    targets = sys.argv[1:] if targets is None else targets
+    if not targets:
+        logger.error("Usage: python rollback.py <deployment_info_file | service_name> [...]")
         exit(1)
 
-    deployment_info_file = sys.argv[1]
-    deployment_info = load_deployment_info(deployment_info_file)
-
-    ecs_cluster = deployment_info.get('ecs_cluster')
-    service_name = deployment_info.get('service_name')
-    task_definition_arn = deployment_info.get('task_definition_arn')
-    target_group_arn = deployment_info.get('target_group_arn')
-    rules_list = deployment_info.get('rules', [])
-    domain_name = deployment_info.get('domain_name')
-    cloudflare_api_token = deployment_info.get('cloudflare_api_token')
-    cloudflare_zone_id = deployment_info.get('cloudflare_zone_id')
-
-    if not all([ecs_cluster, service_name, task_definition_arn, target_group_arn, rules_list is not None, domain_name, cloudflare_api_token, cloudflare_zone_id]):
-        logger.error("Missing required deployment information.")
+    store = DeploymentStore()
+    deployments = []
+    for target in targets:
+        if os.path.isfile(target):
+            deployment_info = load_deployment_info(target)
+            stored = store.get_by_file(target)
+            deployment_id = stored['deployment_id'] if stored else None
+            deployment_info_file = target
+        else:
+            deployment_info, deployment_id, deployment_info_file = resolve_deployment(target, store)
+            if deployment_info is None:
+                logger.error(f"No deployment file or active deployment found for '{target}'.")
+                exit(1)
+
+        if not validate_deployment_info(deployment_info):
+            logger.error(f"Missing required deployment information for '{target}'.")
+            exit(1)
+        deployments.append((deployment_info, deployment_id, deployment_info_file))
+
+    result = run_pipeline(build_teardown_steps([info for info, _, _ in deployments]), max_workers=MAX_WORKERS)
+    result.log_summary()
+
+    incomplete = False
+    for index, (deployment_info, deployment_id, deployment_info_file) in enumerate(deployments):
+        prefix = f"{index}:{deployment_info['service_name']}:"
+        # The drain and CNAME steps are shared by the deployments of a cluster and of a zone
+        shared = (f"drain:{deployment_info['ecs_cluster']}", f":{deployment_info['cloudflare_zone_id']}")
+        if any(name.startswith(prefix) or name == shared[0] or (name.startswith('cname:') and name.endswith(shared[1]))
+               for name in list(result.failed) + result.skipped):
+            logger.error(f"Rollback of '{deployment_info['service_name']}' did not complete.")
+            incomplete = True
+            continue
+        logger.info(f"Rollback of '{deployment_info['service_name']}' completed.")
+        if deployment_id is not None:
+            store.deactivate(deployment_id)
+        if deployment_info_file:
+            remove_deployment_info(deployment_info_file)
+    if incomplete:
         exit(1)
 
-    delete_ecs_service(ecs_cluster, service_name)
-    wait_for_service_draining(ecs_cluster, service_name)
-    deregister_task_definition(task_definition_arn)
-    delete_alb_rules(rules_list)
-    delete_target_group(target_group_arn)
-    delete_cname_record_cloudflare(cloudflare_api_token, cloudflare_zone_id, domain_name)
-
-    logger.info("Rollback completed.")
-    remove_deployment_info(deployment_info_file)
-
 if __name__ == "__main__":
     main()
-
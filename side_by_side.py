@@ -0,0 +1,266 @@
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+import bluegreen
+import clients
+import discovery
+import image_publish
+import sizing
+import update_service
+from state_store import DeploymentStore, resolve_deployment
+from task_index import TaskDefinitionIndex
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENT = 50
+DEFAULT_WINDOW = 3600
+
+
+def architecture(task_definition):
+    """CPU architecture of a task definition. Fargate runs X86_64 when no platform is set."""
+    return (task_definition.get('runtimePlatform') or {}).get('cpuArchitecture') or 'X86_64'
+
+
+def save(store, deployment_id, json_file, deployment_info, side_by_side):
+    """Record the side-by-side service of a deployment, or its removal with None."""
+    deployment_info['side_by_side'] = side_by_side
+    if deployment_id is not None:
+        store.update_fields(deployment_id, side_by_side=side_by_side)
+    if json_file:
+        with open(json_file, 'w') as file:
+            json.dump(deployment_info, file, indent=4)
+
+
+def start(deployment_info, cpu_architecture=None, percent=DEFAULT_PERCENT, max_wait_time=600):
+    """Run a deployment's task definition on another CPU architecture next to its service.
+
+    A copy of the service runs the same image, size and settings on the other
+    architecture. The ALB reports response times and request counts per target
+    group, so the copy gets its own target group, and the deployment's rule
+    splits the traffic between both target groups.
+
+    Args:
+        deployment_info (dict): The deployment record.
+        cpu_architecture (str): X86_64 or ARM64. Defaults to the one the service does not run on.
+        percent (int): Percentage of the traffic sent to the copy.
+
+    Returns:
+        dict: The side-by-side service, target group, rule and architectures, or None if it failed to start.
+    """
+    ecs_client = clients.get_client('ecs')
+    cluster = deployment_info['ecs_cluster']
+    service_name = deployment_info['service_name']
+    target_group_arn = deployment_info['target_group_arn']
+    described = ecs_client.describe_task_definition(taskDefinition=deployment_info['task_definition_arn'],
+                                                    include=['TAGS'])
+    task_definition = described['taskDefinition']
+    baseline = architecture(task_definition)
+    cpu_architecture = cpu_architecture or next(name for name in image_publish.ARCHITECTURES if name != baseline)
+    if cpu_architecture == baseline:
+        logger.error(f"'{service_name}' already runs on {baseline}.")
+        return None
+
+    rule = bluegreen.forwarding_rule(deployment_info.get('rules', []), target_group_arn)
+    if rule is None:
+        logger.error(f"No rule of '{service_name}' forwards to '{target_group_arn}'.")
+        return None
+
+    container_def = task_definition['containerDefinitions'][0]
+    spec = update_service.task_definition_spec(task_definition, container_def['image'], task_definition['cpu'],
+                                               task_definition['memory'], container_def.get('healthCheck'),
+                                               cpu_architecture=cpu_architecture)
+    try:
+        task_definition_arn = update_service.register_or_reuse(
+            ecs_client, spec, TaskDefinitionIndex(ecs_client),
+            update_service.task_definition_tags(described, deployment_info))
+    except image_publish.ImageArchitectureError as e:
+        logger.error(f"Cannot run '{service_name}' on {cpu_architecture}: {e}")
+        return None
+
+    suffix = image_publish.ARCHITECTURES[cpu_architecture]
+    project_name = deployment_info.get('project_name', service_name)
+    side_service = f'{service_name}-{suffix}'
+    side_target_group_arn = bluegreen.clone_target_group(
+        target_group_arn, f'{project_name[:bluegreen.MAX_TARGET_GROUP_NAME - len(suffix) - 1]}-{suffix}')
+    try:
+        # Attached with a weight of 0 until its targets are healthy
+        bluegreen.set_weights(rule['RuleArn'], target_group_arn, side_target_group_arn, 0)
+        side_service_arn = bluegreen.clone_service(cluster, service_name, side_service, task_definition_arn,
+                                                   side_target_group_arn)
+        try:
+            # Keeps the copy apart from the service when the deployment is found from its tags
+            discovery.tag_resources([side_service_arn, side_target_group_arn],
+                                    {discovery.ROLE_TAG: discovery.SIDE_BY_SIDE_ROLE})
+        except Exception as e:
+            logger.warning(f"Error tagging the side-by-side service of '{service_name}': {e}")
+        if not bluegreen.wait_for_healthy_targets(side_target_group_arn, max_wait_time):
+            raise RuntimeError(f"targets of '{side_service}' did not become healthy")
+        bluegreen.set_weights(rule['RuleArn'], target_group_arn, side_target_group_arn, percent)
+    except Exception as e:
+        logger.error(f"Side-by-side service of '{service_name}' failed to start: {e}")
+        try:
+            bluegreen.set_weights(rule['RuleArn'], side_target_group_arn, target_group_arn, 100)
+        except Exception as e:
+            logger.error(f"Error sending traffic back to '{target_group_arn}': {e}")
+        bluegreen.delete_service(cluster, side_service, side_target_group_arn)
+        return None
+
+    logger.info(f"'{side_service}' runs on {cpu_architecture} next to '{service_name}' on {baseline} "
+                f"and takes {percent}% of the traffic.")
+    return {
+        'service_name': side_service,
+        'target_group_arn': side_target_group_arn,
+        'task_definition_arn': task_definition_arn,
+        'rule_arn': rule['RuleArn'],
+        'cpu_architecture': cpu_architecture,
+        'baseline_architecture': baseline,
+        'started_at': time.time(),
+    }
+
+
+def _metric(query_id, namespace, name, dimensions, period, stat):
+    return {'Id': query_id, 'MetricStat': {
+        'Metric': {'Namespace': namespace, 'MetricName': name, 'Dimensions': dimensions},
+        'Period': period, 'Stat': stat}}
+
+
+def compare(deployment_info, window=DEFAULT_WINDOW, alb_arn=None):
+    """Compare the latency, throughput, utilization and cost of both architectures.
+
+    Metrics cover the last `window` seconds, and never the time before the
+    side-by-side service started. Each statistic is one datapoint over the
+    whole window, so percentiles are over all the requests.
+
+    Returns:
+        list: One dict per architecture, the deployment's service first.
+    """
+    side_by_side = deployment_info['side_by_side']
+    cluster = deployment_info['ecs_cluster']
+    rows = [
+        {'cpu_architecture': side_by_side['baseline_architecture'], 'service_name': deployment_info['service_name'],
+         'target_group_arn': deployment_info['target_group_arn'],
+         'task_definition_arn': deployment_info['task_definition_arn']},
+        {'cpu_architecture': side_by_side['cpu_architecture'], 'service_name': side_by_side['service_name'],
+         'target_group_arn': side_by_side['target_group_arn'],
+         'task_definition_arn': side_by_side['task_definition_arn']},
+    ]
+    end = time.time()
+    start_time = max(end - window, side_by_side['started_at'])
+    period = max(60, math.ceil((end - start_time) / 60) * 60)
+
+    queries = []
+    for index, row in enumerate(rows):
+        alb = bluegreen.target_group_dimensions(row['target_group_arn'], alb_arn)
+        ecs = [{'Name': 'ClusterName', 'Value': cluster}, {'Name': 'ServiceName', 'Value': row['service_name']}]
+        queries += [
+            _metric(f'requests{index}', 'AWS/ApplicationELB', 'RequestCount', alb, period, 'Sum'),
+            _metric(f'errors{index}', 'AWS/ApplicationELB', 'HTTPCode_Target_5XX_Count', alb, period, 'Sum'),
+            _metric(f'p50{index}', 'AWS/ApplicationELB', 'TargetResponseTime', alb, period, 'p50'),
+            _metric(f'p99{index}', 'AWS/ApplicationELB', 'TargetResponseTime', alb, period, 'p99'),
+            _metric(f'cpu{index}', 'AWS/ECS', 'CPUUtilization', ecs, period, 'Average'),
+            _metric(f'memory{index}', 'AWS/ECS', 'MemoryUtilization', ecs, period, 'Average'),
+        ]
+    response = clients.get_client('cloudwatch').get_metric_data(
+        MetricDataQueries=queries, StartTime=end - period, EndTime=end)
+    # Sums add up over datapoints, when the window spans two periods; for the rest the worst one is kept
+    values = {}
+    for result in response['MetricDataResults']:
+        if result['Values']:
+            values[result['Id']] = sum(result['Values']) if result['Id'].startswith(('requests', 'errors')) \
+                else max(result['Values'])
+
+    ecs_client = clients.get_client('ecs')
+    services = {service['serviceName']: service for service in ecs_client.describe_services(
+        cluster=cluster, services=[row['service_name'] for row in rows])['services']}
+    hours = (end - start_time) / 3600
+    for index, row in enumerate(rows):
+        task_definition = ecs_client.describe_task_definition(taskDefinition=row['task_definition_arn'])['taskDefinition']
+        tasks = services.get(row['service_name'], {}).get('runningCount', 0)
+        hourly_cost = sizing.monthly_cost(task_definition['cpu'], task_definition['memory'], tasks,
+                                          row['cpu_architecture']) / sizing.HOURS_PER_MONTH
+        requests = values.get(f'requests{index}') or 0
+        row.update(
+            tasks=tasks,
+            requests=requests,
+            requests_per_second=requests / (end - start_time) if end > start_time else 0,
+            errors=values.get(f'errors{index}') or 0,
+            p50=values.get(f'p50{index}'),
+            p99=values.get(f'p99{index}'),
+            cpu=values.get(f'cpu{index}'),
+            memory=values.get(f'memory{index}'),
+            hourly_cost=hourly_cost,
+            cost_per_million_requests=hourly_cost * hours / requests * 1000000 if requests else None,
+        )
+    return rows
+
+
+def stop(deployment_info):
+    """Send all traffic back to the deployment's target group and delete the side-by-side service."""
+    side_by_side = deployment_info['side_by_side']
+    bluegreen.set_weights(side_by_side['rule_arn'], side_by_side['target_group_arn'],
+                          deployment_info['target_group_arn'], 100)
+    bluegreen.delete_service(deployment_info['ecs_cluster'], side_by_side['service_name'],
+                             side_by_side['target_group_arn'])
+
+
+def print_comparison(rows):
+    def number(value, fmt):
+        return format(value, fmt) if value is not None else '-'
+
+    print(f"{'ARCH':<8} {'SERVICE':<32} {'TASKS':>5} {'REQ/S':>8} {'5XX':>6} {'P50 MS':>8} {'P99 MS':>8} "
+          f"{'CPU %':>6} {'MEM %':>6} {'$/HOUR':>8} {'$/1M REQ':>9}")
+    for row in rows:
+        print(f"{row['cpu_architecture']:<8} {row['service_name']:<32} {row['tasks']:>5} "
+              f"{row['requests_per_second']:>8.1f} {row['errors']:>6.0f} "
+              f"{number(row['p50'] and row['p50'] * 1000, '.1f'):>8} {number(row['p99'] and row['p99'] * 1000, '.1f'):>8} "
+              f"{number(row['cpu'], '.1f'):>6} {number(row['memory'], '.1f'):>6} {row['hourly_cost']:>8.4f} "
+              f"{number(row['cost_per_million_requests'], '.3f'):>9}")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run a service on both CPU architectures and compare them.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    start_parser = subparsers.add_parser('start', help="Start a copy of the service on the other architecture.")
+    start_parser.add_argument('target', help="Deployment JSON file or service name.")
+    start_parser.add_argument('--cpu-architecture', choices=list(image_publish.ARCHITECTURES),
+                              help="Architecture of the copy. Defaults to the one the service does not run on.")
+    start_parser.add_argument('--percent', type=int, default=DEFAULT_PERCENT, help="Share of the traffic sent to the copy.")
+    compare_parser = subparsers.add_parser('compare', help="Compare both architectures.")
+    compare_parser.add_argument('target')
+    compare_parser.add_argument('--window', type=int, default=DEFAULT_WINDOW, help="Seconds of metrics to compare.")
+    stop_parser = subparsers.add_parser('stop', help="Delete the copy and send all traffic back to the service.")
+    stop_parser.add_argument('target')
+    args = parser.parse_args()
+
+    store = DeploymentStore()
+    deployment_info, deployment_id, json_file = resolve_deployment(args.target, store)
+    if deployment_info is None:
+        print(f"Error: No deployment file or active deployment found for '{args.target}'.")
+        sys.exit(1)
+    side_by_side = deployment_info.get('side_by_side')
+
+    if args.command == 'start':
+        if side_by_side:
+            print(f"Error: '{side_by_side['service_name']}' already runs side by side. Stop it first.")
+            sys.exit(1)
+        side_by_side = start(deployment_info, args.cpu_architecture, args.percent)
+        if side_by_side is None:
+            sys.exit(1)
+        save(store, deployment_id, json_file, deployment_info, side_by_side)
+    elif not side_by_side:
+        print(f"Error: '{deployment_info['service_name']}' does not run side by side.")
+        sys.exit(1)
+    elif args.command == 'compare':
+        print_comparison(compare(deployment_info, args.window))
+    else:
+        stop(deployment_info)
+        save(store, deployment_id, json_file, deployment_info, None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import logging
+import math
+import time
+import clients
+import config
+import waiters
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Memory (MiB) allowed by Fargate for each CPU size (units)
+FARGATE_SIZES = {
+    '256': [512, 1024, 2048],
+    '512': list(range(1024, 4096 + 1, 1024)),
+    '1024': list(range(2048, 8192 + 1, 1024)),
+    '2048': list(range(4096, 16384 + 1, 1024)),
+    '4096': list(range(8192, 30720 + 1, 1024)),
+    '8192': list(range(16384, 61440 + 1, 4096)),
+    '16384': list(range(32768, 122880 + 1, 8192)),
+}
+# Linux/X86_64 on-demand prices in USD, per vCPU-hour and GB-hour
+VCPU_HOUR_PRICE = 0.04048
+GB_HOUR_PRICE = 0.004445
+# Linux/ARM64 (Graviton) on-demand prices
+ARM64_VCPU_HOUR_PRICE = 0.03238
+ARM64_GB_HOUR_PRICE = 0.00356
+HOURS_PER_MONTH = 730
+
+DEFAULT_DAYS = 14
+DEFAULT_PERIOD = 300
+CPU_PERCENTILE = 0.95
+CPU_HEADROOM = 0.3
+MEMORY_HEADROOM = 0.25
+MIN_DATAPOINTS = 24
+# get_metric_data accepts at most 500 queries per call
+MAX_QUERIES = 500
+
+
+def is_valid(cpu, memory):
+    return int(memory) in FARGATE_SIZES.get(str(cpu), [])
+
+
+def monthly_cost(cpu, memory, tasks=1, cpu_architecture='X86_64'):
+    if cpu_architecture == 'ARM64':
+        vcpu_price, gb_price = ARM64_VCPU_HOUR_PRICE, ARM64_GB_HOUR_PRICE
+    else:
+        vcpu_price, gb_price = VCPU_HOUR_PRICE, GB_HOUR_PRICE
+    return (int(cpu) / 1024 * vcpu_price + int(memory) / 1024 * gb_price) * HOURS_PER_MONTH * tasks
+
+
+def percentiles(values, fractions):
+    """Nearest-rank percentiles of a list of numbers, from a single sort."""
+    ordered = sorted(values)
+    if not ordered:
+        return [0.0 for _ in fractions]
+    return [ordered[max(0, min(len(ordered) - 1, math.ceil(f * len(ordered)) - 1))] for f in fractions]
+
+
+def cheapest_size(cpu_units, memory_mib, cpu_architecture='X86_64'):
+    """Return the cheapest valid (cpu, memory) pair providing at least the given resources, or None."""
+    candidates = [(cpu, memory) for cpu, memories in FARGATE_SIZES.items() for memory in memories
+                  if int(cpu) >= cpu_units and memory >= memory_mib]
+    if not candidates:
+        return None
+    cpu, memory = min(candidates, key=lambda size: (monthly_cost(*size, cpu_architecture=cpu_architecture), int(size[0])))
+    return cpu, str(memory)
+
+
+def fetch_utilization(cluster, services, days=DEFAULT_DAYS, period=DEFAULT_PERIOD):
+    """Read the CPU (average) and memory (maximum) utilization of services with batched get_metric_data calls.
+
+    Returns:
+        dict: Service name to {'cpu': [...], 'memory': [...]} lists of percentages.
+    """
+    cloudwatch_client = clients.get_client('cloudwatch')
+    queries = []
+    for index, service in enumerate(services):
+        for key, metric, stat in (('cpu', 'CPUUtilization', 'Average'), ('memory', 'MemoryUtilization', 'Maximum')):
+            queries.append({
+                'Id': f'{key}{index}',
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/ECS',
+                        'MetricName': metric,
+                        'Dimensions': [{'Name': 'ClusterName', 'Value': cluster},
+                                       {'Name': 'ServiceName', 'Value': service}]
+                    },
+                    'Period': period,
+                    'Stat': stat
+                }
+            })
+
+    end = time.time()
+    values = {query['Id']: [] for query in queries}
+    for i in range(0, len(queries), MAX_QUERIES):
+        kwargs = {'MetricDataQueries': queries[i:i + MAX_QUERIES], 'StartTime': end - days * 86400, 'EndTime': end}
+        while True:
+            response = cloudwatch_client.get_metric_data(**kwargs)
+            for result in response['MetricDataResults']:
+                values[result['Id']] += result['Values']
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+    return {service: {'cpu': values[f'cpu{index}'], 'memory': values[f'memory{index}']}
+            for index, service in enumerate(services)}
+
+
+class Recommendation:
+    """A Fargate size for a service, derived from its utilization history."""
+
+    def __init__(self, service, current_cpu, current_memory, cpu_used, memory_used, datapoints, size,
+                 cpu_architecture='X86_64'):
+        self.service = service
+        self.cpu_architecture = cpu_architecture
+        self.current = (str(current_cpu), str(current_memory))
+        self.cpu_used = cpu_used
+        self.memory_used = memory_used
+        self.datapoints = datapoints
+        self.cpu, self.memory = size or (None, None)
+
+    @property
+    def changed(self):
+        return self.cpu is not None and (self.cpu, self.memory) != self.current
+
+    @property
+    def monthly_savings(self):
+        if self.cpu is None:
+            return 0.0
+        return (monthly_cost(*self.current, cpu_architecture=self.cpu_architecture)
+                - monthly_cost(self.cpu, self.memory, cpu_architecture=self.cpu_architecture))
+
+    def format(self):
+        header = (f"'{self.service}': {self.datapoints} datapoints, p{int(CPU_PERCENTILE * 100)} CPU "
+                  f"{self.cpu_used:.0f} units, peak memory {self.memory_used:.0f} MiB")
+        if self.cpu is None:
+            return f"{header}. No Fargate size is large enough."
+        if not self.changed:
+            return f"{header}. Current size {self.current[0]}/{self.current[1]} is right."
+        change = 'saves' if self.monthly_savings >= 0 else 'costs'
+        return (f"{header}. Recommended {self.cpu}/{self.memory} instead of {self.current[0]}/{self.current[1]}, "
+                f"which {change} {abs(self.monthly_savings):.2f} USD per task-month on {self.cpu_architecture}.")
+
+
+def recommend(service, current_cpu, current_memory, utilization, cpu_headroom=CPU_HEADROOM,
+              memory_headroom=MEMORY_HEADROOM, cpu_architecture='X86_64'):
+    """Recommend a size from utilization percentages measured at the current size.
+
+    CPU is sized for its 95th percentile and memory for its peak, each with
+    headroom on top, and priced for the given CPU architecture. Returns None
+    when there are too few datapoints.
+    """
+    cpu_values, memory_values = utilization['cpu'], utilization['memory']
+    datapoints = min(len(cpu_values), len(memory_values))
+    if datapoints < MIN_DATAPOINTS:
+        logger.warning(f"Only {datapoints} utilization datapoints for '{service}', not enough to size it.")
+        return None
+
+    cpu_percent, = percentiles(cpu_values, [CPU_PERCENTILE])
+    cpu_used = cpu_percent / 100 * int(current_cpu)
+    memory_used = max(memory_values) / 100 * int(current_memory)
+    size = cheapest_size(cpu_used * (1 + cpu_headroom), memory_used * (1 + memory_headroom), cpu_architecture)
+    return Recommendation(service, current_cpu, current_memory, cpu_used, memory_used, datapoints, size,
+                          cpu_architecture)
+
+
+def recommend_services(cluster, services, days=DEFAULT_DAYS, cpu_architecture=None):
+    """Recommend sizes for several services of a cluster, reading their metrics in bulk.
+
+    Sizes are priced for the CPU architecture of each service's task definition,
+    or for cpu_architecture when given (a service moving to another one).
+
+    Returns:
+        dict: Service name to Recommendation, or None when there is not enough data.
+    """
+    ecs_client = clients.get_client('ecs')
+    current = {}
+    for batch in waiters.chunks(services, waiters.SERVICE_BATCH_SIZE):
+        for service in ecs_client.describe_services(cluster=cluster, services=batch)['services']:
+            task_definition = ecs_client.describe_task_definition(
+                taskDefinition=service['taskDefinition'])['taskDefinition']
+            architecture = (task_definition.get('runtimePlatform') or {}).get('cpuArchitecture') or 'X86_64'
+            current[service['serviceName']] = (task_definition['cpu'], task_definition['memory'],
+                                               cpu_architecture or architecture)
+
+    utilization = fetch_utilization(cluster, list(current), days)
+    return {service: recommend(service, cpu, memory, utilization[service], cpu_architecture=architecture)
+            for service, (cpu, memory, architecture) in current.items()}
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Recommend Fargate sizes from CloudWatch utilization.")
+    parser.add_argument('services', nargs='+')
+    parser.add_argument('--cluster', help="Defaults to ECS_CLUSTER.")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="Days of history to read.")
+    args = parser.parse_args()
+
+    for service, recommendation in recommend_services(args.cluster or config.ecs_cluster, args.services,
+                                                      args.days).items():
+        print(recommendation.format() if recommendation else f"'{service}': not enough data.")
+
+
+if __name__ == '__main__':
+    main()
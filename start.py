@@ -1,6 +1,12 @@
+import argparse
+import logging
 import os
-import boto3
-import docker
+import sys
+import clients
+import image_publish
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
 
 # Load environment variables from .env file
 def load_env_variables():
@@ -9,14 +15,8 @@ def load_env_variables():
             key, value = line.strip().split('=')
             os.environ[key.strip()] = value.strip()
 
-load_env_variables()
-
-# Define AWS region and ECR client
-AWS_REGION = os.environ['AWS_REGION']
-ecr = boto3.client('ecr', region_name=AWS_REGION)
-
 # Check if ECR repository exists, create if not
-def check_ecr_repo():
+def check_ecr_repo(ecr):
     repo_name = os.environ['PROJECT_NAME']
     try:
         response = ecr.describe_repositories(repositoryNames=[repo_name])
@@ -26,22 +26,60 @@ def check_ecr_repo():
         ecr_repo_uri = response['repository']['repositoryUri']
     return ecr_repo_uri
 
-# Get ECR repository URI
-ecr_repo_uri = check_ecr_repo()
+# Push Docker image to ECR, skipping tags that already hold it
+def push_docker_image(ecr, ecr_repo_uri, tags):
+    # The Docker SDK is only needed by this command, so import it here
+    import docker
+    docker_client = docker.from_env()
+    new_img = os.environ.get('NEW_IMG', 'NEW_IMG')
+    if ':' not in new_img.rsplit('/', 1)[-1]:
+        new_img += ':latest'
+    jobs = [(new_img, ecr_repo_uri, tag) for tag in tags]
+    results = image_publish.publish_images(ecr, docker_client, jobs)
+    failed = [tag for (_, tag), result in results.items() if isinstance(result, Exception)]
+    if failed:
+        raise RuntimeError(f"Failed to push tags: {', '.join(failed)}")
+
+# Build NEW_IMG for each platform and push them to ECR as one multi-arch image
+def push_multiarch_image(ecr, ecr_repo_uri, tags, platforms, build_context):
+    import docker
+    docker_client = docker.from_env()
+    new_img = os.environ.get('NEW_IMG', 'NEW_IMG')
+    # Only the last path segment has a tag, a registry host may have a port
+    if ':' in new_img.rsplit('/', 1)[-1]:
+        new_img = new_img.rsplit(':', 1)[0]
+    image_names = []
+    for platform in platforms:
+        image_name = f"{new_img}:{platform.split('/')[1]}"
+        image_publish.build_image(docker_client, build_context, image_name, platform)
+        image_names.append(image_name)
+    for tag in tags:
+        image_publish.publish_multiarch(ecr, docker_client, image_names, ecr_repo_uri, tag)
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the image to ECR and deploy it.")
+    parser.add_argument('--extra-tag', action='append', default=[], help="Additional tag to push the image under.")
+    parser.add_argument('--platform', action='append', default=[],
+                        help="Build NEW_IMG for this platform, e.g. linux/amd64 and linux/arm64, and push a multi-arch image.")
+    parser.add_argument('--build-context', default='.', help="Docker build context of --platform builds.")
+    args = parser.parse_args()
 
-# Login to ECR
-password = ecr.get_authorization_token(registryIds=['714443664516'])['authorizationToken']
-docker_client = docker.from_env()
-docker_client.login(username='AWS', password=password, registry='https://' + ecr_repo_uri)
+    load_env_variables()
 
-# Push Docker image to ECR
-def push_docker_image(ecr_repo_uri):
-    image_tag = os.environ['IMAGE_TAG']
-    new_img = 'NEW_IMG'  # Replace with the actual image name
-    docker_client.tag(new_img, ecr_repo_uri + ':' + image_tag)
-    docker_client.push(ecr_repo_uri + ':' + image_tag)
+    ecr = clients.get_client('ecr', region=os.environ['AWS_REGION'])
+    ecr_repo_uri = check_ecr_repo(ecr)
+    os.environ['ECR_REPO_URI'] = ecr_repo_uri
+    tags = [os.environ['IMAGE_TAG']] + args.extra_tag
+    if args.platform:
+        push_multiarch_image(ecr, ecr_repo_uri, tags, args.platform, args.build_context)
+    else:
+        push_docker_image(ecr, ecr_repo_uri, tags)
 
-push_docker_image(ecr_repo_uri)
+    # Run the deployment
+    import main as deploy
+    result = deploy.main()
+    if not result.ok:
+        sys.exit(1)
 
-# Run Python script
-import main
+if __name__ == '__main__':
+    main()
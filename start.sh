@@ -20,7 +20,13 @@ check_ecr_repo() {
     echo "${ecr_repo_uri}"
 }
 
-aws ecr get-login-password --region "${AWS_REGION}" | docker login --username AWS --password-stdin 714443664516.dkr.ecr.ap-southeast-5.amazonaws.com
+image_already_pushed() {
+    local ecr_repo_uri="$1"
+    local tag="$2"
+    local remote_digest
+    remote_digest=$(aws ecr describe-images --repository-name "${ecr_repo_uri#*/}" --image-ids imageTag="${tag}" --region "${AWS_REGION}" --query 'imageDetails[0].imageDigest' --output text 2>/dev/null) || return 1
+    docker image inspect "${NEW_IMG}:latest" --format '{{range .RepoDigests}}{{println .}}{{end}}' | grep -qx "${ecr_repo_uri}@${remote_digest}"
+}
 
 push_docker_image() {
     local ecr_repo_uri="$1"
@@ -29,6 +35,11 @@ push_docker_image() {
         echo "Error: Invalid ECR repository URI."
         exit 1
     fi
+    if image_already_pushed "${ecr_repo_uri}" "${tag}"; then
+        echo "${ecr_repo_uri}:${tag} is already up to date, skipping push."
+        return
+    fi
+    aws ecr get-login-password --region "${AWS_REGION}" | docker login --username AWS --password-stdin "${ecr_repo_uri%%/*}"
     docker tag "${NEW_IMG}:latest" "${ecr_repo_uri}:${tag}"
     docker push "${ecr_repo_uri}:${tag}"
     if [ $? -ne 0 ]; then
@@ -37,7 +48,19 @@ push_docker_image() {
     fi
 }
 
+# PLATFORMS=linux/amd64,linux/arm64 builds the current directory for each platform
+# with buildx and pushes one multi-arch image
+push_multiarch_image() {
+    local ecr_repo_uri="$1"
+    aws ecr get-login-password --region "${AWS_REGION}" | docker login --username AWS --password-stdin "${ecr_repo_uri%%/*}"
+    docker buildx build --platform "${PLATFORMS}" --provenance=false -t "${ecr_repo_uri}:${IMAGE_TAG}" --push .
+}
+
 ecr_repo_uri=$(check_ecr_repo)
 export ECR_REPO_URI="${ecr_repo_uri}"
-push_docker_image "${ecr_repo_uri}"
+if [ -n "${PLATFORMS}" ]; then
+    push_multiarch_image "${ecr_repo_uri}"
+else
+    push_docker_image "${ecr_repo_uri}"
+fi
 python main.py
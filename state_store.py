@@ -0,0 +1,342 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Can point elsewhere, e.g. for benchmarks
+DEPLOYMENTS_DIR = os.getenv('DEPLOYMENTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'deployments'))
+DEFAULT_STORE_PATH = os.path.join(DEPLOYMENTS_DIR, 'deployments.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    service_name TEXT NOT NULL,
+    ecs_cluster TEXT NOT NULL,
+    domain_name TEXT,
+    project_name TEXT,
+    task_definition_arn TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1,
+    source_file TEXT UNIQUE,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deployments_service ON deployments (service_name, created_at);
+CREATE INDEX IF NOT EXISTS idx_deployments_domain ON deployments (domain_name, created_at);
+CREATE INDEX IF NOT EXISTS idx_deployments_cluster ON deployments (ecs_cluster, created_at);
+CREATE INDEX IF NOT EXISTS idx_deployments_created ON deployments (created_at);
+CREATE TABLE IF NOT EXISTS task_definition_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    deployment_id INTEGER NOT NULL REFERENCES deployments (id),
+    task_definition_arn TEXT NOT NULL,
+    changed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_deployment ON task_definition_history (deployment_id, changed_at);
+CREATE TABLE IF NOT EXISTS task_startups (
+    task_arn TEXT PRIMARY KEY,
+    service_name TEXT NOT NULL,
+    ecs_cluster TEXT NOT NULL,
+    ecs_deployment_id TEXT NOT NULL,
+    task_definition_arn TEXT NOT NULL,
+    created_at REAL,
+    provisioning REAL,
+    pull REAL,
+    start REAL,
+    healthy REAL,
+    total REAL
+);
+CREATE INDEX IF NOT EXISTS idx_startups_service ON task_startups (service_name, created_at);
+"""
+# Columns added after the first release of the store, with the expression filling them in from the record
+MIGRATIONS = [
+    ('project_name', "ALTER TABLE deployments ADD COLUMN project_name TEXT",
+     "UPDATE deployments SET project_name = json_extract(record, '$.project_name')"),
+]
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_deployments_project ON deployments (project_name, created_at);
+"""
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+FILE_NAME_PATTERN = re.compile(r'deployment_info_.+_(\d{8}-\d{6})\.json$')
+
+
+def parse_timestamp(timestamp):
+    return time.mktime(time.strptime(timestamp, TIMESTAMP_FORMAT))
+
+
+class DeploymentStore:
+    """SQLite store of deployment records.
+
+    Records are the dicts written by `utils.save_deployment_info`, plus a
+    `deployment_id` key when read back. Each operation opens its own
+    connection, so a store can be shared between threads.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            conn.executescript(INDEXES)
+
+    @staticmethod
+    def _migrate(conn):
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(deployments)')}
+        for column, alter, fill in MIGRATIONS:
+            if column not in columns:
+                conn.execute(alter)
+                conn.execute(fill)
+                logger.info(f"Deployment store migrated: added the '{column}' column.")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_record(row):
+        if row is None:
+            return None
+        record = json.loads(row['record'])
+        record['deployment_id'] = row['id']
+        record['created_at'] = row['created_at']
+        record['active'] = bool(row['active'])
+        return record
+
+    def add(self, record, created_at=None, source_file=None):
+        """Insert a deployment record and return its ID."""
+        now = time.time()
+        created_at = created_at or now
+        record = {k: v for k, v in record.items() if k not in ('deployment_id', 'created_at', 'active')}
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO deployments (service_name, ecs_cluster, domain_name, project_name, task_definition_arn, '
+                'created_at, updated_at, source_file, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (record['service_name'], record['ecs_cluster'], record.get('domain_name'), record.get('project_name'),
+                 record.get('task_definition_arn'), created_at, now, source_file, json.dumps(record))
+            )
+            deployment_id = cursor.lastrowid
+            conn.execute(
+                'INSERT INTO task_definition_history (deployment_id, task_definition_arn, changed_at) VALUES (?, ?, ?)',
+                (deployment_id, record.get('task_definition_arn', ''), created_at)
+            )
+        return deployment_id
+
+    def get(self, deployment_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM deployments WHERE id = ?', (deployment_id,)).fetchone()
+        return self._to_record(row)
+
+    def get_by_file(self, source_file):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM deployments WHERE source_file = ?',
+                               (os.path.abspath(source_file),)).fetchone()
+        return self._to_record(row)
+
+    def latest(self, service_name=None, domain_name=None, cluster=None, active_only=True, project_name=None):
+        """Return the most recent deployment matching the given service, domain, cluster and/or project."""
+        records = self.find(service_name, domain_name, cluster, active_only=active_only, limit=1,
+                            project_name=project_name)
+        return records[0] if records else None
+
+    def find(self, service_name=None, domain_name=None, cluster=None, since=None, until=None,
+             active_only=True, limit=None, project_name=None):
+        """Return deployments matching all given filters, newest first."""
+        clauses, params = [], []
+        for column, value in (('service_name', service_name), ('domain_name', domain_name), ('ecs_cluster', cluster),
+                              ('project_name', project_name)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until)
+        if active_only:
+            clauses.append('active = 1')
+
+        query = 'SELECT * FROM deployments'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY created_at DESC, id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def history(self, deployment_id):
+        """Return the task definition ARNs a deployment has run, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT task_definition_arn, changed_at FROM task_definition_history '
+                'WHERE deployment_id = ? ORDER BY changed_at, id', (deployment_id,)
+            ).fetchall()
+        return [(row['task_definition_arn'], row['changed_at']) for row in rows]
+
+    def update_fields(self, deployment_id, **fields):
+        """Atomically merge fields into a deployment record."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT record FROM deployments WHERE id = ?', (deployment_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"Deployment {deployment_id} not found.")
+            record = json.loads(row['record'])
+            record.update(fields)
+            conn.execute(
+                'UPDATE deployments SET record = ?, service_name = ?, task_definition_arn = ?, domain_name = ?, '
+                'project_name = ?, updated_at = ? WHERE id = ?',
+                (json.dumps(record), record['service_name'], record.get('task_definition_arn'), record.get('domain_name'),
+                 record.get('project_name'), now, deployment_id)
+            )
+            if 'task_definition_arn' in fields:
+                conn.execute(
+                    'INSERT INTO task_definition_history (deployment_id, task_definition_arn, changed_at) VALUES (?, ?, ?)',
+                    (deployment_id, fields['task_definition_arn'], now)
+                )
+        return record
+
+    def update_task_definition(self, deployment_id, task_definition_arn):
+        """Atomically switch a deployment to a new task definition and record it in its history."""
+        return self.update_fields(deployment_id, task_definition_arn=task_definition_arn)
+
+    def add_task_startups(self, cluster, service_name, ecs_deployment_id, rows):
+        """Record the startup phases of tasks, see `task_startup.task_phases`. Tasks already recorded are replaced."""
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO task_startups (task_arn, service_name, ecs_cluster, ecs_deployment_id, '
+                'task_definition_arn, created_at, provisioning, pull, start, healthy, total) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(row['task_arn'], service_name, cluster, ecs_deployment_id, row['task_definition_arn'],
+                  row['created_at'], row['provisioning'], row['pull'], row['start'], row['healthy'], row['total'])
+                 for row in rows]
+            )
+
+    def task_startups(self, service_name, cluster=None):
+        """Return the recorded task startups of a service, newest first."""
+        query = 'SELECT * FROM task_startups WHERE service_name = ?'
+        params = [service_name]
+        if cluster is not None:
+            query += ' AND ecs_cluster = ?'
+            params.append(cluster)
+        with self._connect() as conn:
+            rows = conn.execute(query + ' ORDER BY created_at DESC', params).fetchall()
+        return [dict(row) for row in rows]
+
+    def deactivate(self, deployment_id):
+        with self._connect() as conn:
+            conn.execute('UPDATE deployments SET active = 0, updated_at = ? WHERE id = ?', (time.time(), deployment_id))
+
+    def import_json_files(self, directory=DEPLOYMENTS_DIR):
+        """Import the deployment_info_*.json files of a directory. Files already imported are skipped."""
+        imported = 0
+        for file_path in sorted(glob.glob(os.path.join(directory, 'deployment_info_*.json'))):
+            file_path = os.path.abspath(file_path)
+            if self.get_by_file(file_path):
+                continue
+            try:
+                with open(file_path, 'r') as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error(f"Skipping '{file_path}': {e}")
+                continue
+
+            match = FILE_NAME_PATTERN.search(os.path.basename(file_path))
+            created_at = parse_timestamp(match.group(1)) if match else os.path.getmtime(file_path)
+            self.add(record, created_at=created_at, source_file=file_path)
+            imported += 1
+        logger.info(f"Imported {imported} deployment file(s) from '{directory}'.")
+        return imported
+
+
+def _discover(target, store):
+    # Imported here, the store itself does not need AWS clients
+    import discovery
+    try:
+        record = discovery.find_deployment(target)
+    except Exception as e:
+        logger.warning(f"Error looking up '{target}' from resource tags: {e}")
+        return None
+    if record is None:
+        return None
+    deployment_id = store.add(record)
+    logger.info(f"Deployment of '{target}' found from resource tags and added as deployment {deployment_id}.")
+    return store.get(deployment_id)
+
+
+def resolve_deployment(target, store=None):
+    """Load a deployment by JSON file path, service name or project name.
+
+    A deployment that is neither in a file nor in the store is looked up from
+    the tags of its resources, see `discovery.find_deployment`, and added to
+    the store.
+
+    Returns:
+        tuple: (record, deployment_id, file_path). deployment_id is None when the
+        file is not in the store, and file_path is None when the record only
+        exists in the store.
+    """
+    store = store or DeploymentStore()
+    if os.path.isfile(target):
+        with open(target, 'r') as f:
+            record = json.load(f)
+        stored = store.get_by_file(target)
+        return record, stored['deployment_id'] if stored else None, target
+
+    stored = store.latest(service_name=target)
+    if stored is None:
+        # Blue/green rollouts move a project to a service named after its color
+        stored = store.latest(project_name=target)
+    if stored is None:
+        stored = _discover(target, store)
+    if stored is None:
+        return None, None, None
+    return stored, stored['deployment_id'], None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage the deployment state store.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="Import existing deployment JSON files.")
+    import_parser.add_argument('directory', nargs='?', default=DEPLOYMENTS_DIR)
+    list_parser = subparsers.add_parser('list', help="List deployments, newest first.")
+    list_parser.add_argument('--service')
+    list_parser.add_argument('--domain')
+    list_parser.add_argument('--cluster')
+    list_parser.add_argument('--all', action='store_true', help="Include rolled back deployments.")
+    args = parser.parse_args()
+
+    store = DeploymentStore()
+    if args.command == 'import':
+        store.import_json_files(args.directory)
+    else:
+        for record in store.find(args.service, args.domain, args.cluster, active_only=not args.all):
+            created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['created_at']))
+            status = 'active' if record['active'] else 'removed'
+            print(f"{record['deployment_id']:>6}  {created}  {status:<8} {record['ecs_cluster']}/{record['service_name']}  "
+                  f"{record.get('domain_name', '')}  {record.get('task_definition_arn', '')}")
+
+
+if __name__ == '__main__':
+    main()
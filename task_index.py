@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from state_store import DEPLOYMENTS_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(DEPLOYMENTS_DIR, 'task_definition_index.json')
+# Bumped whenever spec_hash changes, which makes older indexes rebuild
+INDEX_VERSION = 4
+
+
+def _revision(task_definition_arn):
+    family, revision = task_definition_arn.rsplit('/', 1)[-1].rsplit(':', 1)
+    return family, int(revision)
+
+
+def container_spec(container_definition):
+    """(image, container cpu, health check, settings) of a container definition, as compared by spec_hash.
+
+    The settings are those set by task profiles: ulimits, stop timeout and log configuration.
+    """
+    log_configuration = container_definition.get('logConfiguration') or {}
+    settings = {
+        'ulimits': container_definition.get('ulimits') or None,
+        'stopTimeout': container_definition.get('stopTimeout'),
+        'logDriver': log_configuration.get('logDriver'),
+        'logOptions': log_configuration.get('options') or None,
+    }
+    return (container_definition['image'], container_definition.get('cpu', 0),
+            container_definition.get('healthCheck') or None, settings)
+
+
+def spec_hash(family, cpu, memory, containers, ephemeral_storage=None, cpu_architecture='X86_64'):
+    """Hash the parts of a task definition that decide whether it can be reused.
+
+    Args:
+        family (str): The task definition family.
+        cpu (str): Task-level CPU units.
+        memory (str): Task-level memory in MiB.
+        containers (list): Tuples returned by `container_spec`.
+        ephemeral_storage (int): Ephemeral storage in GiB, or None for the default.
+        cpu_architecture (str): X86_64 or ARM64.
+    """
+    spec = {
+        'family': family,
+        'cpu': str(cpu),
+        'memory': str(memory),
+        'ephemeral_storage': ephemeral_storage,
+        'cpu_architecture': cpu_architecture,
+        'containers': sorted([image, str(container_cpu), json.dumps(health_check or {}, sort_keys=True),
+                              json.dumps(settings, sort_keys=True)]
+                             for image, container_cpu, health_check, settings in containers)
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def task_definition_hash(task_definition):
+    """Hash a task definition from describe_task_definition, or the arguments of register_task_definition."""
+    containers = [container_spec(c) for c in task_definition['containerDefinitions']]
+    return spec_hash(task_definition['family'], task_definition.get('cpu', '0'), task_definition.get('memory', '0'),
+                     containers, (task_definition.get('ephemeralStorage') or {}).get('sizeInGiB'),
+                     # Fargate runs X86_64 when no platform is set
+                     (task_definition.get('runtimePlatform') or {}).get('cpuArchitecture') or 'X86_64')
+
+
+class TaskDefinitionIndex:
+    """On-disk index from task definition spec hash to ARN, per family.
+
+    The index remembers the newest revision it has seen for each family, so a
+    sync only describes revisions registered since the previous one.
+    """
+
+    def __init__(self, ecs_client, path=DEFAULT_INDEX_PATH):
+        self.ecs_client = ecs_client
+        self.path = path
+        self._lock = threading.Lock()
+        self._families = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != INDEX_VERSION:
+                logger.info(f"Task definition index '{self.path}' has an older format. Rebuilding it.")
+                return {}
+            return data.get('families', {})
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning(f"Task definition index '{self.path}' is not valid JSON. Rebuilding it.")
+            return {}
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'families': self._families}, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def _family(self, family):
+        return self._families.setdefault(family, {'last_revision': 0, 'specs': {}})
+
+    def add(self, task_definition):
+        with self._lock:
+            entry = self._family(task_definition['family'])
+            key = task_definition_hash(task_definition)
+            arn = task_definition['taskDefinitionArn']
+            revision = task_definition['revision']
+            current = entry['specs'].get(key)
+            # Keep the newest revision for identical specs
+            if current is None or _revision(current)[1] < revision:
+                entry['specs'][key] = arn
+            # A revision registered right after the last one seen needs no describe on the next sync.
+            # After a gap, revisions registered elsewhere in between are still left to sync.
+            if revision == entry['last_revision'] + 1:
+                entry['last_revision'] = revision
+
+    def sync(self, family):
+        """Index the ACTIVE revisions of a family registered since the last sync."""
+        with self._lock:
+            last_revision = self._family(family)['last_revision']
+
+        new_arns = []
+        paginator = self.ecs_client.get_paginator('list_task_definitions')
+        for page in paginator.paginate(familyPrefix=family, status='ACTIVE', sort='DESC'):
+            done = False
+            for arn in page['taskDefinitionArns']:
+                arn_family, revision = _revision(arn)
+                if arn_family != family:
+                    continue
+                if revision <= last_revision:
+                    done = True
+                    break
+                new_arns.append(arn)
+            if done:
+                break
+
+        for arn in new_arns:
+            self.add(self.ecs_client.describe_task_definition(taskDefinition=arn)['taskDefinition'])
+
+        if new_arns:
+            with self._lock:
+                entry = self._family(family)
+                entry['last_revision'] = max(entry['last_revision'], _revision(new_arns[0])[1])
+            self.save()
+        logger.info(f"Indexed {len(new_arns)} new revision(s) of task definition family '{family}'.")
+
+    def find(self, task_definition):
+        """Return the ARN of an ACTIVE task definition matching the arguments of register_task_definition, or None."""
+        family = task_definition['family']
+        key = task_definition_hash(task_definition)
+        with self._lock:
+            arn = self._family(family)['specs'].get(key)
+        if arn is None:
+            return None
+
+        # The revision may have been deregistered since it was indexed
+        task_definition = self.ecs_client.describe_task_definition(taskDefinition=arn)['taskDefinition']
+        if task_definition.get('status') != 'ACTIVE':
+            with self._lock:
+                self._family(family)['specs'].pop(key, None)
+            self.save()
+            return None
+        return arn
@@ -0,0 +1,213 @@
+import argparse
+import logging
+import statistics
+import time
+import clients
+import config
+import throttling
+import waiters
+from state_store import DeploymentStore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PHASES = ('provisioning', 'pull', 'start', 'healthy')
+# describe_tasks accepts at most 100 tasks per call
+TASK_BATCH_SIZE = 100
+# A phase has regressed when its median grows by this factor and at least MIN_REGRESSION seconds
+REGRESSION_FACTOR = 1.25
+MIN_REGRESSION = 5.0
+
+
+def _epoch(value):
+    """Epoch seconds of a boto3 datetime, or of a number already in epoch seconds."""
+    if value is None:
+        return None
+    return value.timestamp() if hasattr(value, 'timestamp') else float(value)
+
+
+def _between(start, end):
+    return end - start if start is not None and end is not None else None
+
+
+def task_ip(task):
+    for container in task.get('containers', []):
+        for interface in container.get('networkInterfaces', []):
+            if interface.get('privateIpv4Address'):
+                return interface['privateIpv4Address']
+    return None
+
+
+def task_phases(task, healthy_at=None):
+    """Break the startup of a task returned by describe_tasks into phases, in seconds.
+
+    - provisioning: createdAt to pullStartedAt (placement and network interface)
+    - pull: pullStartedAt to pullStoppedAt
+    - start: pullStoppedAt to startedAt
+    - healthy: startedAt to `healthy_at`, when the load balancer first saw the task healthy
+
+    Phases whose timestamps are missing are None.
+    """
+    created = _epoch(task.get('createdAt'))
+    pull_started = _epoch(task.get('pullStartedAt'))
+    pull_stopped = _epoch(task.get('pullStoppedAt'))
+    started = _epoch(task.get('startedAt'))
+    healthy = _epoch(healthy_at)
+    return {
+        'provisioning': _between(created, pull_started),
+        'pull': _between(pull_started, pull_stopped),
+        'start': _between(pull_stopped, started),
+        'healthy': _between(started, healthy),
+        'total': _between(created, healthy if healthy is not None else started),
+    }
+
+
+def deployment_tasks(cluster, service):
+    """Return the ID of a service's primary deployment and its running tasks.
+
+    Tasks are described in batches of 100.
+    """
+    ecs_client = clients.get_client('ecs')
+    # Called right after a rollout, which a cached result could predate
+    with throttling.fresh():
+        services = ecs_client.describe_services(cluster=cluster, services=[service])['services']
+    deployment = next((d for d in services[0].get('deployments', []) if d.get('status') == 'PRIMARY'),
+                      None) if services else None
+    if deployment is None:
+        return None, []
+
+    task_arns = []
+    paginator = ecs_client.get_paginator('list_tasks')
+    for page in paginator.paginate(cluster=cluster, serviceName=service, desiredStatus='RUNNING'):
+        task_arns += page['taskArns']
+
+    tasks = []
+    for batch in waiters.chunks(task_arns, TASK_BATCH_SIZE):
+        tasks += [task for task in ecs_client.describe_tasks(cluster=cluster, tasks=batch)['tasks']
+                  if task.get('startedBy') == deployment['id']]
+    return deployment['id'], tasks
+
+
+def _medians(rows):
+    medians = {}
+    for phase in PHASES + ('total',):
+        values = [row[phase] for row in rows if row.get(phase) is not None]
+        medians[phase] = statistics.median(values) if values else None
+    return medians
+
+
+class StartupReport:
+    """Startup phases of the tasks of one ECS deployment, compared with the previous deployment."""
+
+    def __init__(self, service, deployment_id, rows, previous_rows=None):
+        self.service = service
+        self.deployment_id = deployment_id
+        self.rows = rows
+        self.medians = _medians(rows)
+        self.previous = _medians(previous_rows) if previous_rows else None
+
+    @property
+    def regressions(self):
+        """Phases whose median grew by REGRESSION_FACTOR and at least MIN_REGRESSION seconds."""
+        if self.previous is None:
+            return []
+        regressed = []
+        for phase in PHASES + ('total',):
+            current, previous = self.medians[phase], self.previous[phase]
+            if current is not None and previous is not None and \
+               current > previous * REGRESSION_FACTOR and current - previous >= MIN_REGRESSION:
+                regressed.append(phase)
+        return regressed
+
+    def format(self):
+        def seconds(value):
+            return f"{value:.1f}s" if value is not None else '-'
+
+        lines = [f"Startup of {len(self.rows)} task(s) of '{self.service}' ({self.deployment_id}):",
+                 f"{'TASK':<34} " + ' '.join(f"{phase.upper():>12}" for phase in PHASES + ('total',))]
+        for row in self.rows:
+            lines.append(f"{row['task_arn'].rsplit('/', 1)[-1]:<34} " +
+                         ' '.join(f"{seconds(row[phase]):>12}" for phase in PHASES + ('total',)))
+        lines.append(f"{'median':<34} " + ' '.join(f"{seconds(self.medians[phase]):>12}" for phase in PHASES + ('total',)))
+        if self.previous:
+            lines.append(f"{'previous median':<34} " +
+                         ' '.join(f"{seconds(self.previous[phase]):>12}" for phase in PHASES + ('total',)))
+        for phase in self.regressions:
+            lines.append(f"Regression: {phase} went from {seconds(self.previous[phase])} to {seconds(self.medians[phase])}.")
+        return '\n'.join(lines)
+
+
+def analyze(cluster, service, healthy_at=None, store=None):
+    """Measure and record the startup of the tasks of a service's current deployment.
+
+    Call it once the service is stable. Each task is stored per ECS deployment,
+    so later deployments of the service are compared with it.
+
+    Args:
+        cluster (str): The name of the ECS cluster.
+        service (str): The name of the ECS service.
+        healthy_at (dict): Task private IP to the epoch time its target became healthy,
+            e.g. from `utils.wait_for_targets_ready`. Without it, the healthy phase is unknown.
+
+    Returns:
+        StartupReport: None when the service has no primary deployment.
+    """
+    store = store or DeploymentStore()
+    healthy_at = healthy_at or {}
+    deployment_id, tasks = deployment_tasks(cluster, service)
+    if deployment_id is None:
+        logger.warning(f"ECS service '{service}' has no primary deployment to analyze.")
+        return None
+
+    rows = []
+    for task in tasks:
+        row = task_phases(task, healthy_at.get(task_ip(task)))
+        row.update(task_arn=task['taskArn'], task_definition_arn=task['taskDefinitionArn'],
+                   created_at=_epoch(task.get('createdAt')))
+        rows.append(row)
+    store.add_task_startups(cluster, service, deployment_id, rows)
+
+    previous = [row for row in store.task_startups(service, cluster) if row['ecs_deployment_id'] != deployment_id]
+    previous_id = previous[0]['ecs_deployment_id'] if previous else None
+    report = StartupReport(service, deployment_id, rows,
+                           [row for row in previous if row['ecs_deployment_id'] == previous_id])
+    for phase in report.regressions:
+        logger.warning(f"Startup regression of '{service}': median {phase} went from "
+                       f"{report.previous[phase]:.1f}s to {report.medians[phase]:.1f}s.")
+    return report
+
+
+def history(service, cluster=None, store=None):
+    """Median startup phases of each recorded ECS deployment of a service, newest first."""
+    store = store or DeploymentStore()
+    deployments = {}
+    for row in store.task_startups(service, cluster):
+        deployments.setdefault(row['ecs_deployment_id'], []).append(row)
+    return [(deployment_id, rows[0]['task_definition_arn'], min(row['created_at'] for row in rows), _medians(rows))
+            for deployment_id, rows in deployments.items()]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Break down the startup time of a service's tasks.")
+    parser.add_argument('service')
+    parser.add_argument('--cluster', help="Defaults to ECS_CLUSTER.")
+    parser.add_argument('--history', action='store_true', help="Show the recorded deployments instead.")
+    args = parser.parse_args()
+    cluster = args.cluster or config.ecs_cluster
+
+    if args.history:
+        print(f"{'STARTED':<20} {'TASK DEFINITION':<40} " + ' '.join(f"{phase.upper():>12}" for phase in PHASES + ('total',)))
+        for _, task_definition_arn, created_at, medians in history(args.service, cluster):
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_at))
+            print(f"{started:<20} {task_definition_arn.rsplit('/', 1)[-1]:<40} " +
+                  ' '.join(f"{medians[phase]:>11.1f}s" if medians[phase] is not None else f"{'-':>12}"
+                           for phase in PHASES + ('total',)))
+        return
+
+    report = analyze(cluster, args.service)
+    print(report.format() if report else f"'{args.service}' has no deployment to analyze.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import pytest
+
+# The deployment files, store and task definition index of the tests go to a temporary directory
+os.environ['DEPLOYMENTS_DIR'] = tempfile.mkdtemp(prefix='deployments-')
+
+import clients
+import config
+
+
+@pytest.fixture(autouse=True)
+def deployments_dir():
+    """Start every test with an empty deployment store."""
+    yield os.environ['DEPLOYMENTS_DIR']
+    shutil.rmtree(os.environ['DEPLOYMENTS_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['DEPLOYMENTS_DIR'])
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Fake AWS clients by service name, returned by clients.get_client."""
+    fakes = {}
+    monkeypatch.setattr(clients, 'get_client', lambda service, *args, **kwargs: fakes[service])
+    return fakes
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    """Set config.py settings without reading the environment."""
+    def set_settings(**values):
+        # Settings are cached in the module's globals once read
+        for name, value in values.items():
+            monkeypatch.setitem(vars(config), name, value)
+    set_settings(ecs_cluster='cluster', alb_dns_name='alb.example.com', cloudflare_zone_id='zone',
+                 cloudflare_api_token='token', health_check_profile='conservative', task_profile='legacy',
+                 cpu_architecture='X86_64')
+    return set_settings
+
+
+@pytest.fixture
+def project(settings):
+    return config.project_settings('billing', 'billing.example.com', 'v1', 'repo/billing', 'X86_64')
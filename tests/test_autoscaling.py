@@ -0,0 +1,79 @@
+import pytest
+import autoscaling
+
+TARGET_GROUP_ARN = 'arn:aws:elasticloadbalancing:eu-west-1:123456789012:targetgroup/billing/1'
+
+
+class ObjectNotFoundException(Exception):
+    pass
+
+
+class FakeAutoScaling:
+    class exceptions:
+        ObjectNotFoundException = ObjectNotFoundException
+
+    def __init__(self, scheduled_actions=()):
+        self.calls = []
+        self.scheduled_actions = list(scheduled_actions)
+        self.registered = set()
+
+    def register_scalable_target(self, **kwargs):
+        self.calls.append(('register', kwargs['MinCapacity'], kwargs['MaxCapacity']))
+        self.registered.add(kwargs['ResourceId'])
+
+    def put_scaling_policy(self, PolicyName, PolicyType, TargetTrackingScalingPolicyConfiguration, **target):
+        self.calls.append(('policy', PolicyName, TargetTrackingScalingPolicyConfiguration))
+
+    def put_scheduled_action(self, ScheduledActionName, **kwargs):
+        self.calls.append(('schedule', ScheduledActionName, kwargs['ScalableTargetAction']))
+
+    def delete_scheduled_action(self, ScheduledActionName, **target):
+        self.calls.append(('delete', ScheduledActionName))
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, **kwargs):
+        actions = [{'ScheduledActionName': name} for name in self.scheduled_actions]
+        return [{'ScheduledActions': actions[:1]}, {'ScheduledActions': actions[1:]}]
+
+    def deregister_scalable_target(self, ResourceId, **target):
+        if ResourceId not in self.registered:
+            raise ObjectNotFoundException(ResourceId)
+        self.registered.remove(ResourceId)
+
+
+@pytest.fixture
+def scaling(aws, settings):
+    settings(alb_arn='arn:aws:elasticloadbalancing:eu-west-1:123456789012:loadbalancer/app/alb/1',
+             scaling_min_capacity=1, scaling_max_capacity=4, scaling_cpu_target=60.0,
+             scaling_requests_per_target=1000.0, scaling_schedules=[])
+    aws['application-autoscaling'] = FakeAutoScaling()
+    return aws['application-autoscaling']
+
+
+def test_service_gets_cpu_and_request_count_policies(scaling):
+    autoscaling.configure_service_scaling('cluster', 'billing', TARGET_GROUP_ARN, max_capacity=8)
+
+    assert scaling.calls[0] == ('register', 1, 8)
+    policies = {call[1]: call[2] for call in scaling.calls if call[0] == 'policy'}
+    assert policies['billing-cpu']['TargetValue'] == 60.0
+    assert policies['billing-requests']['PredefinedMetricSpecification'] == {
+        'PredefinedMetricType': 'ALBRequestCountPerTarget', 'ResourceLabel': 'app/alb/1/targetgroup/billing/1'}
+
+
+def test_schedules_are_put_and_only_our_stale_ones_removed(scaling):
+    scaling.scheduled_actions = ['billing-schedule-weekend', 'billing-schedule-office-hours', 'billing-manual']
+    schedules = [{'name': 'office-hours', 'schedule': 'cron(0 8 ? * MON-FRI *)', 'min': 2, 'max': 10}]
+
+    autoscaling.configure_service_scaling('cluster', 'billing', TARGET_GROUP_ARN, schedules=schedules)
+
+    assert ('schedule', 'billing-schedule-office-hours', {'MinCapacity': 2, 'MaxCapacity': 10}) in scaling.calls
+    # Scheduled actions created elsewhere are left alone
+    assert [call for call in scaling.calls if call[0] == 'delete'] == [('delete', 'billing-schedule-weekend')]
+
+
+def test_removing_scaling_of_an_unregistered_service(scaling):
+    autoscaling.configure_service_scaling('cluster', 'billing', TARGET_GROUP_ARN)
+    assert autoscaling.remove_service_scaling('cluster', 'billing')
+    assert not autoscaling.remove_service_scaling('cluster', 'billing')
@@ -0,0 +1,123 @@
+import pytest
+import bluegreen
+
+OLD_TG = 'arn:aws:elasticloadbalancing:eu-west-1:123456789012:targetgroup/billing/1'
+NEW_TG = 'arn:aws:elasticloadbalancing:eu-west-1:123456789012:targetgroup/billing-green/2'
+
+
+class FakeElbv2:
+    def __init__(self):
+        self.weights = []
+        self.health = 'healthy'
+        self.rules = [{'RuleArn': 'rule', 'Actions': [{'Type': 'forward', 'TargetGroupArn': OLD_TG}]}]
+
+    def modify_rule(self, RuleArn, Actions):
+        action = Actions[0]
+        groups = action['ForwardConfig']['TargetGroups'] if 'ForwardConfig' in action else \
+            [{'TargetGroupArn': action['TargetGroupArn'], 'Weight': 100}]
+        self.weights.append({group['TargetGroupArn']: group['Weight'] for group in groups})
+
+    def describe_target_health(self, TargetGroupArn):
+        return {'TargetHealthDescriptions': [{'Target': {'Id': '10.0.0.1'}, 'TargetHealth': {'State': self.health}}]}
+
+    def describe_rules(self, RuleArns):
+        return {'Rules': [rule for rule in self.rules if rule['RuleArn'] in RuleArns]}
+
+
+class FakeCloudWatch:
+    def __init__(self, old=0.1, new=0.1):
+        self.values = {'tg0': [old], 'tg1': [new]}
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime):
+        return {'MetricDataResults': [{'Id': query['Id'], 'Values': self.values[query['Id']]}
+                                      for query in MetricDataQueries]}
+
+
+@pytest.fixture
+def elbv2(aws, settings):
+    settings(alb_arn='arn:aws:elasticloadbalancing:eu-west-1:123456789012:loadbalancer/app/alb/1')
+    aws['elbv2'] = FakeElbv2()
+    aws['cloudwatch'] = FakeCloudWatch()
+    return aws['elbv2']
+
+
+def shift(**kwargs):
+    return bluegreen.shift_traffic('rule', OLD_TG, NEW_TG, steps=(10, 50), step_interval=60,
+                                   sleep=lambda seconds: None, **kwargs)
+
+
+def test_names_alternate_colors_within_the_length_limit():
+    assert bluegreen.next_name('billing', 'billing') == 'billing-green'
+    assert bluegreen.next_name('billing', 'billing-green') == 'billing-blue'
+    assert bluegreen.next_name('a' * 40, 'a' * 40, bluegreen.MAX_TARGET_GROUP_NAME) == 'a' * 26 + '-green'
+
+
+def test_forwarding_rule_finds_weighted_forwards(elbv2):
+    elbv2.rules.append({'RuleArn': 'weighted', 'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+        {'TargetGroupArn': OLD_TG, 'Weight': 90}, {'TargetGroupArn': NEW_TG, 'Weight': 10}]}}]})
+    assert bluegreen.forwarding_rule(['weighted'], NEW_TG)['RuleArn'] == 'weighted'
+    assert bluegreen.forwarding_rule(['rule'], NEW_TG) is None
+    assert bluegreen.forwarding_rule([], OLD_TG) is None
+
+
+def test_traffic_moves_step_by_step(elbv2):
+    assert shift()
+    assert elbv2.weights == [{OLD_TG: 90, NEW_TG: 10}, {OLD_TG: 50, NEW_TG: 50}, {NEW_TG: 100}]
+
+
+def test_unhealthy_new_targets_send_traffic_back(elbv2):
+    elbv2.health = 'unhealthy'
+    assert not shift()
+    assert elbv2.weights == [{OLD_TG: 90, NEW_TG: 10}, {OLD_TG: 100}]
+
+
+def test_slow_new_targets_send_traffic_back(elbv2, aws):
+    aws['cloudwatch'] = FakeCloudWatch(old=0.1, new=0.2)
+    assert not shift()
+    assert elbv2.weights[-1] == {OLD_TG: 100}
+
+    # Within an absolute limit, slower targets are accepted
+    elbv2.weights.clear()
+    assert shift(max_response_time=0.5)
+    assert elbv2.weights[-1] == {NEW_TG: 100}
+
+
+@pytest.fixture
+def rollout_steps(elbv2, aws, monkeypatch):
+    calls = []
+    aws['ecs'] = object()
+    monkeypatch.setattr(bluegreen, 'clone_target_group', lambda source, name: calls.append(('tg', name)) or NEW_TG)
+    monkeypatch.setattr(bluegreen, 'clone_service',
+                        lambda cluster, source, name, task_definition, target_group: calls.append(('service', name)))
+    monkeypatch.setattr(bluegreen, 'delete_service',
+                        lambda cluster, name, target_group: calls.append(('delete', name, target_group)))
+    monkeypatch.setattr(bluegreen.waiters, 'wait_for_services',
+                        lambda client, cluster, services: {services[0]: (bluegreen.waiters.COMPLETED, '')})
+    monkeypatch.setattr(bluegreen, 'shift_traffic', lambda *args: calls.append(('shift',)) or True)
+    return calls
+
+
+def deployment():
+    return {'ecs_cluster': 'cluster', 'service_name': 'billing', 'target_group_arn': OLD_TG, 'rules': ['rule']}
+
+
+def test_rollout_replaces_the_old_service(rollout_steps):
+    assert bluegreen.rollout(deployment(), 'task:2', 'billing') == ('billing-green', NEW_TG)
+    assert rollout_steps == [('tg', 'billing-green'), ('service', 'billing-green'), ('shift',),
+                             ('delete', 'billing', OLD_TG)]
+
+
+def test_failed_rollout_deletes_the_new_service(rollout_steps, elbv2, monkeypatch):
+    monkeypatch.setattr(bluegreen.waiters, 'wait_for_services',
+                        lambda client, cluster, services: {services[0]: (bluegreen.waiters.FAILED, 'tasks failed')})
+
+    assert bluegreen.rollout(deployment(), 'task:2', 'billing') is None
+    assert rollout_steps[-1] == ('delete', 'billing-green', NEW_TG)
+    assert ('shift',) not in rollout_steps
+    assert elbv2.weights[-1] == {OLD_TG: 100}
+
+
+def test_rollout_without_a_forwarding_rule_changes_nothing(rollout_steps, elbv2):
+    elbv2.rules[0]['Actions'][0]['TargetGroupArn'] = 'elsewhere'
+    assert bluegreen.rollout(deployment(), 'task:2', 'billing') is None
+    assert rollout_steps == []
@@ -0,0 +1,27 @@
+import pytest
+import clients
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(clients, '_sessions', {})
+    monkeypatch.setattr(clients, '_clients', {})
+    monkeypatch.setattr(clients, '_client_hooks', [])
+
+
+def test_clients_are_cached_per_service_region_and_credentials():
+    ecs = clients.get_client('ecs', 'eu-west-1', 'key', 'secret')
+    assert clients.get_client('ecs', 'eu-west-1', 'key', 'secret') is ecs
+    assert clients.get_client('ecs', 'us-east-1', 'key', 'secret') is not ecs
+    assert clients.get_client('ecs', 'eu-west-1', 'other', 'secret') is not ecs
+    assert ecs.meta.region_name == 'eu-west-1'
+    assert clients.get_session('eu-west-1', 'key', 'secret') is clients.get_session('eu-west-1', 'key', 'secret')
+
+
+def test_hooks_apply_to_existing_and_new_clients():
+    hooked = []
+    ecs = clients.get_client('ecs', 'eu-west-1', 'key', 'secret')
+    clients.add_client_hook(hooked.append)
+    clients.add_client_hook(hooked.append)
+    elbv2 = clients.get_client('elbv2', 'eu-west-1', 'key', 'secret')
+    assert hooked == [ecs, elbv2]
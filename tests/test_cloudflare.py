@@ -0,0 +1,177 @@
+import itertools
+import pytest
+import requests
+import cloudflare
+from cloudflare import CloudflareClient, CloudflareError
+
+
+class Response:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body or {}
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f'HTTP {self.status_code}')
+
+
+class FakeZone:
+    """A requests.Session serving the DNS records API of one zone.
+
+    `faults` are (method, path suffix, fault, applied) tuples consumed by the first
+    matching request: fault is a status code or an exception, and applied says
+    whether the request takes effect anyway.
+    """
+
+    def __init__(self, records=(), page_size=None):
+        self.headers = {}
+        self.records = {}
+        self.ids = itertools.count(1)
+        self.requests = []
+        self.faults = []
+        self.page_size = page_size
+        for name, content in records:
+            self._create({'type': 'CNAME', 'name': name, 'content': content, 'ttl': 300, 'proxied': False})
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def _create(self, record):
+        record = dict(record, id=f'record-{next(self.ids)}')
+        self.records[record['id']] = record
+        return record
+
+    def _apply(self, method, path, json, params):
+        if method == 'GET':
+            records = list(self.records.values())
+            per_page = self.page_size or params['per_page']
+            pages = max(1, -(-len(records) // per_page))
+            start = (params['page'] - 1) * per_page
+            return {'result': records[start:start + per_page], 'result_info': {'total_pages': pages}}
+        if path.endswith('/batch'):
+            result = {'deletes': [], 'posts': [], 'puts': []}
+            for item in json.get('deletes', []):
+                result['deletes'].append(self.records.pop(item['id']))
+            for item in json.get('posts', []):
+                result['posts'].append(self._create(item))
+            for item in json.get('puts', []):
+                self.records[item['id']] = dict(item)
+                result['puts'].append(self.records[item['id']])
+            return {'result': result}
+        if method == 'POST':
+            return {'result': self._create(json)}
+        record_id = path.rsplit('/', 1)[1]
+        if method == 'PUT':
+            self.records[record_id] = dict(json, id=record_id)
+            return {'result': self.records[record_id]}
+        return {'result': {'id': self.records.pop(record_id)['id']}}
+
+    def request(self, method, url, timeout=None, json=None, params=None):
+        path = url.split('/client/v4', 1)[1]
+        self.requests.append((method, path))
+        for fault in self.faults:
+            fault_method, suffix, error, applied = fault
+            if method == fault_method and path.endswith(suffix):
+                self.faults.remove(fault)
+                if applied:
+                    self._apply(method, path, json, params)
+                if isinstance(error, Exception):
+                    raise error
+                return Response(error, headers={'Retry-After': '0'})
+        return Response(200, self._apply(method, path, json, params))
+
+    def count(self, method, suffix='/dns_records'):
+        return sum(1 for m, path in self.requests if m == method and path.endswith(suffix))
+
+
+@pytest.fixture
+def zone(monkeypatch):
+    monkeypatch.setattr(cloudflare.time, 'sleep', lambda seconds: None)
+    return FakeZone([('billing.example.com', 'alb.example.com')])
+
+
+@pytest.fixture
+def client(zone):
+    return CloudflareClient('token', base_url='https://api.cloudflare.com/client/v4', max_retries=3, session=zone)
+
+
+def test_reads_are_retried_on_throttling_and_server_errors(zone, client):
+    zone.faults = [('GET', '/dns_records', 429, False), ('GET', '/dns_records', 503, False)]
+    assert client.find_record('zone', 'CNAME', 'Billing.example.com.')['content'] == 'alb.example.com'
+    assert zone.count('GET') == 3
+
+
+def test_retries_give_up_after_max_retries(zone, client):
+    zone.faults = [('GET', '/dns_records', 500, False)] * 4
+    with pytest.raises(CloudflareError, match='after 4 attempts'):
+        client.list_records('zone')
+
+
+def test_list_records_reads_every_page_and_caches_the_zone(client):
+    zone = FakeZone([(f'{i}.example.com', 'alb.example.com') for i in range(5)], page_size=2)
+    client.session = zone
+    assert len(client.list_records('zone')) == 5
+    assert zone.count('GET') == 3
+    client.list_records('zone')
+    assert zone.count('GET') == 3
+
+
+def test_upsert_does_nothing_when_the_record_is_as_desired(zone, client):
+    assert client.upsert_cname('zone', 'billing.example.com', 'ALB.example.com.')[1] == 'unchanged'
+    assert client.upsert_cname('zone', 'billing.example.com', 'other.example.com')[1] == 'updated'
+    assert client.upsert_cname('zone', 'billing.example.com', 'other.example.com')[1] == 'unchanged'
+    assert [method for method, _ in zone.requests] == ['GET', 'PUT']
+
+
+def test_create_that_failed_after_being_applied_is_not_repeated(zone, client):
+    zone.faults = [('POST', '/dns_records', 502, True)]
+    record, action = client.upsert_cname('zone', 'search.example.com', 'alb.example.com')
+    assert action == 'created' and record['name'] == 'search.example.com'
+    assert zone.count('POST') == 1
+    assert sum(1 for r in zone.records.values() if r['name'] == 'search.example.com') == 1
+
+
+def test_create_that_was_not_applied_is_made_again(zone, client):
+    zone.faults = [('POST', '/dns_records', requests.exceptions.ReadTimeout('read timeout'), False)]
+    assert client.upsert_cname('zone', 'search.example.com', 'alb.example.com')[1] == 'created'
+    assert zone.count('POST') == 2
+    assert sum(1 for r in zone.records.values() if r['name'] == 'search.example.com') == 1
+
+
+def test_create_is_retried_on_429_and_connection_failures(zone, client):
+    zone.faults = [('POST', '/dns_records', 429, False),
+                   ('POST', '/dns_records', requests.exceptions.ConnectTimeout('connect timeout'), False)]
+    assert client.upsert_cname('zone', 'search.example.com', 'alb.example.com')[1] == 'created'
+    assert zone.count('POST') == 3
+    # The zone was not read again
+    assert zone.count('GET') == 1
+
+
+def test_batch_upserts_and_deletes(zone, client, monkeypatch):
+    monkeypatch.setattr(cloudflare, 'BATCH_SIZE', 2)
+    records = {f'{i}.example.com': 'alb.example.com' for i in range(3)}
+    records['billing.example.com'] = 'other.example.com'
+
+    actions = client.upsert_cnames('zone', records)
+
+    assert list(actions.values()) == ['created', 'created', 'created', 'updated']
+    assert zone.count('POST', '/batch') == 2
+    # The snapshot has the results, so the same upsert makes no request
+    assert set(client.upsert_cnames('zone', records).values()) == {'unchanged'}
+    assert client.delete_records('zone', ['0.example.com', 'missing.example.com']) == ['0.example.com']
+    assert zone.count('POST', '/batch') == 3
+    assert zone.count('GET') == 1
+
+
+def test_failed_batch_drops_the_zone_snapshot(zone, client):
+    zone.faults = [('POST', '/batch', 502, True)]
+    with pytest.raises(CloudflareError):
+        client.upsert_cnames('zone', {'search.example.com': 'alb.example.com'})
+    # The batch was applied: the zone is read again, and the record is found instead of created twice
+    assert client.upsert_cnames('zone', {'search.example.com': 'alb.example.com'}) == {'search.example.com': 'unchanged'}
+    assert zone.count('GET') == 2
+    assert zone.count('POST', '/batch') == 1
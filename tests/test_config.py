@@ -0,0 +1,41 @@
+import pytest
+import config
+
+
+@pytest.fixture
+def unset(monkeypatch):
+    """Forget the settings read by a test, so each one reads the environment again."""
+    def forget(*names):
+        for name in names:
+            if name in vars(config):
+                monkeypatch.delitem(vars(config), name)
+    return forget
+
+
+def test_settings_are_read_on_first_access_and_cached(monkeypatch, unset):
+    unset('ecs_cluster')
+    monkeypatch.setenv('ECS_CLUSTER', 'production')
+    assert config.ecs_cluster == 'production'
+    monkeypatch.setenv('ECS_CLUSTER', 'staging')
+    assert config.ecs_cluster == 'production'
+    unset('ecs_cluster')
+
+
+def test_missing_variable_only_fails_the_setting_that_uses_it(monkeypatch, unset):
+    unset('vpc_id', 'scaling_max_capacity')
+    monkeypatch.delenv('VPC_ID', raising=False)
+    monkeypatch.delenv('SCALING_MAX_CAPACITY', raising=False)
+    with pytest.raises(EnvironmentError, match='VPC_ID'):
+        config.vpc_id
+    assert config.scaling_max_capacity == 4
+    unset('scaling_max_capacity')
+    with pytest.raises(AttributeError):
+        config.not_a_setting
+
+
+def test_project_settings(settings):
+    settings(cpu_architecture='ARM64')
+    project = config.project_settings('billing', 'billing.example.com', 'v1', 'repo/billing')
+    assert project['container_name'] == 'billing-api-container'
+    assert project['task_family_name'] == 'billing-api-task'
+    assert project['cpu_architecture'] == 'ARM64'
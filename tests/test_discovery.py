@@ -0,0 +1,154 @@
+import datetime
+import pytest
+import discovery
+from discovery import ResourceIndex
+from state_store import DeploymentStore, resolve_deployment
+
+ACCOUNT = 'arn:aws:ecs:eu-west-1:123456789012'
+ELB = 'arn:aws:elasticloadbalancing:eu-west-1:123456789012'
+RULE = f'{ELB}:listener-rule/app/alb/50dc6c495c0c9188/f2f7dc8efc522ab2/9683b2d02a6cabee'
+
+
+def service_arn(name):
+    return f'{ACCOUNT}:service/cluster/{name}'
+
+
+def resource(arn, project, deployment_id=None, **tags):
+    tags = dict(tags, Project=project, **({'DeploymentId': deployment_id} if deployment_id else {}))
+    return {'ResourceARN': arn, 'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+
+
+class FakeTagging:
+    """get_resources pages of two resources, and tag_resources failing for ARNs in `untaggable`."""
+
+    def __init__(self, resources):
+        self.resources = resources
+        self.refreshes = 0
+        self.tag_calls = []
+        self.untaggable = set()
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, TagFilters, ResourceTypeFilters, ResourcesPerPage):
+        self.refreshes += 1
+        return [{'ResourceTagMappingList': self.resources[i:i + 2]} for i in range(0, len(self.resources), 2)]
+
+    def tag_resources(self, ResourceARNList, Tags):
+        self.tag_calls.append(list(ResourceARNList))
+        return {'FailedResourcesMap': {arn: {'ErrorMessage': 'AccessDenied'}
+                                       for arn in ResourceARNList if arn in self.untaggable}}
+
+
+class FakeEcs:
+    def __init__(self, services):
+        self.services = services
+
+    def describe_services(self, cluster, services):
+        return {'services': [self.services[arn] for arn in services if arn in self.services]}
+
+    def describe_task_definition(self, taskDefinition):
+        architecture = 'ARM64' if taskDefinition.endswith('arm64:1') else None
+        return {'taskDefinition': {'runtimePlatform': {'cpuArchitecture': architecture}} if architecture else {}}
+
+
+class FakeElbv2:
+    def describe_rules(self, RuleArns):
+        return {'Rules': [{'RuleArn': arn, 'Conditions': [
+            {'Field': 'host-header', 'HostHeaderConfig': {'Values': ['billing.example.com']}}]} for arn in RuleArns]}
+
+
+def ecs_service(name, status='ACTIVE', **fields):
+    return dict({'serviceName': name, 'serviceArn': service_arn(name), 'status': status,
+                 'taskDefinition': f'{ACCOUNT}:task-definition/{name}:1',
+                 'loadBalancers': [{'targetGroupArn': f'{ELB}:targetgroup/{name}/1'}]}, **fields)
+
+
+@pytest.fixture
+def tagged(aws, settings):
+    resources = [
+        resource(service_arn('billing'), 'billing', 'billing-20240101-000000'),
+        resource(service_arn('billing-green'), 'billing', 'billing-20240201-000000'),
+        resource(service_arn('billing-green-arm64'), 'billing', 'billing-20240201-000000', Role='side-by-side'),
+        resource(RULE, 'billing', 'billing-20240201-000000'),
+        resource(f'{ACCOUNT}:task-definition/billing:3', 'billing'),
+        # A deployment of which only the target group is left
+        resource(f'{ELB}:targetgroup/billing/9', 'billing', 'billing-20240301-000000'),
+        resource('arn:aws:s3:::bucket', 'billing', 'billing-20240201-000000'),
+    ]
+    aws['ecs'] = FakeEcs({service_arn(name): ecs_service(name) for name in ('billing', 'billing-green')})
+    aws['ecs'].services[service_arn('billing-green-arm64')] = ecs_service(
+        'billing-green-arm64', createdAt=datetime.datetime(2024, 2, 2, tzinfo=datetime.timezone.utc),
+        taskDefinition=f'{ACCOUNT}:task-definition/billing-arm64:1')
+    aws['elbv2'] = FakeElbv2()
+    return ResourceIndex(FakeTagging(resources))
+
+
+def test_resource_types_from_arns():
+    assert discovery.resource_type(service_arn('billing')) == 'ecs:service'
+    assert discovery.resource_type(RULE) == 'elasticloadbalancing:listener-rule'
+    assert discovery._listener_arn(RULE) == f'{ELB}:listener/app/alb/50dc6c495c0c9188/f2f7dc8efc522ab2'
+
+
+def test_index_groups_resources_by_deployment_and_is_reused(tagged):
+    deployments = tagged.deployments('billing')
+
+    assert set(deployments) == {None, 'billing-20240101-000000', 'billing-20240201-000000', 'billing-20240301-000000'}
+    assert len(deployments['billing-20240201-000000']['services']) == 2
+    assert [r['arn'] for r in deployments[None]['task_definitions']] == [f'{ACCOUNT}:task-definition/billing:3']
+    assert tagged.project_of_service('billing-green') == 'billing'
+    assert tagged.projects() == ['billing']
+    assert tagged.client.refreshes == 1
+
+    tagged.invalidate()
+    tagged.deployments('billing')
+    assert tagged.client.refreshes == 2
+
+
+def test_newest_deployment_with_a_service_is_rebuilt(tagged):
+    record = discovery.find_deployment('billing', index=tagged)
+
+    assert record['deployment_tag'] == 'billing-20240201-000000'
+    assert (record['service_name'], record['ecs_cluster'], record['project_name']) == ('billing-green', 'cluster', 'billing')
+    assert record['target_group_arn'] == f'{ELB}:targetgroup/billing-green/1'
+    assert (record['rules'], record['domain_name']) == ([RULE], 'billing.example.com')
+    assert record['side_by_side']['service_name'] == 'billing-green-arm64'
+    assert (record['side_by_side']['cpu_architecture'], record['side_by_side']['baseline_architecture']) == \
+        ('ARM64', 'X86_64')
+    # Found by the name of a service too, e.g. the green one of a blue/green rollout
+    assert discovery.find_deployment('billing-green', index=tagged)['deployment_tag'] == 'billing-20240201-000000'
+
+
+def test_deployments_that_cannot_be_rebuilt(tagged, aws):
+    assert discovery.find_deployment('search', index=tagged) is None
+    assert discovery.find_deployment('billing', 'billing-20240301-000000', index=tagged) is None
+    aws['ecs'].services[service_arn('billing')]['status'] = 'INACTIVE'
+    assert discovery.find_deployment('billing', 'billing-20240101-000000', index=tagged) is None
+
+
+def test_tagging_in_batches_reports_failures(aws, monkeypatch):
+    tagging = FakeTagging([])
+    tagging.untaggable = {'arn:21'}
+    aws['resourcegroupstaggingapi'] = tagging
+    index = ResourceIndex(tagging)
+    index.projects()
+    monkeypatch.setattr(discovery, 'get_index', lambda region=None: index)
+
+    assert discovery.tag_resources([f'arn:{i}' for i in range(25)], {'Project': 'billing'}) == ['arn:21']
+    assert [len(call) for call in tagging.tag_calls] == [20, 5]
+    # The next lookup sees the new tags
+    index.projects()
+    assert tagging.refreshes == 2
+
+
+def test_deployment_found_from_tags_is_added_to_the_store(tagged, monkeypatch):
+    monkeypatch.setattr(discovery, 'get_index', lambda region=None: tagged)
+    store = DeploymentStore()
+
+    record, deployment_id, file_path = resolve_deployment('billing', store)
+
+    assert (record['service_name'], file_path) == ('billing-green', None)
+    assert store.latest(project_name='billing')['deployment_id'] == deployment_id
+    # Found in the store from then on
+    assert resolve_deployment('billing-green', store)[1] == deployment_id
+    assert tagged.client.refreshes == 1
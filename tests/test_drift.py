@@ -0,0 +1,116 @@
+import pytest
+import cloudflare
+import drift
+
+
+class NotFound(Exception):
+    pass
+
+
+def test_describe_by_arn_isolates_missing_arns():
+    existing = {f'arn/{i}' for i in range(25)} - {'arn/3', 'arn/17'}
+    calls = []
+
+    def describe(batch):
+        calls.append(list(batch))
+        if set(batch) - existing:
+            raise NotFound()
+        return [(arn, {'arn': arn}) for arn in batch]
+
+    found = drift._describe_by_arn(describe, [f'arn/{i}' for i in range(25)], NotFound)
+
+    assert found['arn/3'] is None and found['arn/17'] is None
+    assert {arn for arn, item in found.items() if item} == existing
+    # Batches of 20, and a failed batch costs a few calls per missing ARN, not one per ARN
+    assert calls[0] == [f'arn/{i}' for i in range(20)]
+    assert max(len(call) for call in calls) == drift.ARN_BATCH_SIZE
+    assert len(calls) < 20
+
+
+def test_describe_by_arn_lets_other_errors_through():
+    def describe(batch):
+        raise RuntimeError('throttled')
+
+    with pytest.raises(RuntimeError):
+        drift._describe_by_arn(describe, ['arn/1'], NotFound)
+
+
+RECORD = {'service_name': 'billing', 'ecs_cluster': 'cluster', 'task_definition_arn': 'arn:task-definition/billing:2',
+          'target_group_arn': 'arn:targetgroup/billing/1', 'rules': ['arn:rule/1'], 'domain_name': 'Billing.example.com',
+          'alb_dns_name': 'alb.example.com', 'cloudflare_api_token': 'token', 'cloudflare_zone_id': 'zone'}
+
+
+@pytest.fixture
+def live():
+    """The live state of RECORD, as read by drift.scan."""
+    return {
+        'services': {('cluster', 'billing'): {'status': 'ACTIVE', 'taskDefinition': 'arn:task-definition/billing:2',
+                                              'loadBalancers': [{'targetGroupArn': 'arn:targetgroup/billing/1'}]}},
+        'target_groups': {'arn:targetgroup/billing/1': {'LoadBalancerArns': ['alb']}},
+        'rules': {'arn:rule/1': {
+            'Actions': [{'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+                {'TargetGroupArn': 'arn:targetgroup/billing/1'}, {'TargetGroupArn': 'arn:targetgroup/billing-arm64/2'}]}}],
+            'Conditions': [{'Field': 'host-header', 'HostHeaderConfig': {'Values': ['billing.example.com']}}]}},
+        'zones': {('token', 'zone'): {'billing.example.com': {'content': 'ALB.example.com.'}}},
+    }
+
+
+def check(live, record=RECORD):
+    return drift.check_record(record, live['services'], live['target_groups'], live['rules'], live['zones'])
+
+
+def test_record_matching_the_live_state_has_no_drift(live):
+    assert check(live) == []
+
+
+def test_service_drifts(live):
+    live['services'][('cluster', 'billing')].update(status='DRAINING', taskDefinition='arn:task-definition/billing:3',
+                                                   loadBalancers=[])
+    assert check(live) == [('service', 'billing', 'status is DRAINING'),
+                           ('service', 'billing', 'runs billing:3 instead of billing:2'),
+                           ('service', 'billing', 'not attached to the recorded target group')]
+    live['services'][('cluster', 'billing')]['status'] = 'INACTIVE'
+    assert check(live) == [('service', 'billing', 'missing')]
+
+
+def test_load_balancer_drifts(live):
+    live['target_groups']['arn:targetgroup/billing/1'] = {'LoadBalancerArns': []}
+    live['rules']['arn:rule/1'] = {'Actions': [{'Type': 'forward', 'TargetGroupArn': 'arn:targetgroup/other/3'}],
+                                   'Conditions': []}
+    assert check(live) == [('target_group', 'arn:targetgroup/billing/1', 'not attached to a load balancer'),
+                           ('rule', 'arn:rule/1', 'forwards to 3 instead of 1'),
+                           ('rule', 'arn:rule/1', 'matches no host instead of Billing.example.com')]
+    live['rules'] = {}
+    live['target_groups'] = {}
+    assert check(live) == [('target_group', 'arn:targetgroup/billing/1', 'missing'), ('rule', 'arn:rule/1', 'missing')]
+
+
+def test_cname_drifts(live):
+    live['zones'][('token', 'zone')]['billing.example.com']['content'] = 'old-alb.example.com'
+    assert check(live) == [('cname', 'Billing.example.com', 'points to old-alb.example.com instead of alb.example.com')]
+    live['zones'][('token', 'zone')] = {}
+    assert check(live) == [('cname', 'Billing.example.com', 'missing')]
+    # A zone that could not be listed is reported, not taken as a missing record
+    live['zones'] = {}
+    assert check(live) == [('cname', 'Billing.example.com', 'zone zone could not be read')]
+
+
+def test_scan_reads_each_cluster_and_zone_once(live, monkeypatch):
+    reads = []
+
+    def zone_cnames(api_token, zone_id):
+        reads.append(zone_id)
+        raise cloudflare.CloudflareError('rate limited')
+
+    monkeypatch.setattr(drift, 'describe_services', lambda cluster, names: reads.append((cluster, names)) or
+                        {name: live['services'][(cluster, 'billing')] for name in names})
+    monkeypatch.setattr(drift, 'describe_target_groups', lambda arns: live['target_groups'])
+    monkeypatch.setattr(drift, 'describe_rules', lambda arns: live['rules'])
+    monkeypatch.setattr(drift, 'zone_cnames', zone_cnames)
+
+    results = drift.scan([RECORD, dict(RECORD, domain_name='billing-api.example.com', rules=[])])
+
+    assert sorted(reads, key=str) == [('cluster', ['billing']), 'zone']
+    assert [result['drifts'] for result in results] == [
+        [('cname', 'Billing.example.com', 'zone zone could not be read')],
+        [('cname', 'billing-api.example.com', 'zone zone could not be read')]]
@@ -0,0 +1,63 @@
+import json
+import pytest
+import fleet
+import utils
+from pipeline import PipelineResult
+
+
+def write_manifest(tmp_path, projects):
+    path = tmp_path / 'fleet.json'
+    path.write_text(json.dumps({'projects': projects}))
+    return str(path)
+
+
+def test_manifest_defaults(tmp_path, settings):
+    settings(repo_uri='123.dkr.ecr.example.com/api', image_tag='v7')
+    projects = fleet.load_manifest(write_manifest(tmp_path, [
+        {'project_name': 'billing', 'domain_name': 'billing.example.com'},
+        {'project_name': 'search', 'domain_name': 'search.example.com', 'image_tag': 'v2',
+         'repo_uri': 'other/search', 'cpu_architecture': 'ARM64'},
+    ]))
+
+    assert projects[0]['repo_uri'] == '123.dkr.ecr.example.com/billing'
+    assert projects[0]['image_tag'] == 'v7'
+    assert projects[0]['cpu_architecture'] == 'X86_64'
+    assert projects[0]['task_family_name'] == 'billing-api-task'
+    assert (projects[1]['repo_uri'], projects[1]['image_tag'], projects[1]['cpu_architecture']) == \
+        ('other/search', 'v2', 'ARM64')
+
+
+def test_manifest_rejects_duplicate_projects(tmp_path, settings):
+    settings(repo_uri='registry/api', image_tag='v1')
+    path = write_manifest(tmp_path, [{'project_name': 'billing', 'domain_name': 'a.example.com'},
+                                     {'project_name': 'billing', 'domain_name': 'b.example.com'}])
+    with pytest.raises(ValueError, match='billing'):
+        fleet.load_manifest(path)
+
+
+def test_a_failed_project_does_not_stop_the_others(settings, monkeypatch):
+    settings(alb_arn='alb')
+    listeners = []
+    monkeypatch.setattr(utils, 'get_https_listener_arn', lambda alb_arn: listeners.append(alb_arn) or 'listener')
+
+    def deploy(project, listener_arn, max_workers):
+        assert listener_arn == 'listener'
+        result = PipelineResult()
+        if project['project_name'] == 'broken':
+            result.failed['rule'] = RuntimeError('Rule was not created.')
+            result.skipped.append('service')
+        elif project['project_name'] == 'crashing':
+            raise RuntimeError('no credentials')
+        return result
+
+    monkeypatch.setattr(fleet.deploy, 'main', deploy)
+    projects = [{'project_name': name} for name in ('billing', 'broken', 'crashing', 'search')]
+
+    summaries = fleet.deploy_fleet(projects, concurrency=2)
+
+    assert [summary['project_name'] for summary in summaries] == ['billing', 'broken', 'crashing', 'search']
+    assert [summary['ok'] for summary in summaries] == [True, False, False, True]
+    assert summaries[1]['errors'] == ['rule: Rule was not created.', 'service: skipped']
+    assert summaries[2]['errors'] == ['no credentials']
+    # The listener is looked up once for the whole fleet
+    assert listeners == ['alb']
@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+import pytest
+import image_publish
+
+REPO_URI = '123456789012.dkr.ecr.eu-west-1.amazonaws.com/billing'
+
+
+def digest(data):
+    return f'sha256:{hashlib.sha256(data).hexdigest()}'
+
+
+def tar_of(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FakeImage:
+    """A local image as returned by the Docker SDK, saved as `docker save` does."""
+
+    def __init__(self, layers, architecture='amd64'):
+        self.config = json.dumps({'architecture': architecture, 'rootfs': [digest(layer) for layer in layers]}).encode()
+        self.id = digest(self.config)
+        self.layers = layers
+        self.attrs = {'Architecture': architecture, 'Os': 'linux', 'RepoDigests': []}
+
+    def save(self, named=False):
+        files = {'config.json': self.config}
+        names = []
+        for index, layer in enumerate(self.layers):
+            names.append(f'{index}/layer.tar')
+            files[names[-1]] = layer
+        files['manifest.json'] = json.dumps([{'Config': 'config.json', 'Layers': names}]).encode()
+        data = tar_of(files)
+        return [data[i:i + 1000] for i in range(0, len(data), 1000)]
+
+
+class FakeDocker:
+    def __init__(self, images):
+        self.images = self
+        self._images = images
+
+    def get(self, name):
+        return self._images[name]
+
+
+class LayerAlreadyExistsException(Exception):
+    pass
+
+
+class ImageAlreadyExistsException(Exception):
+    pass
+
+
+class FakeEcr:
+    """One ECR repository: blobs, manifests by digest and tags."""
+
+    class exceptions:
+        LayerAlreadyExistsException = LayerAlreadyExistsException
+        ImageAlreadyExistsException = ImageAlreadyExistsException
+
+    class meta:
+        region_name = 'eu-west-1'
+
+    def __init__(self):
+        self.blobs = {}
+        self.manifests = {}
+        self.tags = {}
+        self.uploads = {}
+        self.calls = []
+
+    def batch_get_image(self, repositoryName, imageIds, acceptedMediaTypes):
+        self.calls.append('batch_get_image')
+        image_id = imageIds[0]
+        image_digest = self.tags.get(image_id['imageTag']) if 'imageTag' in image_id else image_id['imageDigest']
+        if image_digest not in self.manifests:
+            return {'images': []}
+        return {'images': [{'imageId': {'imageDigest': image_digest}, 'imageManifest': self.manifests[image_digest]}]}
+
+    def batch_check_layer_availability(self, repositoryName, layerDigests):
+        self.calls.append(('batch_check_layer_availability', len(layerDigests)))
+        return {'layers': [{'layerDigest': layer, 'layerAvailability': 'AVAILABLE' if layer in self.blobs else 'UNAVAILABLE'}
+                           for layer in layerDigests]}
+
+    def initiate_layer_upload(self, repositoryName):
+        upload_id = f'upload-{len(self.uploads)}'
+        self.uploads[upload_id] = b''
+        return {'uploadId': upload_id, 'partSize': 64}
+
+    def upload_layer_part(self, repositoryName, uploadId, partFirstByte, partLastByte, layerPartBlob):
+        assert partFirstByte == len(self.uploads[uploadId])
+        assert partLastByte == partFirstByte + len(layerPartBlob) - 1
+        self.uploads[uploadId] += layerPartBlob
+
+    def complete_layer_upload(self, repositoryName, uploadId, layerDigests):
+        self.calls.append('complete_layer_upload')
+        data = self.uploads.pop(uploadId)
+        assert digest(data) == layerDigests[0]
+        if layerDigests[0] in self.blobs:
+            raise LayerAlreadyExistsException()
+        self.blobs[layerDigests[0]] = data
+
+    def put_image(self, repositoryName, imageManifest, imageManifestMediaType, imageTag=None):
+        self.calls.append('put_image')
+        manifest = json.loads(imageManifest)
+        references = [manifest['config']] + manifest['layers'] if 'layers' in manifest else manifest['manifests']
+        for reference in references:
+            assert reference['digest'] in self.blobs or reference['digest'] in self.manifests
+        image_digest = digest(imageManifest.encode())
+        if imageTag and self.tags.get(imageTag) == image_digest:
+            raise ImageAlreadyExistsException()
+        self.manifests[image_digest] = imageManifest
+        if imageTag:
+            self.tags[imageTag] = image_digest
+        return {'image': {'imageId': {'imageDigest': image_digest}}}
+
+
+def plain_layer(content):
+    return tar_of({'app/file': content})
+
+
+def test_export_gzips_plain_layers_reproducibly_and_keeps_compressed_ones(tmp_path):
+    compressed = gzip.compress(plain_layer(b'base'), mtime=0)
+    image = FakeImage([compressed, plain_layer(b'app' * 1000)])
+
+    manifest_bytes, blobs = image_publish.export_image(image, str(tmp_path))
+    manifest = json.loads(manifest_bytes)
+
+    assert manifest['config']['digest'] == image.id
+    # The compressed layer was not compressed again: its digest is the one of the saved bytes
+    assert manifest['layers'][0]['digest'] == digest(compressed)
+    assert all(layer['mediaType'] == image_publish.LAYER_MEDIA_TYPE for layer in manifest['layers'])
+    with open(blobs[manifest['layers'][1]['digest']], 'rb') as f:
+        assert gzip.decompress(f.read()) == plain_layer(b'app' * 1000)
+    (tmp_path / 'again').mkdir()
+    assert image_publish.export_image(image, str(tmp_path / 'again'))[0] == manifest_bytes
+
+
+def test_export_keeps_zstd_layers_with_their_media_type(tmp_path):
+    zstd = b'\x28\xb5\x2f\xfd' + b'frame'
+    manifest_bytes, _ = image_publish.export_image(FakeImage([zstd]), str(tmp_path))
+    layer = json.loads(manifest_bytes)['layers'][0]
+    assert layer == {'mediaType': 'application/vnd.oci.image.layer.v1.tar+zstd', 'size': len(zstd),
+                     'digest': digest(zstd)}
+
+
+def test_publish_uploads_only_missing_layers_and_skips_a_published_tag():
+    ecr = FakeEcr()
+    base = plain_layer(b'base' * 100)
+    docker = FakeDocker({'app:v1': FakeImage([base, plain_layer(b'v1')]),
+                         'app:v2': FakeImage([base, plain_layer(b'v2')])})
+
+    assert image_publish.publish_image(ecr, docker, 'app:v1', REPO_URI, 'v1') == 'pushed'
+    assert ecr.calls.count('complete_layer_upload') == 3
+
+    ecr.calls.clear()
+    assert image_publish.publish_image(ecr, docker, 'app:v1', REPO_URI, 'v1') == 'unchanged'
+    assert ecr.calls == ['batch_get_image']
+
+    # Same image under another tag: only the manifest is written
+    assert image_publish.publish_image(ecr, docker, 'app:v1', REPO_URI, 'latest') == 'tagged'
+    assert 'complete_layer_upload' not in ecr.calls
+
+    ecr.calls.clear()
+    assert image_publish.publish_image(ecr, docker, 'app:v2', REPO_URI, 'v2') == 'pushed'
+    # The shared base layer was not uploaded again
+    assert ecr.calls.count('complete_layer_upload') == 2
+
+
+def test_missing_blobs_are_checked_in_batches(monkeypatch):
+    monkeypatch.setattr(image_publish, 'LAYER_CHECK_BATCH_SIZE', 2)
+    ecr = FakeEcr()
+    ecr.blobs = {'sha256:b': b''}
+    assert image_publish.missing_blobs(ecr, 'billing', ['sha256:a', 'sha256:b', 'sha256:c']) == ['sha256:a', 'sha256:c']
+    assert [call for call in ecr.calls if call[0] == 'batch_check_layer_availability'] == \
+        [('batch_check_layer_availability', 2), ('batch_check_layer_availability', 1)]
+
+
+def test_layer_uploaded_concurrently_elsewhere_is_not_an_error(tmp_path):
+    ecr = FakeEcr()
+    path = tmp_path / 'layer'
+    path.write_bytes(b'x' * 200)
+    ecr.blobs[digest(b'x' * 200)] = b'x' * 200
+    progress = image_publish.UploadProgress(200, 'billing')
+    image_publish.upload_blob(ecr, 'billing', digest(b'x' * 200), str(path), progress)
+    assert progress.sent_bytes == 200
+
+
+def test_publish_images_reports_each_failure():
+    ecr = FakeEcr()
+    docker = FakeDocker({'app:v1': FakeImage([plain_layer(b'v1')])})
+    results = image_publish.publish_images(ecr, docker, [('app:v1', REPO_URI, 'v1'), ('missing', REPO_URI, 'v2')])
+    assert results[(REPO_URI, 'v1')] == 'pushed'
+    assert isinstance(results[(REPO_URI, 'v2')], KeyError)
+
+
+def multiarch_docker():
+    return FakeDocker({'app:amd64': FakeImage([plain_layer(b'amd64')]),
+                       'app:arm64': FakeImage([plain_layer(b'arm64')], architecture='arm64')})
+
+
+def test_multiarch_image_is_tagged_as_an_index_of_its_platforms():
+    ecr = FakeEcr()
+    docker = multiarch_docker()
+
+    assert image_publish.publish_multiarch(ecr, docker, ['app:amd64', 'app:arm64'], REPO_URI, 'v1') == 'pushed'
+
+    index = json.loads(ecr.manifests[ecr.tags['v1']])
+    assert index['mediaType'] == image_publish.INDEX_MEDIA_TYPE
+    assert [entry['platform'] for entry in index['manifests']] == [{'architecture': 'amd64', 'os': 'linux'},
+                                                                   {'architecture': 'arm64', 'os': 'linux'}]
+    # The platform images are pushed by digest, without a tag of their own
+    assert list(ecr.tags) == ['v1']
+    assert image_publish.image_architectures(ecr, REPO_URI, 'v1') == {'amd64', 'arm64'}
+
+    ecr.calls.clear()
+    assert image_publish.publish_multiarch(ecr, docker, ['app:amd64', 'app:arm64'], REPO_URI, 'v1') == 'unchanged'
+    assert 'put_image' not in ecr.calls
+
+
+def test_multiarch_image_needs_one_image_per_architecture():
+    docker = FakeDocker({'app:a': FakeImage([plain_layer(b'a')]), 'app:b': FakeImage([plain_layer(b'b')])})
+    with pytest.raises(ValueError, match='Several images for one architecture'):
+        image_publish.publish_multiarch(FakeEcr(), docker, ['app:a', 'app:b'], REPO_URI, 'v1')
+
+
+def test_single_platform_architecture_is_read_from_its_config(monkeypatch):
+    ecr = FakeEcr()
+    image = FakeImage([plain_layer(b'arm64')], architecture='arm64')
+    image_publish.publish_image(ecr, FakeDocker({'app:v1': image}), 'app:v1', REPO_URI, 'v1')
+    configs = []
+    monkeypatch.setattr(image_publish, '_image_config',
+                        lambda ecr, repo_name, config_digest: configs.append(config_digest) or json.loads(image.config))
+
+    assert image_publish.image_architectures(ecr, REPO_URI, 'v1') == {'arm64'}
+    assert configs == [image.id]
+    assert image_publish.image_architectures(ecr, REPO_URI, 'missing') is None
+
+
+def task_definition(architecture, *images):
+    return {'runtimePlatform': {'cpuArchitecture': architecture, 'operatingSystemFamily': 'LINUX'},
+            'containerDefinitions': [{'name': f'c{i}', 'image': image} for i, image in enumerate(images)]}
+
+
+def test_task_definition_images_must_run_on_its_architecture():
+    ecr = FakeEcr()
+    image_publish.publish_multiarch(ecr, multiarch_docker(), ['app:amd64', 'app:arm64'], REPO_URI, 'multi')
+    docker = FakeDocker({'app:v1': FakeImage([plain_layer(b'v1')])})
+    image_publish.publish_multiarch(ecr, docker, ['app:v1'], REPO_URI, 'amd64-only')
+
+    # Images outside ECR or pinned by digest are not checked
+    image_publish.check_architecture(ecr, task_definition('ARM64', f'{REPO_URI}:multi', 'envoyproxy/envoy:v1.30',
+                                                          f'{REPO_URI}@sha256:abc'))
+    image_publish.check_architecture(ecr, task_definition('X86_64', f'{REPO_URI}:amd64-only'))
+    with pytest.raises(image_publish.ImageArchitectureError, match=r'built for amd64, not arm64 \(ARM64\)'):
+        image_publish.check_architecture(ecr, task_definition('ARM64', f'{REPO_URI}:amd64-only'))
+    with pytest.raises(image_publish.ImageArchitectureError, match='does not exist'):
+        image_publish.check_architecture(ecr, task_definition('ARM64', f'{REPO_URI}:missing'))
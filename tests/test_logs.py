@@ -0,0 +1,91 @@
+import itertools
+import pytest
+import logs
+
+
+class FakeLogs:
+    """Serves filter_log_events from a list of events, in pages of `page_size`."""
+
+    def __init__(self, events, page_size=2):
+        self.events = events
+        self.page_size = page_size
+        self.queries = []
+
+    def filter_log_events(self, logGroupName, startTime, endTime, logStreamNames=None, logStreamNamePrefix=None,
+                          filterPattern=None, nextToken=None):
+        if nextToken is None:
+            self.queries.append((startTime, endTime, logStreamNames))
+        matches = [event for event in self.events if startTime <= event['timestamp'] <= endTime
+                   and (logStreamNames is None or event['logStreamName'] in logStreamNames)]
+        matches.sort(key=lambda event: (event['timestamp'], event['eventId']))
+        start = int(nextToken or 0)
+        response = {'events': matches[start:start + self.page_size]}
+        if len(matches) > start + self.page_size:
+            response['nextToken'] = str(start + self.page_size)
+        return response
+
+
+def event(timestamp, stream='ecs/app/1', event_id=None):
+    return {'timestamp': timestamp, 'eventId': event_id or f'{stream}-{timestamp}', 'logStreamName': stream,
+            'message': f'at {timestamp}\n'}
+
+
+@pytest.fixture
+def client(aws):
+    aws['logs'] = FakeLogs([])
+    return aws['logs']
+
+
+def test_durations():
+    assert logs.parse_duration('90s') == 90
+    assert logs.parse_duration(' 2h') == 7200
+    with pytest.raises(ValueError):
+        logs.parse_duration('2 weeks')
+
+
+def test_time_shards_cover_the_range_once_and_merge_in_order(client):
+    client.events = [event(timestamp) for timestamp in (1000, 1999, 2000, 2500, 3999, 4000, 1500)]
+
+    found = list(logs.search('group', start=1, end=4, shards=3))
+
+    assert [e['timestamp'] for e in found] == [1000, 1500, 1999, 2000, 2500, 3999, 4000]
+    windows = sorted(query[:2] for query in client.queries)
+    assert windows[0][0] == 1000 and windows[-1][1] == 4000
+    # Windows do not overlap and leave no gap, endTime being inclusive
+    assert all(previous[1] + 1 == following[0] for previous, following in zip(windows, windows[1:]))
+
+
+def test_streams_are_sharded_by_the_per_call_limit(client, monkeypatch):
+    monkeypatch.setattr(logs, 'MAX_STREAMS_PER_CALL', 2)
+    streams = [f'ecs/app/{i}' for i in range(5)]
+    client.events = [event(1000 + i, stream) for i, stream in enumerate(reversed(streams))]
+
+    found = list(logs.search('group', start=0, end=2, streams=streams))
+
+    assert [e['logStreamName'] for e in found] == list(reversed(streams))
+    assert sorted(len(query[2]) for query in client.queries) == [1, 2, 2]
+    assert list(logs.search('group', start=0, end=2, streams=[])) == []
+
+
+def test_a_failed_shard_fails_the_search(client):
+    def denied(**kwargs):
+        raise RuntimeError('AccessDenied')
+
+    client.filter_log_events = denied
+    with pytest.raises(RuntimeError, match='AccessDenied'):
+        list(logs.search('group', start=0, end=2))
+
+
+def test_follow_resumes_from_its_cursor_without_repeating_events(client, tmp_path):
+    cursor_path = str(tmp_path / 'cursors.json')
+    client.events = [event(1000), event(2000, event_id='a'), event(2000, event_id='b')]
+
+    def follow():
+        return logs.follow('billing', 0, lambda: None, 'group', cursor_path=cursor_path, shards=1,
+                           sleep=lambda seconds: client.events.append(event(3000)))
+
+    # The second poll only returns the event added after the first one
+    assert [e['eventId'] for e in itertools.islice(follow(), 4)] == ['ecs/app/1-1000', 'a', 'b', 'ecs/app/1-3000']
+    assert logs.load_cursors(cursor_path)['billing'] == {'timestamp': 2000, 'event_ids': ['a', 'b']}
+    # Following again starts from the saved cursor
+    assert next(follow())['eventId'] == 'ecs/app/1-3000'
@@ -0,0 +1,77 @@
+import pytest
+import main
+import plan as planner
+import utils
+from plan import Change, Plan
+
+
+def make_plan(project, **actions):
+    actions = dict({'log_group': planner.NOOP, 'target_group': planner.CREATE, 'rule': planner.CREATE,
+                    'task_definition': planner.NOOP, 'service': planner.CREATE, 'cname': planner.NOOP}, **actions)
+    live = {'log_group_exists': True, 'target_group': None, 'listener_arn': 'listener', 'rule': None,
+            'service': None, 'task_definition': {'taskDefinitionArn': 'task-definition:1', 'revision': 1},
+            'cname': None}
+    return Plan(project, live, [Change(resource, action) for resource, action in actions.items()])
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def create_rule(listener_arn, target_group_arn, domain_name, rules_list, tags):
+        calls.append(('rule', listener_arn, target_group_arn))
+        rules_list.append('rule-arn')
+        return 'rule-arn'
+
+    def create_ecs_service(task_definition_arn, target_group_arn, project, tags):
+        calls.append(('service', task_definition_arn, target_group_arn))
+        return True
+
+    def save_deployment_info(task_definition_arn, target_group_arn, listener_arn, rules_list, timestamp, project):
+        calls.append(('save', task_definition_arn, target_group_arn, listener_arn, rules_list))
+        return 'deployment-1'
+
+    monkeypatch.setattr(utils, 'create_target_group', lambda project, tags: calls.append(('target_group',)) or 'tg')
+    monkeypatch.setattr(utils, 'create_rule', create_rule)
+    monkeypatch.setattr(utils, 'create_ecs_service', create_ecs_service)
+    monkeypatch.setattr(utils, 'save_deployment_info', save_deployment_info)
+    return calls
+
+
+def test_steps_pass_results_to_their_dependents(project, calls):
+    result = main.run_pipeline(main.build_steps(make_plan(project)))
+
+    assert result.ok
+    assert ('rule', 'listener', 'tg') in calls
+    assert ('service', 'task-definition:1', 'tg') in calls
+    assert calls[-1] == ('save', 'task-definition:1', 'tg', 'listener', ['rule-arn'])
+    assert result.results['save'] == 'deployment-1'
+
+
+def test_a_resource_that_was_not_created_fails_its_step(project, calls, monkeypatch):
+    monkeypatch.setattr(utils, 'create_rule', lambda *args: None)
+
+    result = main.run_pipeline(main.build_steps(make_plan(project)))
+
+    assert list(result.failed) == ['rule']
+    assert sorted(result.skipped) == ['save', 'service']
+    assert not any(call[0] in ('service', 'save') for call in calls)
+
+
+def test_require():
+    assert main._require('arn', 'Rule') == 'arn'
+    with pytest.raises(RuntimeError, match='Rule was not updated'):
+        main._require(False, 'Rule', 'updated')
+
+
+def test_plan_error_fails_the_deploy_without_running_steps(project, monkeypatch):
+    def refuse(project, listener_arn):
+        raise planner.PlanError('target group is gone')
+
+    monkeypatch.setattr(planner, 'make_plan', refuse)
+    monkeypatch.setattr(main, 'run_pipeline', lambda *args, **kwargs: pytest.fail('steps ran'))
+
+    result = main.main(project)
+
+    assert not result.ok
+    assert isinstance(result.failed['plan'], planner.PlanError)
@@ -0,0 +1,54 @@
+import pytest
+from pipeline import Step, run_pipeline
+
+
+def test_steps_receive_the_results_of_their_dependencies():
+    steps = [
+        Step('a', lambda deps: 1),
+        Step('b', lambda deps: deps['a'] + 1, deps=['a']),
+        Step('c', lambda deps: deps['a'] + deps['b'], deps=['a', 'b']),
+    ]
+    result = run_pipeline(steps)
+    assert result.ok
+    assert result.results == {'a': 1, 'b': 2, 'c': 3}
+
+
+def test_cycle_is_rejected_before_anything_runs():
+    calls = []
+    steps = [
+        Step('start', lambda deps: calls.append('start')),
+        Step('a', lambda deps: calls.append('a'), deps=['start', 'c']),
+        Step('b', lambda deps: calls.append('b'), deps=['a']),
+        Step('c', lambda deps: calls.append('c'), deps=['b']),
+    ]
+    with pytest.raises(ValueError, match='cycle'):
+        run_pipeline(steps)
+    assert calls == []
+
+
+def test_unknown_and_duplicate_steps_are_rejected():
+    with pytest.raises(ValueError, match='unknown'):
+        run_pipeline([Step('a', lambda deps: None, deps=['missing'])])
+    with pytest.raises(ValueError, match='Duplicate'):
+        run_pipeline([Step('a', lambda deps: None), Step('a', lambda deps: None)])
+
+
+def test_failure_skips_transitive_dependents_once():
+    def fail(deps):
+        raise RuntimeError('boom')
+
+    steps = [
+        Step('root', fail),
+        Step('left', lambda deps: None, deps=['root']),
+        Step('right', lambda deps: None, deps=['root']),
+        # Depends on two skipped steps
+        Step('join', lambda deps: None, deps=['left', 'right']),
+        Step('after', lambda deps: None, deps=['join']),
+        Step('other', lambda deps: 'ran'),
+    ]
+    result = run_pipeline(steps)
+    assert list(result.failed) == ['root']
+    assert isinstance(result.failed['root'], RuntimeError)
+    assert sorted(result.skipped) == ['after', 'join', 'left', 'right']
+    assert result.results == {'other': 'ran'}
+    assert not result.ok
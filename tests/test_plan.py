@@ -0,0 +1,143 @@
+import pytest
+import cloudflare
+import plan as planner
+import profiles
+import utils
+from plan import CREATE, NOOP, UPDATE, PlanError
+from state_store import DeploymentStore
+
+TARGET_GROUP_ARN = 'arn:aws:elasticloadbalancing:targetgroup/billing/1'
+
+
+def target_group(profile='conservative', arn=TARGET_GROUP_ARN):
+    return dict(profiles.target_group_health_check(profiles.HEALTH_CHECK_PROFILES[profile]), TargetGroupArn=arn)
+
+
+def forward_rule(*target_groups):
+    if len(target_groups) == 1:
+        action = {'Type': 'forward', 'TargetGroupArn': target_groups[0]}
+    else:
+        action = {'Type': 'forward', 'ForwardConfig': {'TargetGroups': [
+            {'TargetGroupArn': arn, 'Weight': 50} for arn in target_groups]}}
+    return {'RuleArn': 'rule', 'Priority': '100', 'Actions': [action],
+            'Conditions': [{'Field': 'host-header', 'HostHeaderConfig': {'Values': ['billing.example.com']}}]}
+
+
+@pytest.fixture
+def live(project, monkeypatch):
+    monkeypatch.setattr(utils, 'desired_task_definition_hash', lambda project: 'desired')
+    monkeypatch.setattr(planner.task_index, 'task_definition_hash', lambda task_definition: task_definition['hash'])
+    return {
+        'log_group_exists': True,
+        'target_group': target_group(),
+        'listener_arn': 'listener',
+        'rule': forward_rule(TARGET_GROUP_ARN),
+        'service': {'serviceName': 'billing'},
+        'task_definition': {'hash': 'desired', 'revision': 3},
+        'cname': {'content': 'ALB.example.com.'},
+    }
+
+
+def actions(project, live):
+    return {change.resource: change.action for change in planner.diff(project, live)}
+
+
+def test_nothing_to_do_when_live_state_matches(project, live):
+    plan = planner.Plan(project, live, planner.diff(project, live))
+    assert set(actions(project, live).values()) == {NOOP}
+    assert not plan.has_changes
+    assert 'No changes' in plan.format()
+
+
+def test_everything_is_created_for_a_new_project(project, live):
+    live.update(log_group_exists=False, target_group=None, rule=None, service=None, task_definition=None, cname=None)
+    assert set(actions(project, live).values()) == {CREATE}
+
+
+def test_new_image_registers_a_task_definition_and_updates_the_service(project, live):
+    live['task_definition']['hash'] = 'previous'
+    assert actions(project, live) == {'log_group': NOOP, 'target_group': NOOP, 'rule': NOOP,
+                                      'task_definition': CREATE, 'service': UPDATE, 'cname': NOOP}
+
+
+def test_rule_forwarding_elsewhere_is_updated(project, live):
+    live['rule'] = forward_rule('arn:aws:elasticloadbalancing:targetgroup/other/2')
+    assert actions(project, live)['rule'] == UPDATE
+
+
+def test_weighted_forward_including_the_target_group_is_left_alone(project, live):
+    live['rule'] = forward_rule(TARGET_GROUP_ARN, 'arn:aws:elasticloadbalancing:targetgroup/billing-arm64/2')
+    assert actions(project, live)['rule'] == NOOP
+
+
+def test_cname_pointing_elsewhere_is_updated(project, live):
+    live['cname'] = {'content': 'old-alb.example.com'}
+    assert actions(project, live)['cname'] == UPDATE
+
+
+def test_service_without_its_target_group_is_refused(project, live):
+    live['target_group'] = None
+    with pytest.raises(PlanError, match='billing'):
+        planner.diff(project, live)
+
+
+class Logs:
+    def describe_log_groups(self, logGroupNamePrefix):
+        return {'logGroups': [{'logGroupName': logGroupNamePrefix}]}
+
+
+class Elbv2:
+    class exceptions:
+        class TargetGroupNotFoundException(Exception):
+            pass
+
+    def __init__(self):
+        self.target_group_calls = []
+
+    def describe_target_groups(self, **kwargs):
+        self.target_group_calls.append(kwargs)
+        return {'TargetGroups': [{'TargetGroupArn': (kwargs.get('TargetGroupArns') or ['by-name'])[0]}]}
+
+    def describe_rules(self, ListenerArn, PageSize, Marker=None):
+        return {'Rules': [forward_rule('green-tg'), dict(forward_rule('x'), Conditions=[], Priority='default')]}
+
+
+class Ecs:
+    def __init__(self):
+        self.services = []
+
+    def describe_services(self, cluster, services):
+        self.services += services
+        return {'services': [{'serviceName': services[0], 'status': 'ACTIVE', 'taskDefinition': 'task:3'}]}
+
+    def describe_task_definition(self, taskDefinition):
+        return {'taskDefinition': {'taskDefinitionArn': taskDefinition}}
+
+
+class Cloudflare:
+    def find_record(self, zone_id, record_type, name):
+        return {'name': name, 'content': 'alb.example.com'}
+
+
+def test_live_state_is_read_for_the_latest_deployment(project, aws, monkeypatch):
+    aws.update(logs=Logs(), elbv2=Elbv2(), ecs=Ecs())
+    monkeypatch.setattr(cloudflare, 'get_client', lambda api_token: Cloudflare())
+    # After a blue/green rollout the project runs in its green service and target group
+    DeploymentStore().add({'service_name': 'billing-green', 'ecs_cluster': 'cluster', 'project_name': 'billing',
+                           'domain_name': 'billing.example.com', 'target_group_arn': 'green-tg'})
+
+    live = planner.read_live_state(project, listener_arn='plan-test-listener')
+
+    assert live['log_group_exists']
+    assert aws['elbv2'].target_group_calls == [{'TargetGroupArns': ['green-tg']}]
+    assert aws['ecs'].services == ['billing-green']
+    assert live['rule']['Actions'][0]['TargetGroupArn'] == 'green-tg'
+    assert live['task_definition'] == {'taskDefinitionArn': 'task:3'}
+    assert live['cname']['content'] == 'alb.example.com'
+
+
+def test_target_group_with_another_health_check_profile_is_updated(project, live, settings):
+    settings(health_check_profile='fast')
+    change, = [change for change in planner.diff(project, live) if change.resource == 'target_group']
+    assert change.action == UPDATE
+    assert "'fast'" in change.detail
@@ -0,0 +1,126 @@
+import pytest
+import priorities
+from priorities import PriorityAllocator
+
+
+class PriorityInUseException(Exception):
+    pass
+
+
+class FakeElbv2:
+    """describe_rules and create_rule of one listener. `taken_elsewhere` are created behind the allocator's back."""
+
+    class exceptions:
+        PriorityInUseException = PriorityInUseException
+
+    def __init__(self, priorities=(), taken_elsewhere=()):
+        self.rules = [self._rule(priority) for priority in priorities]
+        self.taken_elsewhere = set(taken_elsewhere)
+        self.create_calls = []
+        self.describe_calls = 0
+
+    @staticmethod
+    def _rule(priority):
+        return {'RuleArn': f'rule/{priority}', 'Priority': str(priority)}
+
+    def describe_rules(self, ListenerArn, PageSize, Marker=None):
+        self.describe_calls += 1
+        return {'Rules': [{'RuleArn': 'rule/default', 'Priority': 'default'}] + list(self.rules)}
+
+    def create_rule(self, ListenerArn, Conditions, Actions, Priority, **kwargs):
+        self.create_calls.append(Priority)
+        if Priority in self.taken_elsewhere:
+            self.taken_elsewhere.discard(Priority)
+            self.rules.append(self._rule(Priority))
+            raise PriorityInUseException(f'Priority {Priority} is in use')
+        if any(rule['Priority'] == str(Priority) for rule in self.rules):
+            raise PriorityInUseException(f'Priority {Priority} is in use')
+        rule = self._rule(Priority)
+        self.rules.append(rule)
+        return {'Rules': [rule]}
+
+
+def test_reserve_fills_gaps_and_never_hands_out_a_priority_twice():
+    allocator = PriorityAllocator(FakeElbv2([100, 102]), 'listener')
+    assert allocator.reserve(2) == [101, 103]
+    assert allocator.reserve() == [104]
+
+
+def test_create_rule_retries_with_a_new_priority_when_in_use():
+    elbv2 = FakeElbv2([100], taken_elsewhere=[101])
+    allocator = PriorityAllocator(elbv2, 'listener')
+
+    rule = allocator.create_rule([], [])
+
+    assert elbv2.create_calls == [101, 102]
+    assert rule['Priority'] == '102'
+    # The conflict made the allocator read the listener again
+    assert elbv2.describe_calls == 2
+    assert allocator.reserve() == [103]
+
+
+def test_create_rule_gives_up_after_max_attempts():
+    elbv2 = FakeElbv2(taken_elsewhere=[100, 101])
+    allocator = PriorityAllocator(elbv2, 'listener')
+
+    with pytest.raises(PriorityInUseException):
+        allocator.create_rule([], [], max_attempts=2)
+    assert elbv2.create_calls == [100, 101]
+
+
+def test_other_errors_release_the_priority():
+    elbv2 = FakeElbv2()
+
+    def fail(**kwargs):
+        raise RuntimeError('denied')
+
+    allocator = PriorityAllocator(elbv2, 'listener')
+    elbv2.create_rule = fail
+    with pytest.raises(RuntimeError):
+        allocator.create_rule([], [])
+    assert allocator.reserve() == [100]
+
+
+def test_create_rules_releases_unused_priorities_on_failure():
+    elbv2 = FakeElbv2()
+    allocator = PriorityAllocator(elbv2, 'listener')
+    create_rule = elbv2.create_rule
+
+    def fail_second(**kwargs):
+        if kwargs['Priority'] == 101:
+            raise RuntimeError('limit reached')
+        return create_rule(**kwargs)
+
+    elbv2.create_rule = fail_second
+    with pytest.raises(RuntimeError):
+        allocator.create_rules([([], []), ([], []), ([], [])])
+    # 100 was created, 101 failed and 102 was never tried
+    assert allocator.reserve(2) == [101, 102]
+
+
+def test_reserve_fails_when_the_listener_is_full(monkeypatch):
+    monkeypatch.setattr(priorities, 'MAX_PRIORITY', 102)
+    allocator = PriorityAllocator(FakeElbv2([101]), 'listener')
+    with pytest.raises(RuntimeError, match='No free rule priority'):
+        allocator.reserve(3)
+    # The partial reservation was given back
+    assert allocator.reserve(2) == [100, 102]
+
+
+def test_rules_are_read_again_after_the_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(priorities.time, 'monotonic', lambda: now[0])
+    elbv2 = FakeElbv2([100])
+    allocator = PriorityAllocator(elbv2, 'listener', ttl=60)
+    allocator.rules()
+    allocator.reserve()
+    assert elbv2.describe_calls == 1
+    now[0] = 61
+    assert len(allocator.rules()) == 2
+    assert elbv2.describe_calls == 2
+
+
+def test_allocator_is_shared_per_listener():
+    elbv2 = FakeElbv2()
+    assert priorities.get_allocator(elbv2, 'listener-a') is priorities.get_allocator(elbv2, 'listener-a')
+    assert priorities.get_allocator(elbv2, 'listener-a') is not priorities.get_allocator(elbv2, 'listener-b')
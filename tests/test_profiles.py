@@ -0,0 +1,65 @@
+import pytest
+import profiles
+
+
+def test_unknown_health_check_profile_is_refused():
+    assert profiles.health_check_profile('fast')['interval'] == 5
+    with pytest.raises(ValueError, match="Unknown health check profile 'quick'"):
+        profiles.health_check_profile('quick')
+
+
+def test_health_check_profile_defaults_to_the_configured_one(settings):
+    settings(health_check_profile='standard')
+    assert profiles.health_check_profile() is profiles.HEALTH_CHECK_PROFILES['standard']
+
+
+def test_target_group_matches_the_profile_health_check():
+    fast, conservative = profiles.HEALTH_CHECK_PROFILES['fast'], profiles.HEALTH_CHECK_PROFILES['conservative']
+    target_group = dict(profiles.target_group_health_check(fast), TargetGroupArn='tg')
+    assert profiles.target_group_matches(target_group, fast)
+    assert not profiles.target_group_matches(target_group, conservative)
+    assert profiles.target_group_attributes(fast) == [{'Key': 'deregistration_delay.timeout_seconds', 'Value': '30'}]
+
+
+def test_container_health_check_keeps_its_command():
+    fast = profiles.HEALTH_CHECK_PROFILES['fast']
+    assert profiles.container_health_check(fast)['command'] == profiles.CONTAINER_HEALTH_COMMAND
+    health_check = profiles.container_health_check(fast, ['CMD', '/bin/check'])
+    assert health_check == {'command': ['CMD', '/bin/check'], 'interval': 5, 'timeout': 2, 'retries': 2,
+                            'startPeriod': 10}
+
+
+def container(**settings):
+    return dict({'name': 'app', 'logConfiguration': {'logDriver': 'awslogs', 'options': {'awslogs-group': 'logs'}}},
+                **settings)
+
+
+def test_unknown_task_profile_is_refused(settings):
+    settings(task_profile='batch-worker')
+    assert profiles.task_profile()['memory'] == '8192'
+    with pytest.raises(ValueError, match="Unknown task profile 'large'"):
+        profiles.task_profile('large')
+
+
+def test_task_profile_sets_the_container_and_storage_settings():
+    task_definition = {'containerDefinitions': [container(), container(logConfiguration={'logDriver': 'splunk'})]}
+    profiles.apply_task_profile(task_definition, profiles.TASK_PROFILES['batch-worker'])
+
+    app, sidecar = task_definition['containerDefinitions']
+    assert app['ulimits'] == [{'name': 'nofile', 'softLimit': 65535, 'hardLimit': 65535}]
+    assert app['stopTimeout'] == 120
+    assert app['logConfiguration']['options'] == {'awslogs-group': 'logs', 'mode': 'non-blocking',
+                                                  'max-buffer-size': '25m'}
+    # Only awslogs containers get its options
+    assert sidecar['logConfiguration'] == {'logDriver': 'splunk'}
+    assert task_definition['ephemeralStorage'] == {'sizeInGiB': 100}
+    # The profile's ulimits are not shared with the task definition
+    app['ulimits'][0]['softLimit'] = 1
+    assert profiles.TASK_PROFILES['batch-worker']['ulimits'][0]['softLimit'] == 65535
+
+
+def test_legacy_task_profile_removes_the_newer_settings():
+    task_definition = {'containerDefinitions': [container()]}
+    profiles.apply_task_profile(task_definition, profiles.TASK_PROFILES['batch-worker'])
+    profiles.apply_task_profile(task_definition, profiles.TASK_PROFILES['legacy'])
+    assert task_definition == {'containerDefinitions': [container()]}
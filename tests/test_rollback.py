@@ -0,0 +1,187 @@
+import json
+import pytest
+import autoscaling
+import cloudflare
+import rollback
+import waiters
+from pipeline import run_pipeline
+from state_store import DeploymentStore
+
+
+class NotFound(Exception):
+    pass
+
+
+class ClientError(Exception):
+    pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeEcs:
+    class exceptions:
+        ServiceNotFoundException = NotFound
+        ServiceNotActiveException = NotFound
+
+    def __init__(self, calls, draining=()):
+        self.calls = calls
+        self.services = {}
+        self.draining = set(draining)
+
+    def delete_service(self, cluster, service, force):
+        self.calls.append(('delete_service', service))
+        if self.services.get(service) != 'ACTIVE':
+            raise NotFound(service)
+        self.services[service] = 'DRAINING' if service in self.draining else 'INACTIVE'
+
+    def deregister_task_definition(self, taskDefinition):
+        self.calls.append(('deregister', taskDefinition))
+
+    def describe_services(self, cluster, services):
+        return {'services': [{'serviceName': name, 'status': self.services.get(name, 'INACTIVE')} for name in services]}
+
+
+class FakeElbv2:
+    class exceptions:
+        TargetGroupNotFoundException = NotFound
+        RuleNotFoundException = NotFound
+        ClientError = ClientError
+
+    def __init__(self, calls, missing=()):
+        self.calls = calls
+        self.missing = set(missing)
+
+    def delete_rule(self, RuleArn):
+        self.calls.append(('delete_rule', RuleArn))
+        if RuleArn in self.missing:
+            raise NotFound(RuleArn)
+
+    def delete_target_group(self, TargetGroupArn):
+        self.calls.append(('delete_target_group', TargetGroupArn))
+        if TargetGroupArn in self.missing:
+            raise NotFound(TargetGroupArn)
+
+
+class FakeCloudflare:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def delete_records(self, zone_id, names):
+        self.calls.append(('delete_records', zone_id, tuple(names)))
+        return names
+
+
+def deployment(name, zone='zone', **fields):
+    return dict({'service_name': name, 'ecs_cluster': 'cluster', 'task_definition_arn': f'{name}-task:1',
+                 'target_group_arn': f'{name}-tg', 'rules': [f'{name}-rule'], 'domain_name': f'{name}.example.com',
+                 'cloudflare_api_token': 'token', 'cloudflare_zone_id': zone, 'project_name': name}, **fields)
+
+
+@pytest.fixture
+def account(aws, monkeypatch):
+    calls = []
+    aws['ecs'] = FakeEcs(calls)
+    aws['elbv2'] = FakeElbv2(calls)
+    dns = FakeCloudflare(calls)
+    monkeypatch.setattr(cloudflare, 'get_client', lambda api_token: dns)
+    monkeypatch.setattr(autoscaling, 'remove_service_scaling', lambda cluster, service: calls.append(('scaling', service)))
+    return calls, aws['ecs'], aws['elbv2'], dns
+
+
+def test_target_groups_are_deleted_after_their_rules_and_the_drain(account):
+    calls, ecs, elbv2, dns = account
+    ecs.services = {'billing': 'ACTIVE', 'search': 'ACTIVE', 'billing-arm64': 'ACTIVE'}
+    side = {'service_name': 'billing-arm64', 'target_group_arn': 'billing-arm64-tg'}
+
+    result = run_pipeline(rollback.build_teardown_steps([deployment('billing', side_by_side=side),
+                                                         deployment('search')]))
+
+    assert result.ok
+    assert ecs.services == {'billing': 'INACTIVE', 'search': 'INACTIVE', 'billing-arm64': 'INACTIVE'}
+    for target_group, rule in (('billing-tg', 'billing-rule'), ('billing-arm64-tg', 'billing-rule'),
+                               ('search-tg', 'search-rule')):
+        assert calls.index(('delete_rule', rule)) < calls.index(('delete_target_group', target_group))
+    # One batch of CNAME deletions for the zone
+    assert [call for call in calls if call[0] == 'delete_records'] == \
+        [('delete_records', 'zone', ('billing.example.com', 'search.example.com'))]
+
+
+def test_resources_already_gone_count_as_deleted(account):
+    calls, ecs, elbv2, dns = account
+    elbv2.missing = {'billing-rule', 'billing-tg'}
+
+    result = run_pipeline(rollback.build_teardown_steps([deployment('billing')]))
+
+    assert result.ok
+    assert ('delete_service', 'billing') in calls
+
+
+def test_a_service_that_does_not_drain_keeps_its_target_group(account, monkeypatch):
+    calls, ecs, elbv2, dns = account
+    ecs.services = {'billing': 'ACTIVE'}
+    ecs.draining = {'billing'}
+    clock = FakeClock()
+    monkeypatch.setattr(waiters, 'time', clock)
+    monkeypatch.setattr(rollback, 'wait_for_services_draining',
+                        lambda cluster, names: waiters.wait_for_services_inactive(ecs, cluster, names, max_wait_time=60,
+                                                                                  sleep=clock.sleep))
+
+    result = run_pipeline(rollback.build_teardown_steps([deployment('billing')]))
+
+    assert list(result.failed) == ['drain:cluster']
+    assert result.skipped == ['0:billing:target_group']
+    assert ('delete_target_group', 'billing-tg') not in calls
+
+
+def test_failed_deletion_fails_its_step(account):
+    calls, ecs, elbv2, dns = account
+
+    def denied(RuleArn):
+        raise ClientError('AccessDenied')
+
+    elbv2.delete_rule = denied
+    result = run_pipeline(rollback.build_teardown_steps([deployment('billing')]))
+
+    assert list(result.failed) == ['0:billing:rule:billing-rule']
+    assert result.skipped == ['0:billing:target_group']
+
+
+def test_main_keeps_the_records_of_incomplete_rollbacks(account, tmp_path):
+    calls, ecs, elbv2, dns = account
+    store = DeploymentStore()
+    billing = store.add(deployment('billing', zone='zone-a'))
+    search_file = tmp_path / 'deployment_info_search_20240101-000000.json'
+    search_file.write_text(json.dumps(deployment('search', zone='zone-b')))
+    ecs.services = {'billing': 'ACTIVE', 'search': 'ACTIVE'}
+
+    def delete_records(zone_id, names):
+        calls.append(('delete_records', zone_id, tuple(names)))
+        if zone_id == 'zone-a':
+            raise cloudflare.CloudflareError('rate limited')
+        return names
+
+    dns.delete_records = delete_records
+    with pytest.raises(SystemExit) as exit_info:
+        rollback.main(['billing', str(search_file)])
+
+    assert exit_info.value.code == 1
+    # The CNAME of billing's zone was not deleted, so its record stays active
+    assert store.get(billing)['active']
+    assert not search_file.exists()
+
+
+def test_main_refuses_incomplete_records(account, tmp_path):
+    path = tmp_path / 'deployment_info_billing_20240101-000000.json'
+    path.write_text(json.dumps(deployment('billing', target_group_arn=None)))
+    with pytest.raises(SystemExit):
+        rollback.main([str(path)])
+    assert account[0] == []
@@ -0,0 +1,107 @@
+import pytest
+import bluegreen
+import discovery
+import image_publish
+import side_by_side
+import sizing
+import update_service
+
+TASK_DEFINITION = {'family': 'billing', 'cpu': '512', 'memory': '2048',
+                   'runtimePlatform': {'cpuArchitecture': 'X86_64', 'operatingSystemFamily': 'LINUX'},
+                   'containerDefinitions': [{'name': 'billing', 'image': 'registry/billing:v1'}]}
+
+
+class FakeEcs:
+    def describe_task_definition(self, taskDefinition, include=None):
+        return {'taskDefinition': TASK_DEFINITION, 'tags': []}
+
+    def describe_services(self, cluster, services):
+        return {'services': [{'serviceName': name, 'runningCount': 2} for name in services]}
+
+
+def deployment():
+    return {'service_name': 'billing', 'ecs_cluster': 'cluster', 'project_name': 'billing',
+            'task_definition_arn': 'billing:1', 'target_group_arn': 'billing-tg', 'rules': ['rule']}
+
+
+@pytest.fixture
+def calls(aws, monkeypatch):
+    aws['ecs'] = FakeEcs()
+    calls = []
+
+    def register_or_reuse(ecs_client, spec, index, tags=None):
+        calls.append(('register', spec['runtimePlatform']['cpuArchitecture']))
+        return 'billing:2'
+
+    monkeypatch.setattr(update_service, 'register_or_reuse', register_or_reuse)
+    monkeypatch.setattr(bluegreen, 'forwarding_rule', lambda rules, target_group: {'RuleArn': 'rule'})
+    monkeypatch.setattr(bluegreen, 'clone_target_group', lambda source, name: calls.append(('tg', name)) or f'{name}-tg')
+    monkeypatch.setattr(bluegreen, 'clone_service',
+                        lambda cluster, source, name, task_definition, target_group: calls.append(('service', name)))
+    monkeypatch.setattr(bluegreen, 'set_weights',
+                        lambda rule, old, new, percent: calls.append(('weights', new, percent)))
+    monkeypatch.setattr(bluegreen, 'wait_for_healthy_targets', lambda target_group, max_wait_time: True)
+    monkeypatch.setattr(bluegreen, 'delete_service', lambda cluster, name, target_group: calls.append(('delete', name)))
+    monkeypatch.setattr(discovery, 'tag_resources', lambda arns, tags: None)
+    return calls
+
+
+def test_copy_runs_on_the_other_architecture(calls):
+    started = side_by_side.start(deployment(), percent=20)
+
+    assert calls == [('register', 'ARM64'), ('tg', 'billing-arm64'), ('weights', 'billing-arm64-tg', 0),
+                     ('service', 'billing-arm64'), ('weights', 'billing-arm64-tg', 20)]
+    assert (started['service_name'], started['cpu_architecture'], started['baseline_architecture']) == \
+        ('billing-arm64', 'ARM64', 'X86_64')
+
+
+def test_copy_on_the_same_architecture_is_refused(calls):
+    assert side_by_side.start(deployment(), 'X86_64') is None
+    assert calls == []
+
+
+def test_copy_without_an_image_for_its_architecture_is_not_started(calls, monkeypatch):
+    def register_or_reuse(ecs_client, spec, index, tags=None):
+        raise image_publish.ImageArchitectureError('Image registry/billing:v1 is built for amd64, not arm64 (ARM64).')
+
+    monkeypatch.setattr(update_service, 'register_or_reuse', register_or_reuse)
+    assert side_by_side.start(deployment()) is None
+    assert calls == []
+
+
+def test_unhealthy_copy_is_deleted(calls, monkeypatch):
+    monkeypatch.setattr(bluegreen, 'wait_for_healthy_targets', lambda target_group, max_wait_time: False)
+    assert side_by_side.start(deployment()) is None
+    assert calls[-2:] == [('weights', 'billing-tg', 100), ('delete', 'billing-arm64')]
+
+
+def test_stop_sends_all_traffic_back(calls):
+    record = dict(deployment(), side_by_side={'service_name': 'billing-arm64', 'target_group_arn': 'billing-arm64-tg',
+                                              'rule_arn': 'rule'})
+    side_by_side.stop(record)
+    assert calls == [('weights', 'billing-tg', 100), ('delete', 'billing-arm64')]
+
+
+class FakeCloudWatch:
+    values = {'requests0': [3000, 600], 'requests1': [3600], 'p990': [0.2], 'cpu1': [40.0]}
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime):
+        return {'MetricDataResults': [{'Id': query['Id'], 'Values': self.values.get(query['Id'], [])}
+                                      for query in MetricDataQueries]}
+
+
+def test_comparison_prices_each_architecture(aws, calls, settings):
+    settings(alb_arn='arn:aws:elasticloadbalancing:eu-west-1:123456789012:loadbalancer/app/alb/1')
+    aws['cloudwatch'] = FakeCloudWatch()
+    record = dict(deployment(), side_by_side={
+        'service_name': 'billing-arm64', 'target_group_arn': 'arn:targetgroup/billing-arm64/2',
+        'task_definition_arn': 'billing:2', 'cpu_architecture': 'ARM64', 'baseline_architecture': 'X86_64',
+        'started_at': 0})
+
+    x86, arm = side_by_side.compare(record, window=3600)
+
+    # Sums add up over the datapoints
+    assert x86['requests'] == arm['requests'] == 3600
+    assert (x86['p99'], arm['cpu'], arm['tasks']) == (0.2, 40.0, 2)
+    assert x86['hourly_cost'] == pytest.approx(sizing.monthly_cost('512', '2048', 2) / sizing.HOURS_PER_MONTH)
+    assert arm['cost_per_million_requests'] < x86['cost_per_million_requests']
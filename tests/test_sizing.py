@@ -0,0 +1,99 @@
+import pytest
+import sizing
+
+
+class FakeCloudWatch:
+    """Returns the datapoints of each query in pages of `page_size`."""
+
+    def __init__(self, values, page_size=2):
+        self.values = values
+        self.page_size = page_size
+        self.calls = []
+
+    def get_metric_data(self, MetricDataQueries, StartTime, EndTime, NextToken=None):
+        self.calls.append((len(MetricDataQueries), NextToken))
+        start = int(NextToken or 0)
+        end = start + self.page_size
+        response = {'MetricDataResults': [{'Id': query['Id'], 'Values': self.values.get(query['Id'], [])[start:end]}
+                                          for query in MetricDataQueries]}
+        if any(len(self.values.get(query['Id'], [])) > end for query in MetricDataQueries):
+            response['NextToken'] = str(end)
+        return response
+
+
+def test_fargate_sizes():
+    assert sizing.is_valid('256', '512')
+    assert not sizing.is_valid('256', '4096')
+    assert not sizing.is_valid('300', '512')
+    # The smallest size with enough CPU is not always the cheapest with enough memory
+    assert sizing.cheapest_size(200, 1500) == ('256', '2048')
+    assert sizing.cheapest_size(600, 1000) == ('1024', '2048')
+    assert sizing.cheapest_size(20000, 1024) is None
+
+
+def test_percentiles():
+    assert sizing.percentiles([5, 1, 4, 2, 3], [0.5, 0.95, 1.0]) == [3, 5, 5]
+    assert sizing.percentiles([], [0.5]) == [0.0]
+
+
+def utilization(cpu, memory, datapoints=sizing.MIN_DATAPOINTS):
+    return {'cpu': [cpu] * datapoints, 'memory': [memory] * datapoints}
+
+
+def test_oversized_service_is_scaled_down():
+    recommendation = sizing.recommend('billing', '1024', '4096', utilization(cpu=10, memory=20))
+
+    # 102 CPU units and 819 MiB used, with headroom
+    assert (recommendation.cpu, recommendation.memory) == ('256', '1024')
+    assert recommendation.changed
+    assert recommendation.monthly_savings > 0
+    assert 'Recommended 256/1024 instead of 1024/4096' in recommendation.format()
+
+
+def test_service_without_enough_data_is_not_sized():
+    assert sizing.recommend('billing', '1024', '4096', utilization(10, 20, sizing.MIN_DATAPOINTS - 1)) is None
+
+
+def test_service_larger_than_fargate_has_no_size():
+    recommendation = sizing.recommend('billing', '16384', '122880', utilization(cpu=100, memory=100))
+    assert recommendation.cpu is None and not recommendation.changed
+    assert 'No Fargate size is large enough' in recommendation.format()
+
+
+def test_utilization_is_read_in_batches_and_pages(aws, monkeypatch):
+    monkeypatch.setattr(sizing, 'MAX_QUERIES', 4)
+    aws['cloudwatch'] = FakeCloudWatch({'cpu0': [1, 2, 3], 'memory0': [4], 'cpu2': [5, 6]})
+
+    result = sizing.fetch_utilization('cluster', ['billing', 'search', 'orders'])
+
+    assert result == {'billing': {'cpu': [1, 2, 3], 'memory': [4]}, 'search': {'cpu': [], 'memory': []},
+                      'orders': {'cpu': [5, 6], 'memory': []}}
+    # Two batches of queries, the first one read in two pages
+    assert aws['cloudwatch'].calls == [(4, None), (4, '2'), (2, None)]
+
+
+class FakeEcs:
+    def __init__(self, task_definitions):
+        self.task_definitions = task_definitions
+
+    def describe_services(self, cluster, services):
+        return {'services': [{'serviceName': name, 'taskDefinition': name} for name in services]}
+
+    def describe_task_definition(self, taskDefinition):
+        return {'taskDefinition': self.task_definitions[taskDefinition]}
+
+
+def test_sizes_are_priced_for_the_service_architecture(aws):
+    aws['ecs'] = FakeEcs({'billing': {'cpu': '1024', 'memory': '4096', 'runtimePlatform': {'cpuArchitecture': 'ARM64'}},
+                          'search': {'cpu': '1024', 'memory': '4096'}})
+    aws['cloudwatch'] = FakeCloudWatch({f'{key}{index}': [10] * sizing.MIN_DATAPOINTS
+                                        for key in ('cpu', 'memory') for index in range(2)}, page_size=100)
+
+    recommendations = sizing.recommend_services('cluster', ['billing', 'search'])
+
+    assert recommendations['billing'].cpu_architecture == 'ARM64'
+    assert recommendations['search'].cpu_architecture == 'X86_64'
+    assert recommendations['billing'].monthly_savings < recommendations['search'].monthly_savings
+    assert 'on ARM64' in recommendations['billing'].format()
+    # A service moving to another architecture is priced for it
+    assert sizing.recommend_services('cluster', ['search'], cpu_architecture='ARM64')['search'].cpu_architecture == 'ARM64'
@@ -0,0 +1,59 @@
+import sys
+import types
+import pytest
+import main as deploy
+import start
+from pipeline import PipelineResult
+
+
+@pytest.fixture
+def pushed(monkeypatch):
+    pushed = []
+    monkeypatch.setenv('AWS_REGION', 'eu-west-1')
+    monkeypatch.setenv('IMAGE_TAG', 'v1')
+    # Set by start.main, restored after the test
+    monkeypatch.setenv('ECR_REPO_URI', '')
+    monkeypatch.setattr('sys.argv', ['start.py', '--extra-tag', 'latest'])
+    monkeypatch.setattr(start, 'load_env_variables', lambda: None)
+    monkeypatch.setattr(start.clients, 'get_client', lambda service, region: 'ecr')
+    monkeypatch.setattr(start, 'check_ecr_repo', lambda ecr: 'registry/billing')
+    monkeypatch.setattr(start, 'push_docker_image', lambda ecr, repo_uri, tags: pushed.append((repo_uri, tags)))
+    return pushed
+
+
+def test_pushes_every_tag_then_deploys(pushed, monkeypatch):
+    monkeypatch.setattr(deploy, 'main', lambda: PipelineResult())
+    start.main()
+    assert pushed == [('registry/billing', ['v1', 'latest'])]
+
+
+def test_exits_with_status_1_when_the_deploy_fails(pushed, monkeypatch):
+    def failed_deploy():
+        result = PipelineResult()
+        result.failed['service'] = RuntimeError('ECS service was not created and stable.')
+        return result
+
+    monkeypatch.setattr(deploy, 'main', failed_deploy)
+    with pytest.raises(SystemExit) as exit_info:
+        start.main()
+    assert exit_info.value.code == 1
+
+
+@pytest.mark.parametrize('new_img, built', [
+    ('billing:dev', 'billing'),
+    ('localhost:5000/billing', 'localhost:5000/billing'),
+    ('localhost:5000/team/billing:dev', 'localhost:5000/team/billing'),
+])
+def test_multiarch_images_are_named_after_new_img_without_its_tag(monkeypatch, new_img, built):
+    monkeypatch.setenv('NEW_IMG', new_img)
+    # The CI does not install the Docker SDK, and no daemon is needed here
+    monkeypatch.setitem(sys.modules, 'docker', types.SimpleNamespace(from_env=lambda: 'docker'))
+    names = []
+    monkeypatch.setattr(start.image_publish, 'build_image',
+                        lambda docker_client, context, image_name, platform: names.append(image_name))
+    monkeypatch.setattr(start.image_publish, 'publish_multiarch',
+                        lambda ecr, docker_client, image_names, repo_uri, tag: names.append((tuple(image_names), tag)))
+
+    start.push_multiarch_image('ecr', 'registry/billing', ['v1'], ['linux/amd64', 'linux/arm64'], '.')
+
+    assert names == [f'{built}:amd64', f'{built}:arm64', ((f'{built}:amd64', f'{built}:arm64'), 'v1')]
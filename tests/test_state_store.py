@@ -0,0 +1,90 @@
+import json
+import sqlite3
+import pytest
+import state_store
+from state_store import DeploymentStore
+
+
+def record(service_name='billing', **fields):
+    return dict({'service_name': service_name, 'ecs_cluster': 'cluster', 'domain_name': f'{service_name}.example.com',
+                 'project_name': service_name, 'task_definition_arn': f'{service_name}-task:1'}, **fields)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DeploymentStore(str(tmp_path / 'deployments.db'))
+
+
+def test_find_filters_and_orders_newest_first(store):
+    old = store.add(record(), created_at=100)
+    new = store.add(record(), created_at=200)
+    store.add(record('search'), created_at=300)
+    store.add(record(ecs_cluster='staging'), created_at=400)
+
+    assert [r['deployment_id'] for r in store.find(service_name='billing', cluster='cluster')] == [new, old]
+    assert store.latest(domain_name='billing.example.com', cluster='cluster')['deployment_id'] == new
+    assert [r['deployment_id'] for r in store.find(service_name='billing', since=150, until=300)] == [new]
+
+    store.deactivate(new)
+    assert store.latest(service_name='billing', cluster='cluster')['deployment_id'] == old
+    assert store.latest(service_name='billing', cluster='cluster', active_only=False)['deployment_id'] == new
+    assert store.get(new)['active'] is False
+
+
+def test_update_fields_merges_and_records_the_task_definition_history(store):
+    deployment_id = store.add(record(), created_at=100)
+    store.update_fields(deployment_id, rules=['rule-arn'])
+    store.update_task_definition(deployment_id, 'billing-task:2')
+
+    stored = store.get(deployment_id)
+    assert stored['rules'] == ['rule-arn']
+    assert stored['task_definition_arn'] == 'billing-task:2'
+    assert [arn for arn, _ in store.history(deployment_id)] == ['billing-task:1', 'billing-task:2']
+    with pytest.raises(KeyError):
+        store.update_fields(deployment_id + 1, rules=[])
+
+
+def test_import_json_files_once_and_skips_invalid_ones(store, tmp_path):
+    directory = tmp_path / 'files'
+    directory.mkdir()
+    (directory / 'deployment_info_billing_20240102-030405.json').write_text(json.dumps(record()))
+    (directory / 'deployment_info_search_20240101-000000.json').write_text('{not json')
+
+    assert store.import_json_files(str(directory)) == 1
+    assert store.import_json_files(str(directory)) == 0
+    imported = store.latest(service_name='billing')
+    assert imported['created_at'] == state_store.parse_timestamp('20240102-030405')
+    assert store.get_by_file(str(directory / 'deployment_info_billing_20240102-030405.json'))['deployment_id'] == \
+        imported['deployment_id']
+
+
+def test_resolve_deployment_by_file_or_service(store, tmp_path, monkeypatch):
+    path = tmp_path / 'deployment_info_billing_20240102-030405.json'
+    path.write_text(json.dumps(record()))
+    assert state_store.resolve_deployment(str(path), store) == (record(), None, str(path))
+
+    deployment_id = store.add(record())
+    resolved, resolved_id, file_path = state_store.resolve_deployment('billing', store)
+    assert (resolved['task_definition_arn'], resolved_id, file_path) == ('billing-task:1', deployment_id, None)
+
+    monkeypatch.setattr(state_store, '_discover', lambda target, store: None)
+    assert state_store.resolve_deployment('unknown', store) == (None, None, None)
+
+
+def test_stores_without_the_project_column_are_migrated(tmp_path):
+    path = str(tmp_path / 'deployments.db')
+    with sqlite3.connect(path) as conn:
+        # The deployments table before project names were stored in a column
+        conn.execute('CREATE TABLE deployments (id INTEGER PRIMARY KEY AUTOINCREMENT, service_name TEXT NOT NULL, '
+                     'ecs_cluster TEXT NOT NULL, domain_name TEXT, task_definition_arn TEXT, created_at REAL NOT NULL, '
+                     'updated_at REAL NOT NULL, active INTEGER NOT NULL DEFAULT 1, source_file TEXT UNIQUE, '
+                     'record TEXT NOT NULL)')
+        conn.execute('INSERT INTO deployments (service_name, ecs_cluster, created_at, updated_at, record) '
+                     'VALUES (?, ?, ?, ?, ?)', ('billing-green', 'cluster', 100, 100,
+                                                json.dumps(record('billing-green', project_name='billing'))))
+
+    store = DeploymentStore(path)
+
+    assert store.latest(project_name='billing')['service_name'] == 'billing-green'
+    # A blue/green rollout moved the project to another service, which is found by project name
+    assert state_store.resolve_deployment('billing', store)[0]['service_name'] == 'billing-green'
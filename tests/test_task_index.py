@@ -0,0 +1,152 @@
+import copy
+import json
+from task_index import INDEX_VERSION, TaskDefinitionIndex, task_definition_hash
+
+
+def task_definition(**overrides):
+    definition = {
+        'family': 'billing',
+        'cpu': '512',
+        'memory': '2048',
+        'containerDefinitions': [{
+            'name': 'billing',
+            'image': 'repo/billing:v1',
+            'cpu': 0,
+            'healthCheck': {'command': ['CMD-SHELL', 'true'], 'interval': 30, 'startPeriod': 60},
+            'logConfiguration': {'logDriver': 'awslogs', 'options': {'awslogs-group': 'billing', 'mode': 'non-blocking'}},
+        }],
+    }
+    definition.update(overrides)
+    return definition
+
+
+def test_hash_ignores_key_order_and_registration_metadata():
+    registered = task_definition()
+    described = copy.deepcopy(registered)
+    described.update({'taskDefinitionArn': 'arn:aws:ecs:task-definition/billing:7', 'revision': 7,
+                      'status': 'ACTIVE', 'requiresAttributes': [{'name': 'ecs.capability.execution-role-awslogs'}]})
+    described['containerDefinitions'][0]['healthCheck'] = {'startPeriod': 60, 'interval': 30,
+                                                           'command': ['CMD-SHELL', 'true']}
+    assert task_definition_hash(described) == task_definition_hash(registered)
+
+
+def test_hash_treats_missing_settings_as_their_defaults():
+    registered = task_definition()
+    described = task_definition(runtimePlatform={'cpuArchitecture': 'X86_64', 'operatingSystemFamily': 'LINUX'})
+    described['containerDefinitions'][0]['ulimits'] = []
+    assert task_definition_hash(described) == task_definition_hash(registered)
+
+
+def test_hash_changes_with_what_decides_reuse():
+    base = task_definition_hash(task_definition())
+    arm = task_definition(runtimePlatform={'cpuArchitecture': 'ARM64'})
+    larger = task_definition(memory='4096')
+    storage = task_definition(ephemeralStorage={'sizeInGiB': 100})
+    image = task_definition()
+    image['containerDefinitions'][0]['image'] = 'repo/billing:v2'
+    blocking = task_definition()
+    del blocking['containerDefinitions'][0]['logConfiguration']['options']['mode']
+    hashes = {task_definition_hash(definition) for definition in (arm, larger, storage, image, blocking)}
+    assert base not in hashes
+    assert len(hashes) == 5
+
+
+class FakeEcs:
+    """Task definition revisions of one account, with list_task_definitions pages of 2."""
+
+    def __init__(self):
+        self.revisions = {}
+        self.described = []
+
+    def register(self, family='billing', status='ACTIVE', **overrides):
+        revision = 1 + max([r['revision'] for r in self.revisions.values() if r['family'] == family], default=0)
+        definition = task_definition(family=family, **overrides)
+        definition.update(taskDefinitionArn=f'arn:aws:ecs:task-definition/{family}:{revision}', revision=revision,
+                          status=status)
+        self.revisions[definition['taskDefinitionArn']] = definition
+        return definition
+
+    def get_paginator(self, name):
+        ecs = self
+
+        class Paginator:
+            def paginate(self, familyPrefix, status, sort):
+                arns = sorted((arn for arn, definition in ecs.revisions.items()
+                               if definition['family'].startswith(familyPrefix) and definition['status'] == status),
+                              key=lambda arn: int(arn.rsplit(':', 1)[1]), reverse=True)
+                for i in range(0, len(arns), 2):
+                    yield {'taskDefinitionArns': arns[i:i + 2]}
+
+        return Paginator()
+
+    def describe_task_definition(self, taskDefinition):
+        self.described.append(taskDefinition)
+        return {'taskDefinition': copy.deepcopy(self.revisions[taskDefinition])}
+
+
+def test_sync_only_describes_new_revisions_of_the_family(tmp_path):
+    ecs = FakeEcs()
+    for tag in ('v1', 'v2', 'v3'):
+        ecs.register(containerDefinitions=[{'image': f'repo/billing:{tag}'}])
+    ecs.register(family='billing-worker')
+    index = TaskDefinitionIndex(ecs, str(tmp_path / 'index.json'))
+
+    index.sync('billing')
+    assert len(ecs.described) == 3
+    assert index.find(task_definition(containerDefinitions=[{'image': 'repo/billing:v2'}])).endswith('billing:2')
+
+    ecs.register(containerDefinitions=[{'image': 'repo/billing:v4'}])
+    ecs.described.clear()
+    TaskDefinitionIndex(ecs, str(tmp_path / 'index.json')).sync('billing')
+    assert ecs.described == ['arn:aws:ecs:task-definition/billing:4']
+
+
+def test_added_revision_is_not_described_again(tmp_path):
+    ecs = FakeEcs()
+    ecs.register()
+    index = TaskDefinitionIndex(ecs, str(tmp_path / 'index.json'))
+    index.sync('billing')
+
+    index.add(ecs.register(memory='4096'))
+    index.save()
+    ecs.described.clear()
+    TaskDefinitionIndex(ecs, str(tmp_path / 'index.json')).sync('billing')
+    assert ecs.described == []
+
+
+def test_revisions_registered_elsewhere_before_an_added_one_are_still_synced(tmp_path):
+    ecs = FakeEcs()
+    ecs.register()
+    index = TaskDefinitionIndex(ecs, str(tmp_path / 'index.json'))
+    index.sync('billing')
+
+    elsewhere = ecs.register(memory='1024')
+    index.add(ecs.register(memory='4096'))
+    ecs.described.clear()
+    index.sync('billing')
+    assert elsewhere['taskDefinitionArn'] in ecs.described
+    assert index.find(task_definition(memory='1024')) == elsewhere['taskDefinitionArn']
+
+
+def test_find_forgets_deregistered_revisions(tmp_path):
+    ecs = FakeEcs()
+    registered = ecs.register()
+    index = TaskDefinitionIndex(ecs, str(tmp_path / 'index.json'))
+    index.sync('billing')
+
+    registered['status'] = 'INACTIVE'
+    assert index.find(task_definition()) is None
+    assert TaskDefinitionIndex(ecs, str(tmp_path / 'index.json')).find(task_definition()) is None
+
+
+def test_index_of_an_older_version_is_rebuilt(tmp_path):
+    path = tmp_path / 'index.json'
+    path.write_text(json.dumps({'version': INDEX_VERSION - 1,
+                                'families': {'billing': {'last_revision': 9, 'specs': {}}}}))
+    ecs = FakeEcs()
+    ecs.register()
+    index = TaskDefinitionIndex(ecs, str(path))
+    index.sync('billing')
+    assert index.find(task_definition()).endswith('billing:1')
+    path.write_text('not json')
+    assert TaskDefinitionIndex(ecs, str(path)).find(task_definition()) is None
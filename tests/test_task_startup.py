@@ -0,0 +1,77 @@
+import datetime
+import task_startup
+from state_store import DeploymentStore
+
+
+def task(number, deployment_id, created, pull=10, start=5, ip=None):
+    return {'taskArn': f'arn:aws:ecs:task/cluster/task{number}', 'taskDefinitionArn': 'billing:2',
+            'startedBy': deployment_id, 'createdAt': created, 'pullStartedAt': created + 3,
+            'pullStoppedAt': created + 3 + pull, 'startedAt': created + 3 + pull + start,
+            'containers': [{'networkInterfaces': [{'privateIpv4Address': ip or f'10.0.0.{number}'}]}]}
+
+
+class FakeEcs:
+    def __init__(self, deployment_id, tasks):
+        self.deployments = [{'id': deployment_id, 'status': 'PRIMARY'}, {'id': 'ecs-svc/old', 'status': 'ACTIVE'}]
+        self.tasks = {t['taskArn']: t for t in tasks}
+        self.describe_batches = []
+
+    def describe_services(self, cluster, services):
+        return {'services': [{'serviceName': services[0], 'deployments': self.deployments}]}
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, cluster, serviceName, desiredStatus):
+        arns = list(self.tasks)
+        return [{'taskArns': arns[:2]}, {'taskArns': arns[2:]}]
+
+    def describe_tasks(self, cluster, tasks):
+        self.describe_batches.append(len(tasks))
+        return {'tasks': [self.tasks[arn] for arn in tasks]}
+
+
+def test_phases_from_datetimes_and_missing_timestamps():
+    created = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    phases = task_startup.task_phases({'createdAt': created, 'pullStartedAt': created + datetime.timedelta(seconds=4),
+                                       'pullStoppedAt': created + datetime.timedelta(seconds=24)})
+    assert phases == {'provisioning': 4, 'pull': 20, 'start': None, 'healthy': None, 'total': None}
+
+
+def test_tasks_of_the_primary_deployment_are_measured_and_recorded(aws, monkeypatch):
+    monkeypatch.setattr(task_startup, 'TASK_BATCH_SIZE', 2)
+    aws['ecs'] = FakeEcs('ecs-svc/new', [task(1, 'ecs-svc/new', 1000), task(2, 'ecs-svc/new', 1000, pull=20),
+                                         task(3, 'ecs-svc/old', 500)])
+    store = DeploymentStore()
+
+    report = task_startup.analyze('cluster', 'billing', healthy_at={'10.0.0.1': 1030}, store=store)
+
+    assert [row['task_arn'] for row in report.rows] == ['arn:aws:ecs:task/cluster/task1',
+                                                        'arn:aws:ecs:task/cluster/task2']
+    assert aws['ecs'].describe_batches == [2, 1]
+    assert report.rows[0]['healthy'] == 12 and report.rows[1]['healthy'] is None
+    assert report.medians['pull'] == 15
+    assert report.regressions == []
+    assert len(store.task_startups('billing', 'cluster')) == 2
+    assert 'task1' in report.format()
+
+
+def test_slower_phases_than_the_previous_deployment_are_regressions(aws):
+    store = DeploymentStore()
+    aws['ecs'] = FakeEcs('ecs-svc/1', [task(1, 'ecs-svc/1', 1000, pull=10)])
+    task_startup.analyze('cluster', 'billing', store=store)
+    aws['ecs'] = FakeEcs('ecs-svc/2', [task(2, 'ecs-svc/2', 2000, pull=30, start=6)])
+
+    report = task_startup.analyze('cluster', 'billing', store=store)
+
+    # The pull phase grew by 20s, the start phase by 1s only
+    assert report.regressions == ['pull', 'total']
+    assert 'Regression: pull went from 10.0s to 30.0s.' in report.format()
+    assert [deployment_id for deployment_id, *_ in task_startup.history('billing', 'cluster', store)] == \
+        ['ecs-svc/2', 'ecs-svc/1']
+
+
+def test_service_without_a_primary_deployment(aws):
+    aws['ecs'] = FakeEcs('ecs-svc/new', [])
+    aws['ecs'].deployments = []
+    assert task_startup.analyze('cluster', 'billing', store=DeploymentStore()) is None
@@ -0,0 +1,183 @@
+import threading
+import types
+import pytest
+import throttling
+from throttling import CallCache, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(throttling, 'time', clock)
+    return clock
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.acquire(clock.sleep) for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire(clock.sleep) == pytest.approx(0.5)
+    assert bucket.acquire(clock.sleep) == pytest.approx(0.5)
+    # Idle time refills the bucket, up to its burst
+    clock.now += 60
+    assert [bucket.acquire(clock.sleep) for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire(clock.sleep) > 0
+
+
+def test_cached_result_is_a_copy_and_expires(clock):
+    cache = CallCache(ttl=2)
+    key = ('ecs', 'DescribeServices', '{}')
+    assert cache.get_or_join(key) == (None, True)
+    cache.finish(key, {'services': ['api']})
+
+    result, leader = cache.get_or_join(key)
+    assert (result, leader) == ({'services': ['api']}, False)
+    result['services'].append('changed')
+    assert cache.get_or_join(key)[0] == {'services': ['api']}
+
+    clock.now += 3
+    assert cache.get_or_join(key) == (None, True)
+
+
+def test_waiting_callers_share_the_leader_result(clock):
+    cache = CallCache()
+    key = ('ecs', 'DescribeServices', '{}')
+    assert cache.get_or_join(key) == (None, True)
+    joined = []
+    followers = [threading.Thread(target=lambda: joined.append(cache.get_or_join(key))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+
+    cache.finish(key, {'services': ['api']})
+    for follower in followers:
+        follower.join()
+    assert joined == [({'services': ['api']}, False)] * 3
+
+
+class WatchedEvent(threading.Event):
+    """An event telling when a thread waits on it."""
+
+    def __init__(self):
+        super().__init__()
+        self.waiting = threading.Event()
+
+    def wait(self, timeout=None):
+        self.waiting.set()
+        return super().wait(timeout)
+
+
+def test_failed_leader_lets_the_waiting_callers_call(clock):
+    cache = CallCache()
+    key = ('ecs', 'DescribeServices', '{}')
+    cache.get_or_join(key)
+    done = cache._flights[key].done = WatchedEvent()
+    joined = []
+    follower = threading.Thread(target=lambda: joined.append(cache.get_or_join(key)))
+    follower.start()
+    assert done.waiting.wait(5)
+
+    cache.finish(key)
+    follower.join()
+    # Neither a result nor the lead: the caller makes its own call
+    assert joined == [(None, False)]
+    assert cache.get_or_join(key) == (None, True)
+
+
+def test_rates_per_operation_then_service():
+    limiter = throttling.RateLimiter()
+    assert limiter.bucket('ecs', 'RegisterTaskDefinition').rate == 1
+    assert limiter.bucket('ecs', 'DescribeServices').burst == 50
+    assert limiter.bucket('cloudwatch', 'GetMetricData').rate == throttling.DEFAULT_RATE[0]
+    assert limiter.bucket('ecs', 'DescribeServices') is limiter.bucket('ecs', 'DescribeServices')
+
+
+def test_invalidate_drops_results_and_in_flight_calls_of_the_namespace(clock):
+    cache = CallCache()
+    ecs, elbv2 = ('ecs', 'DescribeServices', '{}'), ('elbv2', 'DescribeRules', '{}')
+    for key in (ecs, elbv2):
+        cache.get_or_join(key)
+        cache.finish(key, {'key': key[1]})
+    cache.invalidate('ecs')
+    assert cache.get_or_join(ecs) == (None, True)
+    assert cache.get_or_join(elbv2)[0] == {'key': 'DescribeRules'}
+
+    # A write during the call keeps its result out of the cache
+    cache.invalidate('ecs')
+    cache.finish(ecs, {'stale': True})
+    assert cache.get_or_join(ecs) == (None, True)
+
+
+def test_is_write():
+    assert throttling.is_write('UpdateService')
+    assert throttling.is_write('BatchDeleteImage')
+    assert not throttling.is_write('DescribeServices')
+    assert not throttling.is_write('BatchGetImage')
+    assert not throttling.is_write('FilterLogEvents')
+
+
+class FakeEvents:
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, event, handler, unique_id=None):
+        self.handlers[event] = handler
+
+    register_first = register
+
+
+class FakeLimiter:
+    def acquire(self, service, operation):
+        return 0
+
+
+def instrumented():
+    """A client with the throttling handlers, and a function making a call through them."""
+    events = FakeEvents()
+    client = types.SimpleNamespace(meta=types.SimpleNamespace(
+        service_model=types.SimpleNamespace(service_name='ecs'), events=events))
+    throttling.instrument_client(client, FakeLimiter(), CallCache())
+    calls = []
+
+    def call(operation, response=None, **params):
+        context = {}
+        events.handlers['before-parameter-build'](params=params, model=types.SimpleNamespace(name=operation),
+                                                  context=context)
+        cached = events.handlers['before-call'](context=context)
+        if cached is not None:
+            return cached[1]
+        calls.append(operation)
+        events.handlers['after-call'](http_response=types.SimpleNamespace(status_code=200), parsed=response,
+                                      context=context)
+        return response
+
+    return call, calls
+
+
+def test_reads_are_cached_until_a_write():
+    call, calls = instrumented()
+    assert call('DescribeServices', {'n': 1}, services=['api']) == {'n': 1}
+    assert call('DescribeServices', {'n': 2}, services=['api']) == {'n': 1}
+    call('FilterLogEvents', {})
+    assert call('DescribeServices', {'n': 3}, services=['api']) == {'n': 1}
+    call('UpdateService', {}, service='api')
+    assert call('DescribeServices', {'n': 4}, services=['api']) == {'n': 4}
+    assert calls == ['DescribeServices', 'FilterLogEvents', 'UpdateService', 'DescribeServices']
+
+
+def test_fresh_reads_bypass_the_cache():
+    call, calls = instrumented()
+    call('DescribeServices', {'n': 1})
+    with throttling.fresh():
+        assert call('DescribeServices', {'n': 2}) == {'n': 2}
+    assert call('DescribeServices', {'n': 3}) == {'n': 1}
+    assert calls == ['DescribeServices', 'DescribeServices']
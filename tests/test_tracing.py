@@ -0,0 +1,83 @@
+import json
+import types
+import pytest
+import tracing
+from tracing import Tracer
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    tracer = Tracer()
+    monkeypatch.setattr(tracing, '_active', tracer)
+    return tracer
+
+
+def test_spans_do_nothing_without_a_tracer(monkeypatch):
+    monkeypatch.setattr(tracing, '_active', None)
+    with tracing.span('deploy'):
+        pass
+
+
+def test_spans_record_phases_and_errors(tracer):
+    with tracing.span('plan'):
+        pass
+    with pytest.raises(RuntimeError):
+        with tracing.span('rule'):
+            raise RuntimeError('Rule was not created.')
+
+    assert [name for name, _ in tracer.phase_durations()] == ['plan', 'rule']
+    assert tracer.events[1]['args'] == {'error': 'Rule was not created.'}
+    # Phases are not counted as calls
+    assert tracer.summary() == []
+
+
+def test_summary_per_operation(tracer):
+    for duration in (0.1, 0.2, 0.3, 0.4):
+        tracer.record('ecs.DescribeServices', 'aws', 0, duration, retries=1)
+    tracer.record('ecs.UpdateService', 'aws', 0, 2.0, error='ServiceNotFoundException')
+    tracer.count_throttle('ecs.DescribeServices')
+
+    rows = {row['operation']: row for row in tracer.summary()}
+
+    assert list(rows) == ['ecs.UpdateService', 'ecs.DescribeServices']
+    describe = rows['ecs.DescribeServices']
+    assert (describe['count'], describe['p50'], describe['p95'], describe['max']) == (4, 0.2, 0.4, 0.4)
+    assert (describe['retries'], describe['throttles'], describe['errors']) == (4, 1, 0)
+    assert rows['ecs.UpdateService']['errors'] == 1
+    assert 'ecs.DescribeServices' in tracer.format_summary()
+
+
+def test_chrome_trace_export(tracer, tmp_path):
+    with tracing.span('deploy'):
+        tracer.record('elbv2.CreateRule', 'aws', tracer._origin, tracer._origin + 0.5)
+    path = tmp_path / 'trace.json'
+    tracer.export_chrome_trace(str(path))
+
+    trace = json.loads(path.read_text())
+    events = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+    assert [event['name'] for event in events] == ['elbv2.CreateRule', 'deploy']
+    assert events[0]['dur'] == pytest.approx(500000)
+    assert [event['args']['name'] for event in trace['traceEvents'] if event['ph'] == 'M'] == ['worker-0']
+
+
+def test_aws_calls_are_recorded_by_the_client_handlers(tracer):
+    handlers = {}
+    client = types.SimpleNamespace(meta=types.SimpleNamespace(
+        service_model=types.SimpleNamespace(service_name='ecs'),
+        events=types.SimpleNamespace(register=lambda event, handler, unique_id: handlers.__setitem__(event, handler))))
+    tracing.instrument_client(client)
+    model = types.SimpleNamespace(name='DescribeServices')
+
+    context = {}
+    handlers['before-call'](model=model, context=context)
+    handlers['needs-retry'](response=(types.SimpleNamespace(status_code=400), {'Error': {'Code': 'ThrottlingException'}}),
+                            operation=model)
+    handlers['after-call'](model=model, parsed={'ResponseMetadata': {'HTTPStatusCode': 200, 'RetryAttempts': 1}},
+                           context=context)
+    context = {}
+    handlers['before-call'](model=model, context=context)
+    handlers['after-call-error'](context=context, exception=ConnectionError())
+
+    row, = tracer.summary()
+    assert row['operation'] == 'ecs.DescribeServices'
+    assert (row['count'], row['retries'], row['throttles'], row['errors']) == (2, 1, 1, 1)
@@ -0,0 +1,145 @@
+import json
+import pytest
+import profiles
+import state_store
+import update_service
+import utils
+import waiters
+from state_store import DeploymentStore
+
+REGISTRY = '123456789012.dkr.ecr.eu-west-1.amazonaws.com/'
+
+
+class FakeEcs:
+    def __init__(self, task_definitions):
+        self.task_definitions = task_definitions
+        self.updates = []
+
+    def describe_task_definition(self, taskDefinition, include=None):
+        return {'taskDefinition': self.task_definitions[taskDefinition], 'tags': []}
+
+    def update_service(self, cluster, service, taskDefinition, deploymentConfiguration=None):
+        if service == 'denied':
+            raise RuntimeError('AccessDenied')
+        self.updates.append((service, taskDefinition, deploymentConfiguration))
+
+
+def task_definition(family, image, cpu='512', memory='2048'):
+    return {'family': family, 'cpu': cpu, 'memory': memory,
+            'containerDefinitions': [{'name': family, 'image': f'{REGISTRY}{image}'}]}
+
+
+def deployment(service_name, task_definition_arn):
+    return {'service_name': service_name, 'ecs_cluster': 'cluster', 'project_name': service_name,
+            'task_definition_arn': task_definition_arn, 'target_group_arn': f'{service_name}-tg'}
+
+
+@pytest.fixture
+def batch(aws, monkeypatch):
+    aws['ecs'] = FakeEcs({
+        'shared:1': task_definition('shared', 'app:v1'),
+        'orders:1': task_definition('orders', 'orders:v1'),
+        'tiny:1': task_definition('tiny', 'tiny:v1', cpu='256', memory='512'),
+    })
+    registered = []
+
+    def register_or_reuse(ecs_client, spec, index, tags=None):
+        registered.append(spec['containerDefinitions'][0]['image'])
+        if spec['family'] == 'orders':
+            raise RuntimeError('ClientException')
+        return f"{spec['family']}:2"
+
+    rollouts = {'billing': (waiters.COMPLETED, ''), 'search': (waiters.FAILED, 'circuit breaker triggered')}
+    monkeypatch.setattr(update_service, 'register_or_reuse', register_or_reuse)
+    monkeypatch.setattr(waiters, 'wait_for_services',
+                        lambda client, cluster, services, max_wait_time: {name: rollouts[name] for name in services})
+    monkeypatch.setattr(utils, 'report_task_startup', lambda service, cluster: None)
+    return aws['ecs'], registered
+
+
+def statuses(results):
+    return {result['service_name'] or result['target']: (result['status'], result['task_definition_arn'])
+            for result in results}
+
+
+def test_services_sharing_a_spec_share_one_registration(batch, tmp_path):
+    ecs, registered = batch
+    store = DeploymentStore()
+    billing = store.add(deployment('billing', 'shared:1'))
+    search_file = tmp_path / 'deployment_info_search_20240101-000000.json'
+    search_file.write_text(json.dumps(deployment('search', 'shared:1')))
+
+    results = update_service.batch_update(['billing', str(search_file)], 'v2')
+
+    assert registered == [f'{REGISTRY}app:v2']
+    assert statuses(results) == {'billing': (waiters.COMPLETED, 'shared:2'), 'search': (waiters.FAILED, 'shared:2')}
+    assert all(update[2] == update_service.CIRCUIT_BREAKER for update in ecs.updates)
+    assert store.get(billing)['task_definition_arn'] == 'shared:2'
+    # The circuit breaker rolled search back, so its record keeps the old revision
+    assert json.loads(search_file.read_text())['task_definition_arn'] == 'shared:1'
+
+
+def test_failures_are_reported_per_service(batch, monkeypatch):
+    ecs, registered = batch
+    store = DeploymentStore()
+    for name, arn in (('orders', 'orders:1'), ('tiny', 'tiny:1'), ('denied', 'shared:1')):
+        store.add(deployment(name, arn))
+    monkeypatch.setattr(state_store, '_discover', lambda target, store: None)
+
+    results = update_service.batch_update(['orders', 'tiny', 'denied', 'unknown'], 'v2', memory='4096')
+
+    status = statuses(results)
+    assert status['orders'] == (update_service.ERROR, None)
+    assert 'ClientException' in results[0]['reason']
+    # 256 CPU units cannot have 4096 MiB
+    assert status['tiny'] == (update_service.ERROR, None)
+    assert status['denied'] == (update_service.ERROR, None)
+    assert status['unknown'] == (waiters.MISSING, None)
+    assert ecs.updates == []
+
+
+def test_spec_carries_the_task_definition_over_with_a_profile():
+    current = dict(task_definition('billing', 'app:v1'), taskDefinitionArn='billing:1', revision=1, status='ACTIVE',
+                   volumes=[{'name': 'data'}])
+    current['containerDefinitions'].append({'name': 'sidecar', 'image': 'envoy', 'ulimits': []})
+
+    spec = update_service.task_definition_spec(current, f'{REGISTRY}app:v2', '1024', '2048', None,
+                                               profiles.TASK_PROFILES['high-concurrency-api'])
+
+    assert 'taskDefinitionArn' not in spec and 'revision' not in spec
+    assert spec['volumes'] == [{'name': 'data'}]
+    assert [c['image'] for c in spec['containerDefinitions']] == [f'{REGISTRY}app:v2', 'envoy']
+    assert all(c['ulimits'][0]['softLimit'] == 1048576 for c in spec['containerDefinitions'])
+    # The described task definition is left as it was
+    assert current['containerDefinitions'][0]['image'] == f'{REGISTRY}app:v1'
+
+
+def test_spec_runs_on_the_given_architecture():
+    current = task_definition('billing', 'app:v1')
+    spec = update_service.task_definition_spec(current, f'{REGISTRY}app:v2', '512', '2048', None, None, 'ARM64')
+    assert spec['runtimePlatform'] == {'operatingSystemFamily': 'LINUX', 'cpuArchitecture': 'ARM64'}
+    assert 'runtimePlatform' not in update_service.task_definition_spec(current, f'{REGISTRY}app:v2', '512', '2048', None)
+
+
+class RecordingClient:
+    """Records every call made on a client."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append(name)
+
+
+def test_blue_green_rollout_next_to_a_side_by_side_copy_changes_nothing(aws, monkeypatch):
+    calls = []
+    for service in ('ecs', 'elbv2', 'ecr'):
+        aws[service] = RecordingClient(calls)
+    monkeypatch.setattr(utils, 'update_target_group_health_check', lambda *args: calls.append('health_check'))
+    DeploymentStore().add(dict(deployment('billing', 'billing:1'), side_by_side={'service_name': 'billing-arm64'}))
+
+    with pytest.raises(SystemExit) as exit_info:
+        update_service.main('billing', 'v2', '512', '2048', blue_green=True, health_check_profile='fast')
+
+    assert exit_info.value.code == 1
+    assert calls == []
@@ -0,0 +1,140 @@
+import waiters
+from waiters import Backoff
+
+
+def test_backoff_grows_to_its_cap_and_resets():
+    backoff = Backoff(initial=2, maximum=10, factor=2)
+    assert [backoff.next() for _ in range(5)] == [2, 4, 8, 10, 10]
+    backoff.reset()
+    assert backoff.next() == 2
+
+
+def test_chunks():
+    assert list(waiters.chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def service(name, rollout_state):
+    return {'serviceName': name, 'status': 'ACTIVE',
+            'deployments': [{'status': 'PRIMARY', 'rolloutState': rollout_state}]}
+
+
+class FakeEcs:
+    """Each describe_services call returns the next state of every service."""
+
+    def __init__(self, states):
+        self.states = states
+        self.calls = []
+
+    def describe_services(self, cluster, services):
+        self.calls.append(list(services))
+        return {'services': [service(name, self.states[name].pop(0)) for name in services]}
+
+
+def test_wait_for_services_polls_with_backoff_until_done():
+    ecs = FakeEcs({'api': ['IN_PROGRESS', 'IN_PROGRESS', 'COMPLETED'],
+                   'worker': ['IN_PROGRESS', 'FAILED']})
+    sleeps = []
+
+    results = waiters.wait_for_services(ecs, 'cluster', ['api', 'worker'], initial_interval=1, max_interval=2,
+                                        sleep=sleeps.append)
+
+    assert results['api'][0] == waiters.COMPLETED
+    assert results['worker'][0] == waiters.FAILED
+    assert sleeps == [1, 1.5]
+    # Finished services are no longer described
+    assert ecs.calls == [['api', 'worker'], ['api', 'worker'], ['api']]
+
+
+def test_wait_for_services_batches_describe_calls():
+    names = [f'service-{i}' for i in range(25)]
+    ecs = FakeEcs({name: ['COMPLETED'] for name in names})
+    waiters.wait_for_services(ecs, 'cluster', names, sleep=lambda delay: None)
+    assert [len(call) for call in ecs.calls] == [10, 10, 5]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rollout_state_edge_cases():
+    assert waiters.service_rollout_state({'status': 'DRAINING'})[0] == waiters.FAILED
+    assert waiters.service_rollout_state({'status': 'ACTIVE', 'deployments': []}) == (None, '')
+    failing = {'status': 'ACTIVE', 'events': [{'message': 'CannotPullContainerError'}],
+               'deployments': [{'status': 'PRIMARY', 'rolloutState': 'IN_PROGRESS', 'failedTasks': 3}]}
+    state, reason = waiters.service_rollout_state(failing)
+    assert state == waiters.FAILED and 'CannotPullContainerError' in reason
+    # Without a rollout state, a single deployment at its desired count is done
+    external = {'status': 'ACTIVE', 'deployments': [{'status': 'PRIMARY', 'runningCount': 2, 'desiredCount': 2}]}
+    assert waiters.service_rollout_state(external)[0] == waiters.COMPLETED
+    external['deployments'].append({'status': 'ACTIVE', 'runningCount': 1, 'desiredCount': 0})
+    assert waiters.service_rollout_state(external)[0] is None
+
+
+def test_wait_for_services_reports_missing_and_timed_out_services(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(waiters, 'time', clock)
+
+    class Ecs:
+        def describe_services(self, cluster, services):
+            return {'services': [service(name, 'IN_PROGRESS') for name in services if name != 'gone'],
+                    'failures': [{'arn': 'arn:aws:ecs:service/cluster/gone', 'reason': 'MISSING'}]
+                    if 'gone' in services else []}
+
+    results = waiters.wait_for_services(Ecs(), 'cluster', ['api', 'gone'], max_wait_time=60, sleep=clock.sleep)
+
+    assert results['gone'] == (waiters.MISSING, 'MISSING')
+    assert results['api'][0] == waiters.TIMEOUT
+    assert 60 < clock.now < 60 + 30 + 1
+
+
+def test_wait_for_services_inactive(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(waiters, 'time', clock)
+    statuses = {'api': ['DRAINING', 'INACTIVE'], 'stuck': ['DRAINING'] * 100}
+
+    class Ecs:
+        def describe_services(self, cluster, services):
+            return {'services': [{'serviceName': name, 'status': statuses[name].pop(0)} for name in services]}
+
+    results = waiters.wait_for_services_inactive(Ecs(), 'cluster', ['api', 'stuck'], max_wait_time=30,
+                                                 sleep=clock.sleep)
+    assert results == {'api': True, 'stuck': False}
+
+
+
+def test_wait_for_targets_healthy_ignores_draining_targets(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(waiters, 'time', clock)
+    polls = [
+        [('new', 'initial'), ('old', 'draining')],
+        [('new', 'healthy'), ('old', 'draining')],
+    ]
+
+    class Elbv2:
+        def describe_target_health(self, TargetGroupArn):
+            return {'TargetHealthDescriptions': [{'Target': {'Id': target}, 'TargetHealth': {'State': state}}
+                                                 for target, state in polls.pop(0)]}
+
+    ready, times = waiters.wait_for_targets_healthy(Elbv2(), 'tg', sleep=clock.sleep)
+    assert ready
+    assert times == {'new': 1}
+
+
+def test_wait_for_targets_healthy_times_out_without_enough_targets(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(waiters, 'time', clock)
+
+    class Elbv2:
+        def describe_target_health(self, TargetGroupArn):
+            return {'TargetHealthDescriptions': [{'Target': {'Id': 'a'}, 'TargetHealth': {'State': 'healthy'}}]}
+
+    ready, times = waiters.wait_for_targets_healthy(Elbv2(), 'tg', min_targets=2, max_wait_time=5, sleep=clock.sleep)
+    assert not ready
+    assert times == {'a': 0}
@@ -0,0 +1,247 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# botocore retries: 'adaptive' backs off with jitter and slows the client down after throttling errors.
+# AWS_RETRY_MODE=standard keeps the jittered backoff without the client-side slowdown.
+RETRY_MODE = os.getenv('AWS_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = 8
+
+# Requests per second and burst allowed per operation, shared by every thread of the process.
+# Kept under the API request rate quotas so concurrent deploys do not throttle each other.
+DEFAULT_RATE = (20, 40)
+SERVICE_RATES = {
+    'elbv2': (10, 20),
+    'ecs': (20, 50),
+    'logs': (5, 10),
+    'application-autoscaling': (10, 20),
+    'resourcegroupstaggingapi': (5, 10),
+}
+OPERATION_RATES = {
+    ('ecs', 'RegisterTaskDefinition'): (1, 5),
+    ('ecs', 'UpdateService'): (5, 10),
+    ('elbv2', 'CreateRule'): (5, 10),
+}
+
+# Read-only results are reused for this many seconds. A call that changes something clears the results
+# of its service. Other calls, such as FilterLogEvents or BatchGetImage, are neither cached nor clear anything.
+CACHE_TTL = 2.0
+READ_PREFIXES = ('Describe', 'List', 'Get')
+WRITE_PREFIXES = ('Create', 'Delete', 'Update', 'Put', 'Register', 'Deregister', 'Modify', 'Set', 'Add', 'Remove',
+                  'Tag', 'Untag', 'Run', 'Start', 'Stop', 'Upload', 'Complete', 'Initiate', 'Attach', 'Detach',
+                  'Enable', 'Disable', 'Execute', 'Submit', 'Associate', 'Disassociate')
+WRITE_OPERATIONS = {'BatchDeleteImage', 'BatchDeleteAttributes'}
+# Callers waiting on an identical in-flight call make their own call after this many seconds
+FLIGHT_TIMEOUT = 30
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, sleep=time.sleep):
+        """Take a token, sleeping until one is available. Returns the time waited, in seconds."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            sleep(delay)
+            waited += delay
+
+
+class RateLimiter:
+    """One token bucket per (service, operation)."""
+
+    def __init__(self, service_rates=None, operation_rates=None, default_rate=DEFAULT_RATE):
+        self.service_rates = SERVICE_RATES if service_rates is None else service_rates
+        self.operation_rates = OPERATION_RATES if operation_rates is None else operation_rates
+        self.default_rate = default_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, service, operation):
+        key = (service, operation)
+        with self._lock:
+            if key not in self._buckets:
+                rate = self.operation_rates.get(key) or self.service_rates.get(service, self.default_rate)
+                self._buckets[key] = TokenBucket(*rate)
+            return self._buckets[key]
+
+    def acquire(self, service, operation):
+        waited = self.bucket(service, operation).acquire()
+        if waited > 1:
+            logger.info(f"{service}.{operation} waited {waited:.1f}s for its rate limit.")
+        return waited
+
+
+class _Flight:
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+
+
+class CallCache:
+    """Short-lived results of read-only calls, with single-flight coalescing.
+
+    When several threads make the same call at once, the first one (the leader)
+    calls AWS and the others wait for its result. A successful result is then
+    reused for `ttl` seconds. Keys are (namespace, operation, parameters), the
+    namespace being the scope of invalidation.
+    """
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._results = {}
+        self._flights = {}
+        self._generations = {}
+
+    def get_or_join(self, key):
+        """Return (result, leader). A result is a copy of a cached or coalesced response, or None.
+
+        When leader is True the caller must make the call and then call `finish`.
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry and entry[0] > time.monotonic():
+                return copy.deepcopy(entry[1]), False
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = _Flight(self._generations.get(key[0], 0))
+                return None, True
+
+        if flight.done.wait(FLIGHT_TIMEOUT) and flight.result is not None:
+            return copy.deepcopy(flight.result), False
+        return None, False
+
+    def finish(self, key, result=None):
+        """Release the callers waiting on the leader's call, caching its result unless it is None."""
+        # The leader's caller gets the original, which it may change
+        result = copy.deepcopy(result)
+        with self._lock:
+            flight = self._flights.pop(key, None)
+            if flight is None:
+                return
+            # A write to the service since the call started may have made the result stale
+            if result is not None and flight.generation == self._generations.get(key[0], 0):
+                self._results[key] = (time.monotonic() + self.ttl, result)
+                flight.result = result
+        flight.done.set()
+
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [key for key in self._results if key[0] == namespace]:
+                del self._results[key]
+
+
+_local = threading.local()
+
+
+@contextmanager
+def fresh():
+    """Make the read-only calls of this thread skip the cache and in-flight calls.
+
+    For polling loops, which must see the state of each attempt, not the one
+    read up to CACHE_TTL seconds earlier.
+    """
+    previous = getattr(_local, 'fresh', False)
+    _local.fresh = True
+    try:
+        yield
+    finally:
+        _local.fresh = previous
+
+
+def is_write(operation):
+    return operation.startswith(WRITE_PREFIXES) or operation in WRITE_OPERATIONS
+
+
+class _CachedResponse:
+    """Stands in for the HTTP response of a call answered from the cache."""
+    status_code = 200
+    headers = {}
+
+
+_limiter = RateLimiter()
+_cache = CallCache()
+
+
+def client_config():
+    """botocore Config of every client created by `clients.get_client`."""
+    from botocore.config import Config
+    return Config(retries={'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS})
+
+
+def instrument_client(client, limiter=None, cache=None):
+    """Register the botocore handlers rate limiting, coalescing and caching the calls of a client.
+
+    Every attempt, retries included, takes a token of its operation's bucket.
+    Identical read-only calls in flight at the same time are made once, and
+    their result is reused for a couple of seconds, except inside `fresh()`.
+    """
+    limiter = limiter or _limiter
+    cache = cache or _cache
+    service_name = client.meta.service_model.service_name
+    # Clients differ by region and credentials, so each one caches apart
+    namespace = (service_name, id(client))
+    events = client.meta.events
+
+    def before_parameter_build(params, model, context, **kwargs):
+        if is_write(model.name):
+            context['call_write'] = True
+        elif model.name.startswith(READ_PREFIXES) and not getattr(_local, 'fresh', False):
+            context['call_key'] = (namespace, model.name, json.dumps(params, sort_keys=True, default=str))
+
+    def before_call(context, **kwargs):
+        if context.get('call_write'):
+            cache.invalidate(namespace)
+        key = context.get('call_key')
+        if key is None:
+            return None
+        result, leader = cache.get_or_join(key)
+        if result is not None:
+            context['call_cached'] = True
+            return _CachedResponse(), result
+        context['call_leader'] = leader
+        return None
+
+    def after_call(http_response, parsed, context, **kwargs):
+        key = context.get('call_key')
+        if context.get('call_write'):
+            cache.invalidate(namespace)
+        elif key is not None and context.get('call_leader'):
+            cache.finish(key, parsed if http_response.status_code < 300 else None)
+
+    def after_call_error(context, **kwargs):
+        if context.get('call_leader'):
+            cache.finish(context['call_key'])
+
+    def before_send(event_name, **kwargs):
+        limiter.acquire(service_name, event_name.rsplit('.', 1)[-1])
+
+    events.register('before-parameter-build', before_parameter_build, unique_id='throttling-parameter-build')
+    events.register_first('before-call', before_call, unique_id='throttling-before-call')
+    events.register('after-call', after_call, unique_id='throttling-after-call')
+    events.register('after-call-error', after_call_error, unique_id='throttling-after-call-error')
+    events.register_first('before-send', before_send, unique_id='throttling-before-send')
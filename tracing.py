@@ -0,0 +1,200 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+import clients
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown',
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Tracer:
+    """Collects phase spans and per-call latencies of a run.
+
+    Events are kept in memory and exported as Chrome trace-event JSON, which
+    can be opened in chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.events = []
+        self.calls = {}
+        self.throttles = {}
+
+    def record(self, name, category, start, end, **args):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args
+        }
+        with self._lock:
+            self.events.append(event)
+            if category != 'phase':
+                stats = self.calls.setdefault(name, {'durations': [], 'retries': 0, 'errors': 0})
+                stats['durations'].append(end - start)
+                stats['retries'] += args.get('retries', 0)
+                stats['errors'] += 1 if args.get('error') else 0
+
+    def count_throttle(self, name):
+        with self._lock:
+            self.throttles[name] = self.throttles.get(name, 0) + 1
+
+    @contextmanager
+    def span(self, name, category='phase', **args):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            args['error'] = str(e)
+            raise
+        finally:
+            self.record(name, category, start, time.perf_counter(), **args)
+
+    def export_chrome_trace(self, path):
+        with self._lock:
+            events = list(self.events)
+        thread_ids = sorted({event['tid'] for event in events})
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                     'args': {'name': f'worker-{index}'}} for index, tid in enumerate(thread_ids)]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        logger.info(f"Trace with {len(events)} events written to {path}")
+
+    def summary(self):
+        """Per-operation call count, latency percentiles, retries, throttles and errors."""
+        with self._lock:
+            calls = {name: dict(stats, durations=list(stats['durations'])) for name, stats in self.calls.items()}
+            throttles = dict(self.throttles)
+        rows = []
+        for name, stats in calls.items():
+            durations = stats['durations']
+            rows.append({
+                'operation': name,
+                'count': len(durations),
+                'total': sum(durations),
+                'p50': percentile(durations, 0.5),
+                'p95': percentile(durations, 0.95),
+                'max': max(durations),
+                'retries': stats['retries'],
+                'throttles': throttles.get(name, 0),
+                'errors': stats['errors']
+            })
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def phase_durations(self):
+        with self._lock:
+            return [(event['name'], event['dur'] / 1e6) for event in self.events if event['cat'] == 'phase']
+
+    def format_summary(self):
+        lines = [f"{'OPERATION':<48} {'CALLS':>6} {'TOTAL':>9} {'P50':>9} {'P95':>9} {'MAX':>9} {'RETRY':>6} {'THROT':>6} {'ERR':>5}"]
+        for row in self.summary():
+            lines.append(f"{row['operation']:<48} {row['count']:>6} {row['total']:>8.2f}s {row['p50'] * 1000:>7.0f}ms "
+                         f"{row['p95'] * 1000:>7.0f}ms {row['max'] * 1000:>7.0f}ms {row['retries']:>6} "
+                         f"{row['throttles']:>6} {row['errors']:>5}")
+        phases = self.phase_durations()
+        if phases:
+            lines.append('')
+            lines.append(f"{'PHASE':<48} {'TIME':>9}")
+            for name, duration in phases:
+                lines.append(f"{name:<48} {duration:>8.2f}s")
+        return '\n'.join(lines)
+
+
+_active = None
+
+
+def start():
+    """Start recording spans and AWS calls of this process. Returns the tracer."""
+    global _active
+    _active = Tracer()
+    clients.add_client_hook(instrument_client)
+    return _active
+
+
+def stop():
+    global _active
+    tracer, _active = _active, None
+    return tracer
+
+
+def active():
+    return _active
+
+
+@contextmanager
+def span(name, category='phase', **args):
+    """Record a span on the active tracer. Does nothing when tracing is off."""
+    tracer = _active
+    if tracer is None:
+        yield
+        return
+    with tracer.span(name, category, **args):
+        yield
+
+
+def _operation_name(service_name, model):
+    return f'{service_name}.{model.name}'
+
+
+def instrument_client(client):
+    """Register botocore handlers recording each call's latency, retries and throttles."""
+    service_name = client.meta.service_model.service_name
+    events = client.meta.events
+
+    def before_call(model, context, **kwargs):
+        context['trace_start'] = time.perf_counter()
+        context['trace_model'] = model
+
+    def after_call(model, parsed, context, **kwargs):
+        tracer = _active
+        if tracer is None or 'trace_start' not in context:
+            return
+        metadata = parsed.get('ResponseMetadata', {})
+        error = parsed.get('Error', {}).get('Code')
+        tracer.record(_operation_name(service_name, model), 'aws', context['trace_start'], time.perf_counter(),
+                      status=metadata.get('HTTPStatusCode'), retries=metadata.get('RetryAttempts', 0),
+                      error=error)
+
+    def after_call_error(context, exception, **kwargs):
+        tracer = _active
+        model = context.get('trace_model')
+        if tracer is None or 'trace_start' not in context or model is None:
+            return
+        tracer.record(_operation_name(service_name, model), 'aws', context['trace_start'], time.perf_counter(),
+                      error=type(exception).__name__)
+
+    def needs_retry(response, operation, **kwargs):
+        tracer = _active
+        if tracer is None or response is None:
+            return
+        code = response[1].get('Error', {}).get('Code')
+        if code in THROTTLE_CODES or response[0].status_code == 429:
+            tracer.count_throttle(_operation_name(service_name, operation))
+
+    events.register('before-call', before_call, unique_id='tracing-before-call')
+    events.register('after-call', after_call, unique_id='tracing-after-call')
+    events.register('after-call-error', after_call_error, unique_id='tracing-after-call-error')
+    events.register('needs-retry', needs_retry, unique_id='tracing-needs-retry')
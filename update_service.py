@@ -1,119 +1,418 @@
+import argparse
+import copy
 import json
-import boto3
+import clients
 import sys
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import autoscaling
+import bluegreen
+import discovery
+import image_publish
+import profiles
+import sizing
+import utils
+import waiters
+from task_index import TaskDefinitionIndex
+from state_store import DeploymentStore, resolve_deployment
 
-VALID_VCPUS = ['256', '512', '1024', '2048', '4096']
-VALID_MEMORY = ['512', '1024', '2048', '4096', '8192']
+VALID_VCPUS = list(sizing.FARGATE_SIZES)
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_WAIT_TIME = 900
+# Stops a failing rollout and goes back to the previous task definition
+CIRCUIT_BREAKER = {'deploymentCircuitBreaker': {'enable': True, 'rollback': True}}
+ERROR = 'ERROR'
+# Fields of describe_task_definition that register_task_definition accepts back
+REGISTER_FIELDS = (
+    'family', 'taskRoleArn', 'executionRoleArn', 'networkMode', 'containerDefinitions', 'volumes',
+    'placementConstraints', 'requiresCompatibilities', 'cpu', 'memory', 'pidMode', 'ipcMode',
+    'proxyConfiguration', 'inferenceAccelerators', 'ephemeralStorage', 'runtimePlatform',
+)
 
-def find_existing_task_definition(ecs_client, family, cpu, memory, container_image):
-    task_definitions = ecs_client.list_task_definitions(familyPrefix=family)
-    for task_def_arn in reversed(task_definitions['taskDefinitionArns']):
-        desc = ecs_client.describe_task_definition(taskDefinition=task_def_arn)
-        container_defs = desc['taskDefinition']['containerDefinitions']
-        for container in container_defs:
-            if container['image'] == container_image:
-                if str(container.get('cpu', '0')) == '0' and \
-                   str(desc['taskDefinition'].get('cpu', '0')) == cpu and \
-                   str(desc['taskDefinition'].get('memory', '0')) == memory:
-                    return task_def_arn
-    return None
+def find_existing_task_definition(ecs_client, spec, index=None):
+    index = index or TaskDefinitionIndex(ecs_client)
+    index.sync(spec['family'])
+    return index.find(spec)
 
-def main(json_file):
-    ecs_client = boto3.client('ecs', region_name='ap-southeast-5')
+def parse_image_uri(image_uri):
+    """Split an image URI into its registry URL (with the trailing slash), image name and tag, or return None."""
+    match = re.match(r'(.*/)([^:]+)(:.*)?', image_uri)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3)[1:] if match.group(3) else 'latest'
 
-    with open(json_file, 'r') as file:
-        deployment_info = json.load(file)
+def task_definition_spec(task_definition, image_uri, cpu, memory, health_check, task_profile=None,
+                         cpu_architecture=None):
+    """Arguments of register_task_definition for a copy of a task definition with a new image, size and health check.
+
+    Everything else is carried over: all containers with their settings, volumes,
+    storage and so on. The image and health check replace those of the first
+    container. A task profile, when given, also replaces the containers' ulimits,
+    stop timeout and logging mode and the task's ephemeral storage, and a CPU
+    architecture (X86_64 or ARM64) replaces the task's.
+    """
+    spec = {key: copy.deepcopy(task_definition[key]) for key in REGISTER_FIELDS if task_definition.get(key) is not None}
+    container_def = spec['containerDefinitions'][0]
+    container_def['image'] = image_uri
+    if health_check:
+        container_def['healthCheck'] = health_check
+    else:
+        container_def.pop('healthCheck', None)
+    spec['cpu'] = cpu
+    spec['memory'] = memory
+    if cpu_architecture:
+        spec['runtimePlatform'] = dict(spec.get('runtimePlatform') or {'operatingSystemFamily': 'LINUX'},
+                                       cpuArchitecture=cpu_architecture)
+    if task_profile:
+        profiles.apply_task_profile(spec, task_profile)
+    return spec
+
+def task_definition_tags(described, deployment_info):
+    """Tags for a new revision: those of the revision it replaces, with the deployment's Project tag.
+
+    Args:
+        described (dict): The response of describe_task_definition with include=['TAGS'].
+    """
+    tags = {tag['key']: tag['value'] for tag in described.get('tags', [])}
+    tags.setdefault(discovery.PROJECT_TAG, deployment_info.get('project_name', deployment_info['service_name']))
+    return discovery.ecs_tags(tags)
+
+def register_or_reuse(ecs_client, spec, index, tags=None):
+    """Return the ARN of an existing task definition matching the spec, registering one if there is none.
+
+    Before registering, the images must have been published for the spec's CPU
+    architecture, or image_publish.ImageArchitectureError is raised. A new
+    revision is registered with `tags`, an existing one keeps its own.
+    """
+    existing_task_definition = find_existing_task_definition(ecs_client, spec, index)
+    if existing_task_definition:
+        print(f"Using existing task definition: {existing_task_definition}")
+        return existing_task_definition
+
+    image_publish.check_architecture(clients.get_client('ecr'), spec)
+    response = ecs_client.register_task_definition(**spec, **({'tags': tags} if tags else {}))
+    index.add(response['taskDefinition'])
+    index.save()
+    print(f"New task definition registered: {response['taskDefinition']['taskDefinitionArn']}")
+    return response['taskDefinition']['taskDefinitionArn']
+
+def record_update(store, deployment_id, json_file, deployment_info, fields):
+    """Record updated fields of a deployment in the store and its deployment.json file."""
+    if deployment_id is not None:
+        store.update_fields(deployment_id, **fields)
+        print(f"Updated new task definition ARN: {fields['task_definition_arn']} in deployment {deployment_id}")
+    if json_file:
+        deployment_info.update(fields)
+        with open(json_file, 'w') as file:
+            json.dump(deployment_info, file, indent=4)
+        print(f"Updated new task definition ARN: {fields['task_definition_arn']} to json")
+
+def main(target, new_image_tag=None, cpu=None, memory=None, blue_green=False, shift_steps=bluegreen.DEFAULT_SHIFT_STEPS,
+         step_interval=bluegreen.DEFAULT_STEP_INTERVAL, max_response_time=None, warmup_requests=0, warmup_path='/',
+         min_capacity=None, max_capacity=None, right_size=False, days=sizing.DEFAULT_DAYS, health_check_profile=None,
+         task_profile=None, cpu_architecture=None):
+    ecs_client = clients.get_client('ecs')
+
+    store = DeploymentStore()
+    deployment_info, deployment_id, json_file = resolve_deployment(target, store)
+    if deployment_info is None:
+        print(f"Error: No deployment file or active deployment found for '{target}'.")
+        sys.exit(1)
+    # Checked before anything is registered or changed
+    if blue_green and deployment_info.get('side_by_side'):
+        print(f"Error: '{deployment_info['side_by_side']['service_name']}' runs side by side. "
+              f"Stop it with side_by_side.py before a blue/green rollout.")
+        sys.exit(1)
 
     cluster_name = deployment_info['ecs_cluster']
     service_name = deployment_info['service_name']
     task_definition_arn = deployment_info['task_definition_arn']
 
     # Fetch the current task definition
-    current_task_def = ecs_client.describe_task_definition(taskDefinition=task_definition_arn)
+    current_task_def = ecs_client.describe_task_definition(taskDefinition=task_definition_arn, include=['TAGS'])
     current_container_def = current_task_def['taskDefinition']['containerDefinitions'][0]
 
     # Extract the current image URI
     current_image_uri = current_container_def['image']
 
-    # Use regex to split the image URI into its components
-    match = re.match(r'(.*/)([^:]+)(:.*)?', current_image_uri)
-    if match:
-        ecr_repo_url = match.group(1)  # This includes the account ID and region
-        image_name = match.group(2)
-        current_tag = match.group(3)[1:] if match.group(3) else 'latest'
-    else:
+    # Split the image URI into its components
+    parts = parse_image_uri(current_image_uri)
+    if parts is None:
         print(f"Error: Unable to parse the current image URI: {current_image_uri}")
         sys.exit(1)
+    ecr_repo_url, image_name, current_tag = parts  # The URL includes the account ID and region
 
     print(f"Current image: {image_name}")
     print(f"Current tag: {current_tag}")
 
-    new_image_tag = input(f"Enter the new image tag (current: {current_tag}): ")
+    if new_image_tag is None:
+        new_image_tag = input(f"Enter the new image tag (current: {current_tag}): ")
     new_image_uri = f"{ecr_repo_url}{image_name}:{new_image_tag}"
 
     print(f"New image URI will be: {new_image_uri}")
 
-    cpu = input("Enter the vCPU value (e.g., 256 for 0.25 vCPU): ")
+    # The profile's size applies unless one is given
+    profile = profiles.task_profile(task_profile) if task_profile else None
+    if profile and cpu is None and memory is None and not right_size:
+        cpu, memory = profile['cpu'], profile['memory']
+
+    if right_size:
+        recommendation = sizing.recommend_services(cluster_name, [service_name], days, cpu_architecture).get(service_name)
+        if recommendation and recommendation.cpu:
+            print(recommendation.format())
+            cpu, memory = recommendation.cpu, recommendation.memory
+        else:
+            print(f"Not enough utilization data to size '{service_name}', keeping its current size.")
+            cpu, memory = current_task_def['taskDefinition']['cpu'], current_task_def['taskDefinition']['memory']
+
+    if cpu is None:
+        cpu = input("Enter the vCPU value (e.g., 256 for 0.25 vCPU): ")
     while cpu not in VALID_VCPUS:
-        cpu = input("Invalid vCPU value. Enter one of the following: 256, 512, 1024, 2048, 4096: ")
+        cpu = input(f"Invalid vCPU value. Enter one of the following: {', '.join(VALID_VCPUS)}: ")
+
+    valid_memory = [str(value) for value in sizing.FARGATE_SIZES[cpu]]
+    if memory is None:
+        memory = input(f"Enter the memory value in MiB ({valid_memory[0]}-{valid_memory[-1]}): ")
+    while memory not in valid_memory:
+        memory = input(f"Invalid memory value for {cpu} vCPU units. Enter one of the following: {', '.join(valid_memory)}: ")
 
-    memory = input("Enter the memory value in MiB (e.g., 512 for 512 MiB): ")
-    while memory not in VALID_MEMORY:
-        memory = input("Invalid memory value. Enter one of the following: 512, 1024, 2048, 4096, 8192: ")
+    # Keep the container health check unless a profile is given
+    health_check = current_container_def.get('healthCheck')
+    if health_check_profile:
+        health_profile = profiles.health_check_profile(health_check_profile)
+        health_check = profiles.container_health_check(health_profile, (health_check or {}).get('command'))
 
-    family = current_task_def['taskDefinition']['family']
-    network_mode = current_task_def['taskDefinition']['networkMode']
-    requires_compatibilities = current_task_def['taskDefinition']['requiresCompatibilities']
-    task_role_arn = current_task_def['taskDefinition'].get('taskRoleArn', '')
-    execution_role_arn = current_task_def['taskDefinition'].get('executionRoleArn', '')
-    runtime_platform = current_task_def['taskDefinition'].get('runtimePlatform', {})
+    spec = task_definition_spec(current_task_def['taskDefinition'], new_image_uri, cpu, memory, health_check, profile,
+                                cpu_architecture)
+    try:
+        new_task_definition_arn = register_or_reuse(ecs_client, spec, TaskDefinitionIndex(ecs_client),
+                                                    task_definition_tags(current_task_def, deployment_info))
+    except image_publish.ImageArchitectureError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
 
-    existing_task_definition = find_existing_task_definition(ecs_client, family, cpu, memory, new_image_uri)
+    if health_check_profile:
+        utils.update_target_group_health_check(deployment_info['target_group_arn'], health_profile)
 
-    if existing_task_definition:
-        new_task_definition_arn = existing_task_definition
-        print(f"Using existing task definition: {new_task_definition_arn}")
+    fields = {'task_definition_arn': new_task_definition_arn}
+    stable = True
+    if blue_green:
+        project_name = deployment_info.get('project_name', service_name)
+        rolled_out = bluegreen.rollout(deployment_info, new_task_definition_arn, project_name, shift_steps,
+                                       step_interval, max_response_time, warmup_requests, warmup_path)
+        if rolled_out is None:
+            print(f"Blue/green rollout failed. '{service_name}' still serves all traffic.")
+            sys.exit(1)
+        fields.update(service_name=rolled_out[0], target_group_arn=rolled_out[1], project_name=project_name)
+        print(f"ECS Service '{rolled_out[0]}' now serves all traffic")
     else:
-        response = ecs_client.register_task_definition(
-            family=family,
-            networkMode=network_mode,
-            containerDefinitions=[{
-                'name': current_container_def['name'],
-                'image': new_image_uri,
-                'cpu': 0,  # CPU at container level set to 0
-                'portMappings': current_container_def.get('portMappings', []),
-                'essential': current_container_def['essential'],
-                'logConfiguration': current_container_def.get('logConfiguration', {}),
-                'healthCheck': current_container_def.get('healthCheck', {})
-            }],
-            taskRoleArn=task_role_arn,
-            executionRoleArn=execution_role_arn,
-            requiresCompatibilities=requires_compatibilities,
-            cpu=cpu,
-            memory=memory,
-            runtimePlatform=runtime_platform,
+        ecs_client.update_service(
+            cluster=cluster_name,
+            service=service_name,
+            taskDefinition=new_task_definition_arn
         )
-        new_task_definition_arn = response['taskDefinition']['taskDefinitionArn']
-        print(f"New task definition registered: {new_task_definition_arn}")
-
-    ecs_client.update_service(
-        cluster=cluster_name,
-        service=service_name,
-        taskDefinition=new_task_definition_arn
-    )
-    print(f"ECS Service updated successfully")
-
-    # Update the deployment.json file with the new task definition ARN
-    deployment_info['task_definition_arn'] = new_task_definition_arn
-    with open(json_file, 'w') as file:
-        json.dump(deployment_info, file, indent=4)
-    print(f"Updated new task definition ARN: {new_task_definition_arn} to json")
+        print(f"ECS Service updated successfully")
+        stable = utils.wait_for_service_stable(service_name, cluster_name)
+        if not stable:
+            print(f"Error: ECS Service '{service_name}' did not become stable.")
 
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python update_service.py <path_to_deployment_json>")
+    scaled_service = fields.get('service_name', service_name)
+    try:
+        autoscaling.configure_service_scaling(cluster_name, scaled_service,
+                                              fields.get('target_group_arn', deployment_info['target_group_arn']),
+                                              min_capacity, max_capacity)
+    except Exception as e:
+        print(f"Error configuring auto scaling of '{scaled_service}': {e}")
+
+    # Record the new task definition ARN in the store and the deployment.json file
+    record_update(store, deployment_id, json_file, deployment_info, fields)
+    if not stable:
         sys.exit(1)
+    # The blue/green rollout waited for the new service to be healthy
+    utils.report_task_startup(scaled_service, cluster_name)
+
+def batch_update(targets, new_image_tag, cpu=None, memory=None, concurrency=DEFAULT_CONCURRENCY,
+                 max_wait_time=DEFAULT_MAX_WAIT_TIME, task_profile=None, cpu_architecture=None):
+    """Roll a new image tag out to many deployed services without prompting.
+
+    Task definitions are registered once per unique spec, so services sharing a
+    family and size share one revision. The services are then updated
+    concurrently with the ECS deployment circuit breaker enabled, which rolls
+    a failing service back on its own, and waited on with batched
+    describe_services calls.
+
+    Args:
+        targets (list): Deployment JSON file paths, service names or project names.
+        new_image_tag (str): The tag to deploy, on each service's current image.
+        cpu (str): Task vCPU units. Defaults to the task profile's, or each service's current value.
+        memory (str): Task memory in MiB. Defaults to the task profile's, or each service's current value.
+        concurrency (int): Maximum number of registrations and service updates at the same time.
+        max_wait_time (int): Maximum time to wait for all the rollouts, in seconds.
+        task_profile (str): Name of a task profile to apply to every service.
+        cpu_architecture (str): X86_64 or ARM64 for every service. Defaults to each service's current one.
+
+    Returns:
+        list: One result dict per target, in order, with 'status' COMPLETED, FAILED, MISSING, TIMEOUT or ERROR.
+    """
+    ecs_client = clients.get_client('ecs')
+    store = DeploymentStore()
+    profile = profiles.task_profile(task_profile) if task_profile else None
+    if profile and cpu is None:
+        cpu, memory = profile['cpu'], profile['memory']
+    results = [{'target': target, 'service_name': None, 'status': None, 'reason': '', 'task_definition_arn': None}
+               for target in targets]
+
+    # Read each deployment and the spec of its new task definition
+    deployments = {}
+    task_definitions = {}
+    specs = {}
+    spec_tags = {}
+    for i, target in enumerate(targets):
+        deployment_info, deployment_id, json_file = resolve_deployment(target, store)
+        if deployment_info is None:
+            results[i].update(status=waiters.MISSING, reason='no deployment file or active deployment')
+            continue
+        results[i]['service_name'] = deployment_info['service_name']
+        arn = deployment_info['task_definition_arn']
+        try:
+            if arn not in task_definitions:
+                task_definitions[arn] = ecs_client.describe_task_definition(taskDefinition=arn, include=['TAGS'])
+        except Exception as e:
+            results[i].update(status=ERROR, reason=str(e))
+            continue
+        task_definition = task_definitions[arn]['taskDefinition']
+        container_def = task_definition['containerDefinitions'][0]
+        parts = parse_image_uri(container_def['image'])
+        if parts is None:
+            results[i].update(status=ERROR, reason=f"unable to parse the image URI {container_def['image']}")
+            continue
+        spec = task_definition_spec(task_definition, f'{parts[0]}{parts[1]}:{new_image_tag}',
+                                    cpu or task_definition['cpu'], memory or task_definition['memory'],
+                                    container_def.get('healthCheck'), profile, cpu_architecture)
+        if not sizing.is_valid(spec['cpu'], spec['memory']):
+            results[i].update(status=ERROR, reason=f"invalid size {spec['cpu']}/{spec['memory']}")
+            continue
+        key = json.dumps(spec, sort_keys=True)
+        specs[key] = spec
+        spec_tags.setdefault(key, task_definition_tags(task_definitions[arn], deployment_info))
+        deployments[i] = (deployment_info, deployment_id, json_file, key)
+
+    # Register each unique spec once. Specs of one family share a worker, so each family is synced once.
+    families = {}
+    for key, spec in specs.items():
+        families.setdefault(spec['family'], []).append(key)
+    index = TaskDefinitionIndex(ecs_client)
+    arns = {}
+
+    def register_family(keys):
+        for key in keys:
+            try:
+                arns[key] = register_or_reuse(ecs_client, specs[key], index, spec_tags[key])
+            except Exception as e:
+                arns[key] = e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(register_family, families.values()))
+    print(f"{len(specs)} unique task definition(s) for {len(deployments)} service(s).")
+
+    def update(i):
+        deployment_info, _, _, key = deployments[i]
+        if isinstance(arns[key], Exception):
+            return ERROR, f"registering the task definition failed: {arns[key]}"
+        try:
+            ecs_client.update_service(cluster=deployment_info['ecs_cluster'], service=deployment_info['service_name'],
+                                      taskDefinition=arns[key], deploymentConfiguration=CIRCUIT_BREAKER)
+        except Exception as e:
+            return ERROR, str(e)
+        return None, ''
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        updates = dict(zip(deployments, executor.map(update, deployments)))
+
+    started = {}
+    for i, (status, reason) in updates.items():
+        if status:
+            results[i].update(status=status, reason=reason)
+            continue
+        deployment_info, _, _, key = deployments[i]
+        results[i]['task_definition_arn'] = arns[key]
+        started.setdefault(deployment_info['ecs_cluster'], []).append(i)
+
+    # Wait on every started rollout, one batched waiter per cluster
+    start_time = time.time()
+    for cluster, indexes in started.items():
+        remaining = max(0, max_wait_time - (time.time() - start_time))
+        states = waiters.wait_for_services(ecs_client, cluster, [results[i]['service_name'] for i in indexes],
+                                           max_wait_time=remaining)
+        for i in indexes:
+            status, reason = states.get(results[i]['service_name'], (waiters.TIMEOUT, ''))
+            results[i].update(status=status, reason=reason)
+            if status == waiters.COMPLETED:
+                deployment_info, deployment_id, json_file, _ = deployments[i]
+                record_update(store, deployment_id, json_file, deployment_info,
+                              {'task_definition_arn': results[i]['task_definition_arn']})
+                utils.report_task_startup(results[i]['service_name'], cluster)
+    return results
+
+def print_report(results):
+    print(f"{'SERVICE':<40} {'STATUS':<10} DETAILS")
+    for result in results:
+        details = result['reason'] or result['task_definition_arn'] or ''
+        print(f"{result['service_name'] or result['target']:<40} {result['status']:<10} {details}")
+    completed = sum(1 for result in results if result['status'] == waiters.COMPLETED)
+    print(f"{completed} completed, {len(results) - completed} not updated.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Deploy a new image, vCPU and memory to a deployed service.")
+    parser.add_argument('targets', nargs='+',
+                        help="Paths to deployment JSON files, or service names. Several targets update them in batch.")
+    parser.add_argument('--image-tag', help="New image tag. Asked for when omitted.")
+    parser.add_argument('--cpu', help="Task vCPU units. Asked for when omitted.")
+    parser.add_argument('--memory', help="Task memory in MiB. Asked for when omitted.")
+    parser.add_argument('--blue-green', action='store_true',
+                        help="Start the new revision next to the old one and shift traffic to it gradually.")
+    parser.add_argument('--shift-steps', default=','.join(map(str, bluegreen.DEFAULT_SHIFT_STEPS)),
+                        help="Percentages of traffic sent to the new revision, in order.")
+    parser.add_argument('--step-interval', type=int, default=bluegreen.DEFAULT_STEP_INTERVAL,
+                        help="Seconds between traffic shifts.")
+    parser.add_argument('--max-response-time', type=float,
+                        help="Highest p99 TargetResponseTime of the new revision, in seconds.")
+    parser.add_argument('--warmup-requests', type=int, default=0,
+                        help="Requests sent to the new revision before it takes traffic.")
+    parser.add_argument('--warmup-path', default='/')
+    parser.add_argument('--right-size', action='store_true',
+                        help="Use the cheapest Fargate size that fits the service's CloudWatch utilization.")
+    parser.add_argument('--days', type=int, default=sizing.DEFAULT_DAYS, help="Days of utilization history for --right-size.")
+    parser.add_argument('--min-capacity', type=int, help="Fewest tasks auto scaling keeps running.")
+    parser.add_argument('--max-capacity', type=int, help="Most tasks auto scaling starts.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of services updated at once in batch mode.")
+    parser.add_argument('--max-wait-time', type=int, default=DEFAULT_MAX_WAIT_TIME,
+                        help="Seconds to wait for the batch rollouts to complete.")
+    parser.add_argument('--task-profile', choices=list(profiles.TASK_PROFILES),
+                        help="Apply this task profile: size, ulimits, stop timeout, logging mode and storage.")
+    parser.add_argument('--health-check-profile', choices=list(profiles.HEALTH_CHECK_PROFILES),
+                        help="Apply this health check profile to the container and the target group.")
+    parser.add_argument('--cpu-architecture', choices=list(image_publish.ARCHITECTURES),
+                        help="Run the tasks on this CPU architecture. The image must have been published for it.")
+    args = parser.parse_args()
+
+    if len(args.targets) > 1:
+        if not args.image_tag:
+            parser.error("--image-tag is required when updating several services.")
+        if args.blue_green or args.right_size or args.health_check_profile:
+            parser.error("--blue-green, --right-size and --health-check-profile update one service at a time.")
+        if (args.cpu is None) != (args.memory is None) or (args.cpu and not sizing.is_valid(args.cpu, args.memory)):
+            parser.error("--cpu and --memory must be given together as a valid Fargate size.")
+        results = batch_update(args.targets, args.image_tag, args.cpu, args.memory, args.concurrency,
+                               args.max_wait_time, args.task_profile, args.cpu_architecture)
+        print_report(results)
+        if not all(result['status'] == waiters.COMPLETED for result in results):
+            sys.exit(1)
+        sys.exit(0)
 
-    json_file = sys.argv[1]
-    main(json_file)
+    main(args.targets[0], args.image_tag, args.cpu, args.memory, args.blue_green,
+         [int(step) for step in args.shift_steps.split(',')], args.step_interval, args.max_response_time,
+         args.warmup_requests, args.warmup_path, args.min_capacity, args.max_capacity,
+         args.right_size, args.days, args.health_check_profile, args.task_profile, args.cpu_architecture)
@@ -1,24 +1,25 @@
-import boto3
 import os
 import json
 import logging
 import time
-import requests
-from config import aws_region, access, secret, vpc_id, project_name, log_group, ecs_cluster, container_name, task_family_name, repo_uri, image_tag, task_role_arn, execution_role_arn, subnets, security_groups, domain_name, cloudflare_api_token, cloudflare_zone_id, alb_dns_name
+import autoscaling
+import cloudflare
+import discovery
+import image_publish
+import waiters
+import priorities
+import profiles
+import state_store
+import task_index
+import task_startup
+import clients
+import config
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-session = boto3.Session(
-    aws_access_key_id=access,
-    aws_secret_access_key=secret,
-    region_name=aws_region
-)
-ecs_client = session.client('ecs')
-elbv2_client = session.client('elbv2')
-logs_client = session.client('logs')
-
 def create_log_group(log_group):
+    logs_client = clients.get_client('logs')
     try:
         log_groups = logs_client.describe_log_groups(logGroupNamePrefix=log_group)
         if not any(group['logGroupName'] == log_group for group in log_groups['logGroups']):
@@ -31,25 +32,29 @@ def create_log_group(log_group):
             logger.info(f"Retention policy set to 7 days for log group '{log_group}'.")
         else:
             logger.info(f"Log group '{log_group}' already exists.")
+        return log_group
     except Exception as e:
         logger.error(f"Error checking/creating log group: {e}")
+        return None
 
-def create_target_group():
+def create_target_group(project=None, profile=None, tags=None):
+    elbv2_client = clients.get_client('elbv2')
+    project_name = (project or config.default_project)['project_name']
+    profile = profile or profiles.health_check_profile()
+    tags = tags or discovery.resource_tags(project_name)
     try:
         response = elbv2_client.create_target_group(
             Name=project_name,
             Protocol='HTTPS',
             Port=443,
-            VpcId=vpc_id,
+            VpcId=config.vpc_id,
             TargetType='ip',
             HealthCheckProtocol='HTTPS',
             HealthCheckPort='traffic-port',
             HealthCheckPath='/hc',
-            HealthCheckIntervalSeconds=30,
-            HealthCheckTimeoutSeconds=5,
-            HealthyThresholdCount=3,
-            UnhealthyThresholdCount=3,
-            Matcher={'HttpCode': '200-499'}
+            Matcher={'HttpCode': '200-499'},
+            Tags=discovery.elbv2_tags(tags),
+            **profiles.target_group_health_check(profile)
         )
         target_group_arn = response['TargetGroups'][0]['TargetGroupArn']
         elbv2_client.modify_target_group_attributes(
@@ -57,7 +62,7 @@ def create_target_group():
             Attributes=[
                 {'Key': 'stickiness.enabled', 'Value': 'true'},
                 {'Key': 'stickiness.lb_cookie.duration_seconds', 'Value': '3600'}
-            ]
+            ] + profiles.target_group_attributes(profile)
         )
         logger.info(f"Target group '{project_name}' created successfully.")
         return target_group_arn
@@ -65,72 +70,97 @@ def create_target_group():
         logger.error(f"Error creating target group: {e}")
         return None
 
-def get_next_priority(listener_arn):
+def update_target_group_health_check(target_group_arn, profile=None):
+    elbv2_client = clients.get_client('elbv2')
+    profile = profile or profiles.health_check_profile()
     try:
-        response = elbv2_client.describe_rules(ListenerArn=listener_arn)
-        priorities = [int(rule['Priority']) for rule in response['Rules'] if rule['Priority'].isdigit()]
-        next_priority = max(priorities, default=99) + 1
-        logger.info(f"Next priority determined: {next_priority}")
-        return next_priority
+        elbv2_client.modify_target_group(TargetGroupArn=target_group_arn, **profiles.target_group_health_check(profile))
+        elbv2_client.modify_target_group_attributes(TargetGroupArn=target_group_arn,
+                                                    Attributes=profiles.target_group_attributes(profile))
+        logger.info(f"Health check of target group '{target_group_arn}' updated.")
+        return target_group_arn
     except Exception as e:
-        logger.error(f"Error getting next priority: {e}")
-        return 100
+        logger.error(f"Error updating target group health check: {e}")
+        return None
 
-def create_rule(listener_arn, target_group_arn, domain_name, rules_list):
+def get_https_listener_arn(alb_arn):
+    elbv2_client = clients.get_client('elbv2')
+    listener_response = elbv2_client.describe_listeners(LoadBalancerArn=alb_arn)
+    return next(listener['ListenerArn'] for listener in listener_response['Listeners'] if listener['Port'] == 443)
+
+def create_rule(listener_arn, target_group_arn, domain_name, rules_list, tags=None):
+    elbv2_client = clients.get_client('elbv2')
     try:
-        priority = get_next_priority(listener_arn)
-        response = elbv2_client.create_rule(
-            ListenerArn=listener_arn,
-            Conditions=[{'Field': 'host-header', 'HostHeaderConfig': {'Values': [domain_name]}}],
-            Actions=[{'Type': 'forward', 'TargetGroupArn': target_group_arn}],
-            Priority=priority
-        )
-        rule_arn = response['Rules'][0]['RuleArn']
-        elbv2_client.add_tags(
-            ResourceArns=[rule_arn],
-            Tags=[{'Key': 'Name', 'Value': domain_name}]
+        allocator = priorities.get_allocator(elbv2_client, listener_arn)
+        rule = allocator.create_rule(
+            conditions=[{'Field': 'host-header', 'HostHeaderConfig': {'Values': [domain_name]}}],
+            actions=[{'Type': 'forward', 'TargetGroupArn': target_group_arn}],
+            Tags=discovery.elbv2_tags(dict({'Name': domain_name}, **(tags or {})))
         )
+        rule_arn = rule['RuleArn']
         logger.info(f"Rule created successfully with ARN: {rule_arn}")
         rules_list.append(rule_arn)
+        return rule_arn
     except Exception as e:
         logger.error(f"Error creating rule: {e}")
+        return None
 
-def register_task_definition():
+def update_rule_target(rule_arn, target_group_arn):
+    elbv2_client = clients.get_client('elbv2')
     try:
-        response = ecs_client.register_task_definition(
-            family=task_family_name,
-            networkMode='awsvpc',
-            containerDefinitions=[{
-                'name': container_name,
-                'image': f'{repo_uri}:{image_tag}',
-                'cpu': 0,
-                'portMappings': [{'containerPort': 443, 'hostPort': 443, 'protocol': 'tcp'}],
-                'essential': True,
-                'logConfiguration': {
-                    'logDriver': 'awslogs',
-                    'options': {
-                        'awslogs-group': log_group,
-                        'awslogs-region': aws_region,
-                        'awslogs-stream-prefix': 'ecs'
-                    }
-                },
-                'healthCheck': {
-                    'command': ['CMD-SHELL', 'curl -fk https://localhost/ || exit 1'],
-                    'interval': 30,
-                    'timeout': 5,
-                    'retries': 3,
-                    'startPeriod': 60
+        elbv2_client.modify_rule(RuleArn=rule_arn, Actions=[{'Type': 'forward', 'TargetGroupArn': target_group_arn}])
+        logger.info(f"Rule '{rule_arn}' now forwards to '{target_group_arn}'.")
+        return True
+    except Exception as e:
+        logger.error(f"Error updating rule: {e}")
+        return False
+
+def desired_task_definition(project=None, profile=None):
+    """The arguments of register_task_definition for a project, sized and tuned by its task profile."""
+    project = project or config.default_project
+    profile = profile or profiles.task_profile()
+    task_definition = {
+        'family': project['task_family_name'],
+        'networkMode': 'awsvpc',
+        'containerDefinitions': [{
+            'name': project['container_name'],
+            'image': f"{project['repo_uri']}:{project['image_tag']}",
+            'cpu': 0,
+            'portMappings': [{'containerPort': 443, 'hostPort': 443, 'protocol': 'tcp'}],
+            'essential': True,
+            'logConfiguration': {
+                'logDriver': 'awslogs',
+                'options': {
+                    'awslogs-group': config.log_group,
+                    'awslogs-region': config.aws_region,
+                    'awslogs-stream-prefix': 'ecs'
                 }
-            }],
-            taskRoleArn=task_role_arn,
-            executionRoleArn=execution_role_arn,
-            requiresCompatibilities=['FARGATE'],
-            cpu='512',
-            memory='2048',
-            runtimePlatform={'cpuArchitecture': 'X86_64', 'operatingSystemFamily': 'LINUX'},
+            },
+            'healthCheck': profiles.container_health_check(profiles.health_check_profile())
+        }],
+        'taskRoleArn': config.task_role_arn,
+        'executionRoleArn': config.execution_role_arn,
+        'requiresCompatibilities': ['FARGATE'],
+        'cpu': profile['cpu'],
+        'memory': profile['memory'],
+        'runtimePlatform': {'cpuArchitecture': project['cpu_architecture'], 'operatingSystemFamily': 'LINUX'},
+    }
+    return profiles.apply_task_profile(task_definition, profile)
+
+def desired_task_definition_hash(project=None):
+    return task_index.task_definition_hash(desired_task_definition(project))
+
+def register_task_definition(project=None):
+    ecs_client = clients.get_client('ecs')
+    project = project or config.default_project
+    try:
+        task_definition = desired_task_definition(project)
+        image_publish.check_architecture(clients.get_client('ecr'), task_definition)
+        response = ecs_client.register_task_definition(
+            **task_definition,
             tags=[
                 {'key': 'Role', 'value': 'application'},
-                {'key': 'Project', 'value': project_name},
+                {'key': 'Project', 'value': project['project_name']},
                 {'key': 'Environment', 'value': 'production'}
             ]
         )
@@ -142,116 +172,144 @@ def register_task_definition():
         return None
 
 def wait_for_service_stable(service_name, cluster_name, max_wait_time=600, interval=30):
-    """Wait for ECS service to be stable.
+    """Wait for the rollout of an ECS service to complete.
 
     Args:
         service_name (str): The name of the ECS service.
         cluster_name (str): The name of the ECS cluster.
         max_wait_time (int): Maximum time to wait for the service to become stable, in seconds.
-        interval (int): Time interval between checks, in seconds.
+        interval (int): Longest time interval between checks, in seconds. Checks start
+            a few seconds apart and back off up to this interval.
 
     Returns:
-        bool: True if the service became stable, False if the timeout was reached.
+        bool: True if the rollout completed, False if it failed or the timeout was reached.
     """
-    start_time = time.time()
-    while True:
-        response = ecs_client.describe_services(cluster=cluster_name, services=[service_name])
-        services = response['services']
-
-        if not services:
-            logger.error("No services found.")
-            return False
+    ecs_client = clients.get_client('ecs')
+    results = waiters.wait_for_services(ecs_client, cluster_name, [service_name],
+                                        max_wait_time=max_wait_time, max_interval=interval)
+    return results[service_name][0] == waiters.COMPLETED
 
-        service = services[0]
-        running_tasks = service['runningCount']
-        desired_tasks = service['desiredCount']
-        status = service['status']
+def wait_for_targets_ready(target_group_arn, min_targets=1, max_wait_time=600):
+    """Wait for the targets of a target group to be healthy, logging how long each one took.
 
-        if running_tasks == desired_tasks and status == 'ACTIVE':
-            logger.info(f"ECS service '{service_name}' completed.")
-            return True
-
-        if time.time() - start_time > max_wait_time:
-            logger.error(f"Timed out waiting for ECS service '{service_name}' to become stable.")
-            return False
+    Returns:
+        tuple: (ready, healthy_at) where healthy_at maps each healthy target ID (the task IP)
+        to the epoch time it was first seen healthy.
+    """
+    elbv2_client = clients.get_client('elbv2')
+    start_time = time.time()
+    ready, times = waiters.wait_for_targets_healthy(elbv2_client, target_group_arn, min_targets, max_wait_time)
+    return ready, {target_id: start_time + seconds for target_id, seconds in times.items() if seconds is not None}
 
-        logger.info(f"ECS service '{service_name}' is in progress. Waiting...")
-        time.sleep(interval)
+def report_task_startup(service_name, cluster_name, healthy_at=None):
+    """Log the startup phases of a service's new tasks and record them, see `task_startup.analyze`."""
+    try:
+        report = task_startup.analyze(cluster_name, service_name, healthy_at)
+        if report:
+            logger.info(report.format())
+    except Exception as e:
+        logger.error(f"Error analyzing the startup of ECS service '{service_name}': {e}")
 
-def create_ecs_service(task_definition_arn, target_group_arn):
+def create_ecs_service(task_definition_arn, target_group_arn, project=None, tags=None):
+    ecs_client = clients.get_client('ecs')
+    project = project or config.default_project
+    project_name = project['project_name']
+    tags = tags or discovery.resource_tags(project_name)
     try:
         ecs_client.create_service(
-            cluster=ecs_cluster,
+            cluster=config.ecs_cluster,
             serviceName=project_name,
             taskDefinition=task_definition_arn,
-            loadBalancers=[{'targetGroupArn': target_group_arn, 'containerName': container_name, 'containerPort': 443}],
-            desiredCount=1,
+            loadBalancers=[{'targetGroupArn': target_group_arn, 'containerName': project['container_name'], 'containerPort': 443}],
+            desiredCount=config.scaling_min_capacity,
             launchType='FARGATE',
             networkConfiguration={
                 'awsvpcConfiguration': {
-                    'subnets': subnets,
-                    'securityGroups': security_groups,
+                    'subnets': config.subnets,
+                    'securityGroups': config.security_groups,
                     'assignPublicIp': 'DISABLED'
                 }
             },
-            enableExecuteCommand=True
+            enableExecuteCommand=True,
+            tags=discovery.ecs_tags(tags),
+            propagateTags='SERVICE'
         )
         logger.info(f"ECS service '{project_name}' created successfully.")
+        try:
+            autoscaling.configure_service_scaling(config.ecs_cluster, project_name, target_group_arn)
+        except Exception as e:
+            logger.error(f"Error configuring auto scaling of ECS service '{project_name}': {e}")
+
+        _, healthy_at = wait_for_targets_ready(target_group_arn, config.scaling_min_capacity)
 
         # Wait for the service to be stable
-        if wait_for_service_stable(project_name, ecs_cluster):
+        if wait_for_service_stable(project_name, config.ecs_cluster):
             logger.info(f"ECS service '{project_name}' is completed and running.")
-        else:
-            logger.error(f"ECS service '{project_name}' did not become stable.")
+            report_task_startup(project_name, config.ecs_cluster, healthy_at)
+            return True
+        logger.error(f"ECS service '{project_name}' did not become stable.")
+        return False
     except Exception as e:
         logger.error(f"Error creating ECS service: {e}")
+        return False
 
         """logger.info(f"ECS service '{project_name}' created successfully.")
     except Exception as e:
         logger.error(f"Error creating ECS service: {e}")
         """
 
+def update_ecs_service(task_definition_arn, project=None, service_name=None):
+    ecs_client = clients.get_client('ecs')
+    project_name = service_name or (project or config.default_project)['project_name']
+    try:
+        ecs_client.update_service(cluster=config.ecs_cluster, service=project_name, taskDefinition=task_definition_arn)
+        logger.info(f"ECS service '{project_name}' updated to '{task_definition_arn}'.")
+        if wait_for_service_stable(project_name, config.ecs_cluster):
+            logger.info(f"ECS service '{project_name}' is completed and running.")
+            report_task_startup(project_name, config.ecs_cluster)
+            return True
+        logger.error(f"ECS service '{project_name}' did not become stable.")
+        return False
+    except Exception as e:
+        logger.error(f"Error updating ECS service: {e}")
+        return False
+
 def create_cname_record_cloudflare(api_token, zone_id, domain_name, target):
-    url = f"https://api.cloudflare.com/client/v4/zones/{zone_id}/dns_records"
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "type": "CNAME",
-        "name": domain_name,
-        "content": target,
-        "ttl": 300,
-        "proxied": False
-    }
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        logger.info(f"CNAME record created successfully for {domain_name} pointing to {target}.")
-    except requests.exceptions.RequestException as e:
+        _, action = cloudflare.get_client(api_token).upsert_cname(zone_id, domain_name, target)
+        logger.info(f"CNAME record for {domain_name} pointing to {target} {action}.")
+        return action
+    except cloudflare.CloudflareError as e:
         logger.error(f"Error creating CNAME record: {e}")
+        return None
 
-def save_deployment_info(task_definition_arn, target_group_arn, listener_arn, rules_list, timestamp):
+def save_deployment_info(task_definition_arn, target_group_arn, listener_arn, rules_list, timestamp, project=None):
+    project = project or config.default_project
+    project_name = project['project_name']
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        deployments_dir = os.path.join(script_dir, 'deployments')
+        deployments_dir = state_store.DEPLOYMENTS_DIR
         os.makedirs(deployments_dir, exist_ok=True)
         file_name = os.path.join(deployments_dir, f'deployment_info_{project_name}_{timestamp}.json')
 
+        deployment_info = {
+            'ecs_cluster': config.ecs_cluster,
+            'service_name': project_name,
+            'project_name': project_name,
+            'task_definition_arn': task_definition_arn,
+            'target_group_arn': target_group_arn,
+            'listener_arn': listener_arn,
+            'rules': rules_list,
+            'domain_name': project['domain_name'],
+            'cloudflare_api_token': config.cloudflare_api_token,
+            'cloudflare_zone_id': config.cloudflare_zone_id,
+            'alb_dns_name': config.alb_dns_name,
+            # The DeploymentId tag of its resources, see discovery.py
+            'deployment_tag': discovery.deployment_tag(project_name, timestamp)
+        }
         with open(file_name, 'w') as f:
-            json.dump({
-                'ecs_cluster': ecs_cluster,
-                'service_name': project_name,
-                'task_definition_arn': task_definition_arn,
-                'target_group_arn': target_group_arn,
-                'listener_arn': listener_arn,
-                'rules': rules_list,
-                'domain_name': domain_name,
-                'cloudflare_api_token': cloudflare_api_token,
-                'cloudflare_zone_id': cloudflare_zone_id,
-                'alb_dns_name': alb_dns_name
-            }, f, indent=4)
-        logger.info(f"Deployment information saved to {file_name}")
+            json.dump(deployment_info, f, indent=4)
+        deployment_id = state_store.DeploymentStore().add(deployment_info, created_at=state_store.parse_timestamp(timestamp), source_file=file_name)
+        logger.info(f"Deployment information saved to {file_name} (deployment ID {deployment_id})")
+        return deployment_id
     except Exception as e:
         logger.error(f"Error saving deployment info: {e}")
-
@@ -0,0 +1,227 @@
+import logging
+import time
+import throttling
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# describe_services accepts at most 10 services per call
+SERVICE_BATCH_SIZE = 10
+
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+MISSING = 'MISSING'
+TIMEOUT = 'TIMEOUT'
+
+
+class Backoff:
+    """Poll interval that starts short and grows geometrically up to a cap."""
+
+    def __init__(self, initial=2, maximum=30, factor=1.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.current = initial
+
+    def next(self):
+        delay = self.current
+        self.current = min(self.current * self.factor, self.maximum)
+        return delay
+
+    def reset(self):
+        self.current = self.initial
+
+
+def chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _primary_deployment(service):
+    return next((d for d in service.get('deployments', []) if d.get('status') == 'PRIMARY'), None)
+
+
+def _latest_event(service):
+    events = service.get('events', [])
+    return events[0]['message'] if events else ''
+
+
+def service_rollout_state(service, max_failed_tasks=3):
+    """Classify a service returned by describe_services.
+
+    Returns:
+        tuple: (state, reason) where state is COMPLETED, FAILED or None while in progress.
+    """
+    if service.get('status') != 'ACTIVE':
+        return FAILED, f"service status is {service.get('status')}"
+
+    deployment = _primary_deployment(service)
+    if deployment is None:
+        return None, ''
+
+    rollout_state = deployment.get('rolloutState')
+    if rollout_state == COMPLETED:
+        return COMPLETED, ''
+    if rollout_state == FAILED:
+        return FAILED, deployment.get('rolloutStateReason', '')
+
+    if deployment.get('failedTasks', 0) >= max_failed_tasks:
+        return FAILED, f"{deployment['failedTasks']} tasks failed to start: {_latest_event(service)}"
+
+    # Services without rollout state (e.g. external deployment controllers)
+    if rollout_state is None and len(service.get('deployments', [])) == 1 and \
+       deployment.get('runningCount') == deployment.get('desiredCount'):
+        return COMPLETED, ''
+
+    return None, ''
+
+
+def wait_for_services(ecs_client, cluster, services, max_wait_time=600, initial_interval=2, max_interval=30,
+                      max_failed_tasks=3, sleep=time.sleep):
+    """Wait for the rollout of several ECS services in one cluster.
+
+    Each poll describes up to 10 services per call. Services are dropped from
+    the poll as soon as their primary deployment completes or fails.
+
+    Args:
+        ecs_client: The boto3 ECS client.
+        cluster (str): The name of the ECS cluster.
+        services (list): The names of the ECS services.
+        max_wait_time (int): Maximum time to wait for all services, in seconds.
+        initial_interval (float): First poll interval, in seconds.
+        max_interval (float): Longest poll interval, in seconds.
+        max_failed_tasks (int): Number of failed tasks after which a rollout is considered failed.
+
+    Returns:
+        dict: Service name to a (state, reason) tuple, state being COMPLETED, FAILED, MISSING or TIMEOUT.
+    """
+    results = {}
+    pending = list(dict.fromkeys(services))
+    backoff = Backoff(initial_interval, max_interval)
+    start_time = time.time()
+
+    while pending:
+        for batch in chunks(pending, SERVICE_BATCH_SIZE):
+            with throttling.fresh():
+                response = ecs_client.describe_services(cluster=cluster, services=batch)
+            for failure in response.get('failures', []):
+                name = failure['arn'].rsplit('/', 1)[-1]
+                results[name] = (MISSING, failure.get('reason', ''))
+            for service in response['services']:
+                state, reason = service_rollout_state(service, max_failed_tasks)
+                if state:
+                    results[service['serviceName']] = (state, reason)
+
+        for name in list(pending):
+            if name in results:
+                pending.remove(name)
+                state, reason = results[name]
+                if state == COMPLETED:
+                    logger.info(f"ECS service '{name}' completed.")
+                else:
+                    logger.error(f"ECS service '{name}' {state.lower()}: {reason}")
+
+        if not pending:
+            break
+        if time.time() - start_time > max_wait_time:
+            for name in pending:
+                results[name] = (TIMEOUT, f"not stable after {max_wait_time}s")
+                logger.error(f"Timed out waiting for ECS service '{name}' to become stable.")
+            break
+
+        logger.info(f"{len(pending)} ECS service(s) in progress. Waiting...")
+        sleep(backoff.next())
+
+    return results
+
+
+def wait_for_services_inactive(ecs_client, cluster, services, max_wait_time=600, initial_interval=2, max_interval=30,
+                               sleep=time.sleep):
+    """Wait for deleted ECS services to finish draining.
+
+    Returns:
+        dict: Service name to True if the service is INACTIVE or gone, False on timeout.
+    """
+    results = {}
+    pending = list(dict.fromkeys(services))
+    backoff = Backoff(initial_interval, max_interval)
+    start_time = time.time()
+
+    while pending:
+        for batch in chunks(pending, SERVICE_BATCH_SIZE):
+            with throttling.fresh():
+                response = ecs_client.describe_services(cluster=cluster, services=batch)
+            for failure in response.get('failures', []):
+                results[failure['arn'].rsplit('/', 1)[-1]] = True
+            for service in response['services']:
+                if service['status'] != 'DRAINING':
+                    results[service['serviceName']] = True
+
+        for name in list(pending):
+            if name in results:
+                pending.remove(name)
+                logger.info(f"ECS service '{name}' is no longer draining.")
+
+        if not pending:
+            break
+        if time.time() - start_time > max_wait_time:
+            for name in pending:
+                results[name] = False
+                logger.error(f"ECS service '{name}' has been draining for too long.")
+            break
+
+        logger.info(f"{len(pending)} ECS service(s) still draining. Waiting...")
+        sleep(backoff.next())
+
+    return results
+
+
+def wait_for_targets_healthy(elbv2_client, target_group_arn, min_targets=1, max_wait_time=300, initial_interval=1,
+                             max_interval=10, sleep=time.sleep):
+    """Readiness gate: wait until a target group's targets are healthy.
+
+    Draining targets are ignored. The poll interval starts at one second, so
+    the gate opens within a second or two of the load balancer marking the
+    last target healthy.
+
+    Args:
+        elbv2_client: The boto3 ELBv2 client.
+        target_group_arn (str): The target group to watch.
+        min_targets (int): Number of targets that must be registered.
+        max_wait_time (int): Maximum time to wait, in seconds. With 0, checks once.
+
+    Returns:
+        tuple: (ready, times) where times maps each target ID to the seconds it took
+        to become healthy after the wait started, or None if it did not.
+    """
+    backoff = Backoff(initial_interval, max_interval)
+    start_time = time.time()
+    times = {}
+    while True:
+        with throttling.fresh():
+            descriptions = elbv2_client.describe_target_health(TargetGroupArn=target_group_arn)['TargetHealthDescriptions']
+        elapsed = time.time() - start_time
+        states = {}
+        for description in descriptions:
+            target_id = description['Target']['Id']
+            state = description['TargetHealth']['State']
+            if state == 'draining':
+                continue
+            states[target_id] = state
+            if state == 'healthy' and times.get(target_id) is None:
+                times[target_id] = elapsed
+            times.setdefault(target_id, None)
+
+        ready = len(states) >= min_targets and all(state == 'healthy' for state in states.values())
+        if ready or elapsed >= max_wait_time:
+            break
+        logger.info(f"Waiting for targets of '{target_group_arn}' to become healthy: {states}")
+        sleep(backoff.next())
+
+    for target_id, seconds in times.items():
+        if seconds is None:
+            logger.error(f"Target {target_id} of '{target_group_arn}' is not healthy after {elapsed:.0f}s.")
+        else:
+            logger.info(f"Target {target_id} of '{target_group_arn}' became healthy after {seconds:.1f}s.")
+    return ready, times